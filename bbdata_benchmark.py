@@ -0,0 +1,369 @@
+"""
+Created on 17 Oct. 2026.
+
+Per-stage benchmark of the BackBlaze data parser and of graph.py on synthetic datasets.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import graph
+from bbdata_executor import DEFAULT_PREFETCH, DEFAULT_WORKERS
+from bbdata_generator import DEFAULT_GENERATOR_OPTIONS, SMART_IDS, generate_dataset
+from bbdata_lifecycle import get_lifecycle_index
+from bbdata_parser import (
+    add_history_arguments,
+    create_csv_files,
+    get_failed_serial_number_from_files,
+    get_files_to_open,
+    get_start_files,
+    parse_files,
+    remove_strange_behaviors,
+    set_result_filename,
+)
+from bbdata_profiling import get_max_rss_mb
+from bbdata_storage import (
+    PARQUET_DIR,
+    PROCESS_DIR,
+    add_storage_arguments,
+    compact_parquet_files,
+    convert_csvs_to_parquets,
+    get_first_file_date,
+    get_parquet_data_files,
+)
+from graph_cache import configurer_cache
+
+BENCHMARK_RESULTS = 'benchmarks/results.jsonl'
+DEFAULT_SCALES = '200x60,1000x120'
+# Enough failures for the extraction stages to have work at small scales
+BENCHMARK_FAILURE_RATE = 0.5
+BATHTUB_POINTS = 50
+# Settings that must be equal for the measures of two runs to be compared
+BENCHMARK_SETTINGS = [
+    'failure_rate',
+    'smart_drift',
+    'seed',
+    'history_length_recent',
+    'history_length_old',
+    'workers',
+    'prefetch',
+    'layout',
+    'compression',
+    'optimized',
+    'trace_memory',
+]
+
+
+def parse_scales(scales):
+    """Return the (drives, days) scales given as DRIVESxDAYS,DRIVESxDAYS,..."""
+    return [tuple(int(value) for value in scale.split('x')) for scale in scales.split(',')]
+
+
+def get_git_commit():
+    """Return the short hash of the current commit, or None outside a git repository."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_stage_memory(stage):
+    """Return the memory (MB) of a stage: its traced peak if measured, else the peak RSS."""
+    if stage['peak_memory_mb'] is None:
+        return stage['max_rss_mb']
+    return stage['peak_memory_mb']
+
+
+def measure_stage(run, stage, function, *args):
+    """Run a stage, record its duration and memory use in the run and return its result.
+
+    The peak resident memory of the process and of its finished children (the workers
+    of process pools) is always recorded. With trace_memory, the peak of the Python
+    allocations of the stage, numpy and pandas buffers included, is also measured with
+    tracemalloc, which slows the stage down: durations are only comparable between
+    runs with the same setting.
+    """
+    if run['trace_memory']:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        result = function(*args)
+    seconds = time.perf_counter() - start
+    peak_memory = None
+    if run['trace_memory']:
+        peak_memory = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        tracemalloc.stop()
+
+    run['stages'].append(
+        {
+            'stage': stage,
+            'seconds': round(seconds, 4),
+            'peak_memory_mb': peak_memory,
+            'max_rss_mb': get_max_rss_mb(resource.RUSAGE_SELF),
+            'children_max_rss_mb': get_max_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+    )
+    print(f'{stage:<20} {seconds:>10.3f} s {get_stage_memory(run["stages"][-1]):>10.2f} MB')
+    return result
+
+
+def run_parser_stages(run, options):
+    """Run the stages of bbdata_parser.process() on the dataset of the current directory.
+
+    Return the number of failed disks whose history is extracted.
+    """
+    workers, layout = options['workers'], options['layout']
+    recent, old = options['history_length_recent'], options['history_length_old']
+    os.makedirs(PROCESS_DIR, exist_ok=True)
+    os.makedirs(PARQUET_DIR, exist_ok=True)
+
+    measure_stage(
+        run,
+        'conversion',
+        convert_csvs_to_parquets,
+        options['compression'],
+        options['optimized'],
+        workers,
+    )
+    if layout == 'dataset':
+        measure_stage(run, 'compaction', compact_parquet_files, options['compression'], workers)
+
+    lifecycle_index = measure_stage(
+        run, 'lifecycle_index', get_lifecycle_index, layout, workers, options['prefetch']
+    )
+    sn_dict = measure_stage(
+        run,
+        'failed_sn_scan',
+        get_failed_serial_number_from_files,
+        lifecycle_index,
+        get_parquet_data_files(True),
+    )
+    sn_dict = measure_stage(run, 'start_files', get_start_files, sn_dict, lifecycle_index)
+    sn_dict = measure_stage(
+        run, 'strange_behaviors', remove_strange_behaviors, sn_dict, lifecycle_index
+    )
+
+    def plan_files():
+        set_result_filename(sn_dict, recent, old)
+        return get_files_to_open(sn_dict, recent, old)
+
+    plan = measure_stage(run, 'planning', plan_files)
+    results_df = measure_stage(
+        run, 'extraction', parse_files, plan, layout, workers, False, options['prefetch']
+    )
+    measure_stage(run, 'csv_export', create_csv_files, sn_dict, results_df, workers)
+    return len(sn_dict)
+
+
+def run_graph_stages(run):
+    """Run the SMART aggregation and bathtub stages of graph.py on the extracted results."""
+    configurer_cache(os.path.join(os.getcwd(), '.cache_graph'))
+    fichiers = graph.parcourir_repertoire(f'results/{get_first_file_date()}')
+    # Only the SMART data of the generated schema
+    donnees_smart = [
+        donnee
+        for donnee in graph.DONNEES_SMART
+        if donnee in [f'smart_{smart_id}_raw' for smart_id in SMART_IDS]
+    ]
+
+    measure_stage(run, 'smart_aggregation', graph.remplir_dico_moyenne, fichiers, donnees_smart)
+
+    def compute_bathtub():
+        graph.calcul_duree_vie(fichiers, graph.ANNEES_DONNEES_SMART, 'mois')
+        return graph.calcul_vie_donnee_smart_valeur(
+            fichiers, graph.ANNEES_DONNEES_SMART, 'smart_9_raw', BATHTUB_POINTS
+        )
+
+    measure_stage(run, 'bathtub', compute_bathtub)
+
+
+def run_scale(drives, days, options):
+    """Generate a dataset in a temporary directory, benchmark every stage on it and return the run."""
+    print(f'\n---Benchmark of {drives} disks over {days} days...---')
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': get_git_commit(),
+        'python': platform.python_version(),
+        'drives': drives,
+        'days': days,
+        **{setting: options[setting] for setting in BENCHMARK_SETTINGS},
+        'stages': [],
+    }
+
+    current_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='bbdata_benchmark_') as directory:
+        os.chdir(directory)
+        try:
+            run['rows'] = measure_stage(
+                run,
+                'generation',
+                lambda: generate_dataset(
+                    drives,
+                    days,
+                    'csv',
+                    options['workers'],
+                    failure_rate=options['failure_rate'],
+                    smart_drift=options['smart_drift'],
+                    seed=options['seed'],
+                ),
+            )
+            run['failures'] = run_parser_stages(run, options)
+            run_graph_stages(run)
+        finally:
+            os.chdir(current_directory)
+    return run
+
+
+def load_benchmark_results(results_path):
+    """Return the benchmark runs stored in the results file."""
+    if not os.path.isfile(results_path):
+        return []
+    with open(results_path, 'r', encoding='utf-8') as results_file:
+        return [json.loads(line) for line in results_file if line.strip()]
+
+
+def save_benchmark_result(results_path, run):
+    """Append a benchmark run to the results file (one json object per line)."""
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    with open(results_path, 'a', encoding='utf-8') as results_file:
+        results_file.write(json.dumps(run) + '\n')
+
+
+def get_previous_run(runs, run):
+    """Return the last stored run with the same scale and settings as run, if any."""
+    for previous_run in reversed(runs):
+        if all(
+            previous_run.get(setting) == run[setting]
+            for setting in ['drives', 'days', *BENCHMARK_SETTINGS]
+        ):
+            return previous_run
+    return None
+
+
+def display_comparison(run, previous_run):
+    """Print the duration and memory of each stage next to the previous comparable run."""
+    previous_stages = {}
+    if previous_run is not None:
+        print(f'\nCompared with {previous_run["timestamp"]} ({previous_run["commit"]})')
+        previous_stages = {stage['stage']: stage for stage in previous_run['stages']}
+
+    print(
+        f'{"stage":<20} {"seconds":>10} {"previous":>10} {"ratio":>7} {"MB":>10} {"previous":>10}'
+    )
+    for stage in run['stages']:
+        previous = previous_stages.get(stage['stage'])
+        if previous is None:
+            print(
+                f'{stage["stage"]:<20} {stage["seconds"]:>10.3f} {"-":>10} {"-":>7} '
+                f'{get_stage_memory(stage):>10.2f} {"-":>10}'
+            )
+            continue
+        ratio = stage['seconds'] / previous['seconds'] if previous['seconds'] else float('nan')
+        print(
+            f'{stage["stage"]:<20} {stage["seconds"]:>10.3f} {previous["seconds"]:>10.3f} '
+            f'{ratio:>7.2f} {get_stage_memory(stage):>10.2f} {get_stage_memory(previous):>10.2f}'
+        )
+
+
+def benchmark(scales, results_path=BENCHMARK_RESULTS, **options):
+    """Benchmark every stage at each (drives, days) scale and append the runs to the results."""
+    results_path = os.path.abspath(results_path)
+    runs = load_benchmark_results(results_path)
+    for drives, days in scales:
+        run = run_scale(drives, days, options)
+        display_comparison(run, get_previous_run(runs, run))
+        save_benchmark_result(results_path, run)
+        runs.append(run)
+    print(f'\nBenchmark results saved in {results_path}')
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description='BackBlaze data parser benchmark.')
+    parser.add_argument(
+        '--scales',
+        type=str,
+        default=DEFAULT_SCALES,
+        help='Tailles des jeux de données générés : DISQUESxJOURS séparés par des virgules',
+    )
+    parser.add_argument(
+        '--results',
+        type=str,
+        default=BENCHMARK_RESULTS,
+        help='Fichier (json lines) où les mesures sont ajoutées pour comparer les exécutions',
+    )
+    parser.add_argument(
+        '--failure_rate',
+        type=float,
+        default=BENCHMARK_FAILURE_RATE,
+        help='Taux de panne annualisé des disques générés',
+    )
+    parser.add_argument(
+        '--smart_drift',
+        type=float,
+        default=DEFAULT_GENERATOR_OPTIONS['smart_drift'],
+        help='Dérive des compteurs d\'erreurs SMART avant la panne',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=DEFAULT_GENERATOR_OPTIONS['seed'],
+        help='Graine du générateur aléatoire',
+    )
+    add_history_arguments(parser)
+    add_storage_arguments(parser)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help=f'Nombre de processus du parser (1 par défaut pour des mesures comparables, '
+        f'{DEFAULT_WORKERS} sur cette machine)',
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=DEFAULT_PREFETCH,
+        help='Nombre de fichiers lus à l\'avance par le parser, 0 pour désactiver',
+    )
+    parser.add_argument(
+        '--trace_memory',
+        action='store_true',
+        help='Mesure le pic des allocations de chaque étape avec tracemalloc (ralentit les étapes)',
+    )
+
+    args = parser.parse_args()
+
+    benchmark(
+        parse_scales(args.scales),
+        args.results,
+        failure_rate=args.failure_rate,
+        smart_drift=args.smart_drift,
+        seed=args.seed,
+        history_length_recent=args.history_length_recent,
+        history_length_old=args.history_length_old,
+        compression=args.parquet_compression,
+        optimized=args.optimized_parquet,
+        layout=args.layout,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        trace_memory=args.trace_memory,
+    )
+
+
+if __name__ == '__main__':
+    main()
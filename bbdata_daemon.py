@@ -0,0 +1,411 @@
+"""
+Created on 17 Oct. 2026.
+
+Online mode: watches data/csv/ for new daily files and keeps the fleet aggregates (survival
+by age and SMART moments by age) up to date, without scanning the history again.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from bbdata_executor import DEFAULT_PREFETCH, map_tasks
+from bbdata_lifecycle import (
+    get_lifecycle_index,
+    merge_lifecycle_chunks,
+    save_lifecycle_index,
+    scan_lifecycle,
+    split_lifecycle_index,
+)
+from bbdata_profiling import record_read, record_write
+from bbdata_state import get_stage_files, set_stage_files
+from bbdata_storage import (
+    CSV_DIR,
+    PARQUET_DIR,
+    PROCESS_DIR,
+    add_storage_arguments,
+    convert_csv_to_parquet,
+    get_csv_data_files,
+    get_first_file_date,
+    get_new_data_files,
+    get_parquet_data_files,
+    iter_parquet_files,
+)
+from bbdata_survival import (
+    SURVIVAL_BUCKET_DAYS,
+    add_age_counts,
+    get_age_counts,
+    get_survival_ages,
+    get_survival_path,
+    get_survival_table,
+)
+
+DEFAULT_DAEMON_OPTIONS = {
+    'compression': None,
+    'optimized': False,
+    'bucket_days': SURVIVAL_BUCKET_DAYS,
+    'workers': 1,
+    'prefetch': DEFAULT_PREFETCH,
+    'settle_seconds': 5,
+}
+MOMENT_LEVELS = ['age_start_days', 'smart']
+
+
+def get_smart_moments_path(bucket_days=SURVIVAL_BUCKET_DAYS):
+    """Return the process file of the SMART moments by age bucket."""
+    return PROCESS_DIR + f'smart_moments_{bucket_days}_{get_first_file_date()}.parquet'
+
+
+def get_smart_moments_results_path():
+    """Return the published csv file of the SMART moments by age bucket."""
+    return f'results/{get_first_file_date()}_smart_moments.csv'
+
+
+def get_entry_info(lifecycle_index):
+    """Return the age when first seen (in days) and first seen date of disks, by serial number."""
+    entry_ages, _, _ = get_survival_ages(lifecycle_index)
+    return pd.DataFrame(
+        {
+            'entry_age': entry_ages,
+            'first_seen': pd.to_datetime(lifecycle_index['first_seen']).to_numpy(),
+        },
+        index=pd.Index(lifecycle_index['serial_number']),
+    )
+
+
+def get_smart_moments(dataframe, day, entry_info, bucket_days=SURVIVAL_BUCKET_DAYS):
+    """Return the moments of the raw SMART values of a daily dataframe, by age bucket.
+
+    The age of a disk on a day is its age when first seen plus the days since (see
+    get_survival_ages()). For each age bucket and SMART attribute, the moments are the
+    number of values, their sum and the sum of squared deviations from their mean (m2).
+    Missing values are ignored.
+    """
+    smart_columns = [
+        column
+        for column in dataframe.columns
+        if column.startswith('smart_') and column.endswith('_raw')
+    ]
+    values = dataframe[smart_columns].astype(float)
+    disk_info = entry_info.reindex(dataframe['serial_number'])
+    ages = (
+        disk_info['entry_age'].to_numpy() + (pd.Timestamp(day) - disk_info['first_seen']).dt.days
+    )
+    buckets = pd.Series(
+        (ages.to_numpy() // bucket_days * bucket_days), index=values.index, name=MOMENT_LEVELS[0]
+    )
+    groups = values.groupby(buckets)
+    deviations = values - groups.transform('mean')
+
+    moments = pd.concat(
+        {
+            'n': groups.count().stack(),
+            'sum': groups.sum().stack(),
+            'm2': (deviations**2).groupby(buckets).sum().stack(),
+        },
+        axis=1,
+    )
+    moments.index.names = MOMENT_LEVELS
+    return moments[moments['n'] > 0]
+
+
+def merge_smart_moments(moments_list):
+    """Merge moments by age bucket (Chan et al. formula for the sums of squared deviations)."""
+    moments = pd.concat([moments for moments in moments_list if moments is not None])
+    groups = moments.groupby(level=MOMENT_LEVELS)
+    total = groups[['n', 'sum']].sum()
+    deviations = moments['sum'] / moments['n'] - (total['sum'] / total['n']).reindex(moments.index)
+    total['m2'] = (moments['m2'] + moments['n'] * deviations**2).groupby(level=MOMENT_LEVELS).sum()
+    return total
+
+
+def fold_smart_moments(smart_moments, data_files, lifecycle_index, options):
+    """Return the SMART moments with those of data files added."""
+    entry_info = get_entry_info(lifecycle_index)
+    moments_list = [smart_moments]
+    for data_file, dataframe in iter_parquet_files(data_files, None, options['prefetch']):
+        moments_list.append(
+            get_smart_moments(dataframe, data_file[:10], entry_info, options['bucket_days'])
+        )
+    return merge_smart_moments(moments_list)
+
+
+def is_backfill(consumed_files, new_files):
+    """Return whether new data files are dated before the last consumed data file.
+
+    The first seen date, hence the age, of disks seen in a backfilled file may change:
+    the SMART moments of the other files must then be computed again.
+    """
+    return bool(consumed_files) and any(new_file < consumed_files[-1] for new_file in new_files)
+
+
+def get_rewritten_files(data_files, bucket_days=SURVIVAL_BUCKET_DAYS):
+    """Return the data files modified since the SMART moments were last saved."""
+    moments_path = get_smart_moments_path(bucket_days)
+    if not os.path.isfile(moments_path):
+        return []
+    saved_ns = os.stat(moments_path).st_mtime_ns
+    return [
+        data_file
+        for data_file in data_files
+        if not os.path.isfile(PARQUET_DIR + data_file)
+        or os.stat(PARQUET_DIR + data_file).st_mtime_ns > saved_ns
+    ]
+
+
+def load_smart_moments(data_files, lifecycle_index, options):
+    """Return the SMART moments of data files, only reading the files added since the last run.
+
+    All data files are read again if files were removed or backfilled since.
+    """
+    moments_path = get_smart_moments_path(options['bucket_days'])
+    consumed_files = get_stage_files(f'smart_moments_{options["bucket_days"]}')
+    new_files = get_new_data_files(consumed_files, data_files)
+    smart_moments = None
+    if (
+        new_files is not None
+        and not is_backfill(consumed_files, new_files)
+        and os.path.isfile(moments_path)
+    ):
+        smart_moments = pd.read_parquet(moments_path)
+        record_read(moments_path, len(smart_moments))
+    else:
+        new_files = data_files
+
+    if new_files:
+        print(f'Computing SMART moments of {len(new_files)} data files...')
+        smart_moments = fold_smart_moments(smart_moments, new_files, lifecycle_index, options)
+        save_smart_moments(smart_moments, data_files, options['bucket_days'])
+    return smart_moments
+
+
+def save_smart_moments(smart_moments, data_files, bucket_days=SURVIVAL_BUCKET_DAYS):
+    """Write the SMART moments of data files in their process file, for the next runs."""
+    moments_path = get_smart_moments_path(bucket_days)
+    smart_moments.to_parquet(moments_path)
+    record_write(moments_path, len(smart_moments))
+    set_stage_files(f'smart_moments_{bucket_days}', data_files)
+
+
+def load_state(options):
+    """Return the running state of the fleet, built from the process files of the last run.
+
+    The state holds the lifecycle index (first and last seen dates and failure dates of
+    each disk, see bbdata_lifecycle), the number of disks entering, leaving and failing
+    at each day of age (see get_age_counts()) and the SMART moments by age bucket: its
+    size depends on the number of disks, not on the number of days. If data files were
+    rewritten since the last run, the state is built from all data files.
+    """
+    rewritten_files = get_rewritten_files(
+        get_stage_files(f'smart_moments_{options["bucket_days"]}'), options['bucket_days']
+    )
+    if rewritten_files:
+        print(f'{len(rewritten_files)} data files rewritten, building the state again')
+        set_stage_files('lifecycle_index', [])
+        set_stage_files(f'smart_moments_{options["bucket_days"]}', [])
+    lifecycle_index = get_lifecycle_index('daily', options['workers'], options['prefetch'])
+    data_files = get_stage_files('lifecycle_index')
+    return {
+        'data_files': data_files,
+        'lifecycle_index': lifecycle_index,
+        'age_counts': get_age_counts(lifecycle_index),
+        'smart_moments': load_smart_moments(data_files, lifecycle_index, options),
+    }
+
+
+def update_state(state, new_files, options):
+    """Fold new data files in the running state and save it.
+
+    Only the disks seen in the new files change: their age counts are removed, then
+    added again with their new last seen date or first failure. The SMART moments of
+    the new files are added, or those of all data files computed again if new files are
+    backfilled (see is_backfill()).
+    """
+    backfill = is_backfill(state['data_files'], new_files)
+    partials = scan_lifecycle(new_files, 'daily', True, options['workers'], options['prefetch'])
+    seen_serial_numbers = pd.concat(
+        [seen['serial_number'] for seen, _ in partials]
+        + [failures['serial_number'] for _, failures in partials]
+    ).unique()
+
+    lifecycle_index = state['lifecycle_index']
+    age_counts = add_age_counts(
+        state['age_counts'],
+        get_age_counts(
+            lifecycle_index[lifecycle_index['serial_number'].isin(seen_serial_numbers)]
+        ),
+        -1,
+    )
+    lifecycle_index = merge_lifecycle_chunks([split_lifecycle_index(lifecycle_index), *partials])
+    state['age_counts'] = add_age_counts(
+        age_counts,
+        get_age_counts(
+            lifecycle_index[lifecycle_index['serial_number'].isin(seen_serial_numbers)]
+        ),
+    )
+    state['lifecycle_index'] = lifecycle_index
+    state['data_files'] = sorted(state['data_files'] + new_files)
+    save_lifecycle_index(lifecycle_index, state['data_files'])
+
+    if backfill:
+        print('Backfilled data files: computing the SMART moments of all data files again')
+        state['smart_moments'] = fold_smart_moments(
+            None, state['data_files'], lifecycle_index, options
+        )
+    else:
+        state['smart_moments'] = fold_smart_moments(
+            state['smart_moments'], new_files, lifecycle_index, options
+        )
+    save_smart_moments(state['smart_moments'], state['data_files'], options['bucket_days'])
+
+
+def write_published_file(dataframe, path):
+    """Write a csv file in place of the previous one, so that readers never see it partial."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dataframe.to_csv(path + '.tmp', sep='\t', decimal=',', index=False)
+    os.replace(path + '.tmp', path)
+    record_write(path, len(dataframe))
+
+
+def publish_state(state, bucket_days=SURVIVAL_BUCKET_DAYS):
+    """Publish the survival (see bbdata_survival) and SMART moments of the fleet by age bucket."""
+    survival_df = get_survival_table(None, bucket_days, state['age_counts'])
+    write_published_file(survival_df, get_survival_path())
+
+    moments_df = state['smart_moments'].reset_index()
+    moments_df.insert(1, 'age_end_days', moments_df['age_start_days'] + bucket_days - 1)
+    moments_df['mean'] = moments_df['sum'] / moments_df['n']
+    moments_df['std'] = np.sqrt(moments_df['m2'] / moments_df['n'])
+    moments_df['error'] = moments_df['std'] / np.sqrt(moments_df['n'])
+    write_published_file(
+        moments_df.drop(columns=['sum', 'm2']).sort_values(MOMENT_LEVELS),
+        get_smart_moments_results_path(),
+    )
+    print(
+        f'{len(state["lifecycle_index"])} disks, {survival_df["failures"].sum()} failures, '
+        f'up to {state["data_files"][-1][:10]}: aggregates published'
+    )
+
+
+def convert_new_csvs(options):
+    """Convert to parquet the new or rewritten csv files left unchanged for settle_seconds.
+
+    Files still being copied in the csv folder are converted at a later check. A csv
+    file modified after its parquet file replaces it.
+    """
+    csv_files = []
+    for csv_file in get_csv_data_files():
+        csv_mtime = os.path.getmtime(CSV_DIR + csv_file)
+        parquet_path = PARQUET_DIR + csv_file.replace('.csv', '.parquet')
+        if time.time() - csv_mtime < options['settle_seconds']:
+            continue
+        if not os.path.isfile(parquet_path):
+            csv_files.append(csv_file)
+        elif os.path.getmtime(parquet_path) < csv_mtime:
+            os.remove(parquet_path)
+            csv_files.append(csv_file)
+    if csv_files:
+        print(f'Converting {len(csv_files)} new csv files...')
+        map_tasks(
+            [
+                (convert_csv_to_parquet, csv_file, options['compression'], options['optimized'])
+                for csv_file in csv_files
+            ],
+            options['workers'],
+        )
+
+
+def is_outdated(state, bucket_days=SURVIVAL_BUCKET_DAYS):
+    """Return whether the running state must be built again: not loaded yet or files rewritten."""
+    return state is None or bool(get_rewritten_files(state['data_files'], bucket_days))
+
+
+def run_daemon(interval=10, once=False, **options):
+    """Watch the csv folder and update the fleet aggregates as new daily files land.
+
+    Every interval seconds, new csv files are converted and folded in the running state,
+    then the aggregates are published. options override DEFAULT_DAEMON_OPTIONS. With
+    once, pending files are processed and the daemon stops.
+    """
+    options = {**DEFAULT_DAEMON_OPTIONS, **options}
+    state = None
+    while True:
+        convert_new_csvs(options)
+        data_files = get_parquet_data_files()
+        if data_files and is_outdated(state, options['bucket_days']):
+            state = load_state(options)
+            publish_state(state, options['bucket_days'])
+        new_files = sorted(set(data_files) - set(state['data_files'])) if state else []
+        if new_files:
+            start = time.perf_counter()
+            print(f'\n{len(new_files)} new data files: {", ".join(new_files)}')
+            update_state(state, new_files, options)
+            publish_state(state, options['bucket_days'])
+            print(f'Updated in {time.perf_counter() - start:.2f} s')
+        if once:
+            return
+        time.sleep(interval)
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description='BackBlaze online aggregates daemon.')
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=10,
+        help='Intervalle en secondes entre deux vérifications du répertoire des csv',
+    )
+    parser.add_argument(
+        '--settle_seconds',
+        type=float,
+        default=DEFAULT_DAEMON_OPTIONS['settle_seconds'],
+        help='Délai en secondes sans modification avant de lire un nouveau fichier csv',
+    )
+    parser.add_argument(
+        '--survival_bucket_days',
+        type=int,
+        default=SURVIVAL_BUCKET_DAYS,
+        help='Largeur (en jours d\'âge) des intervalles de la survie et des moments SMART',
+    )
+    add_storage_arguments(parser, ('compression', 'optimized'))
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_DAEMON_OPTIONS['workers'],
+        help='Nombre de processus utilisés pour lire les fichiers au démarrage',
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=DEFAULT_PREFETCH,
+        help='Nombre de fichiers lus à l\'avance (en arrière-plan), 0 pour la désactiver',
+    )
+    parser.add_argument(
+        '--once',
+        action='store_true',
+        help='Traite les fichiers en attente, publie les agrégats puis s\'arrête',
+    )
+
+    args = parser.parse_args()
+
+    os.makedirs(PROCESS_DIR, exist_ok=True)
+    os.makedirs(CSV_DIR, exist_ok=True)
+    os.makedirs(PARQUET_DIR, exist_ok=True)
+    run_daemon(
+        args.interval,
+        args.once,
+        compression=args.parquet_compression,
+        optimized=args.optimized_parquet,
+        bucket_days=args.survival_bucket_days,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        settle_seconds=args.settle_seconds,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+Created on 17 Oct. 2026.
+
+Execution of the per-file tasks of the BackBlaze data parser.
+
+Scan stages map a function over data files (tasks) and reduce the partial results
+they return, e.g. scan_lifecycle_chunk() and merge_lifecycle_chunks(). Tasks run on
+one of the EXECUTOR_BACKENDS: serially, in a local process pool, or through a work
+queue on a shared filesystem, where worker processes of any host claim them.
+"""
+
+import importlib
+import itertools
+import multiprocessing as mp
+import os
+import pickle
+import shutil
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+from bbdata_profiling import collect_task, run_task
+
+DEFAULT_WORKERS = mp.cpu_count()
+DEFAULT_PREFETCH = 2
+EXECUTOR_BACKENDS = ['serial', 'process', 'queue']
+QUEUE_DIR = 'process/queue/'
+QUEUE_POLL_SECONDS = 0.1
+# A claimed task is given back to the queue if its worker stops renewing its claim
+QUEUE_LEASE_SECONDS = 120
+EXECUTOR = {'backend': 'process', 'queue_dir': QUEUE_DIR}
+JOB_COUNTER = itertools.count()
+
+
+def configure_executor(backend='process', queue_dir=QUEUE_DIR):
+    """Set the backend of map_tasks() and imap_tasks() (see EXECUTOR_BACKENDS)."""
+    EXECUTOR.update(backend=backend, queue_dir=queue_dir)
+
+
+def get_backend(tasks, workers):
+    """Return the backend running tasks: a process pool is only used for several tasks."""
+    if EXECUTOR['backend'] == 'process' and (workers <= 1 or len(tasks) <= 1):
+        return 'serial'
+    return EXECUTOR['backend']
+
+
+def prefetch_map(function, items, prefetch=DEFAULT_PREFETCH):
+    """Yield function(item) for each item in order, computing the next ones in background threads.
+
+    While a result is consumed, at most prefetch items are processed ahead, so memory
+    stays bounded. Meant for file reads, which release the GIL: the next files load while
+    the current one is processed. With prefetch = 0, items are processed one at a time.
+    """
+    if prefetch <= 0:
+        for item in items:
+            yield function(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) > prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def map_tasks(tasks, workers=DEFAULT_WORKERS, prefetch=0):
+    """Run (function, *args) tasks and return their results in task order.
+
+    Tasks run in a process pool when workers > 1, serially otherwise, with prefetch
+    tasks run ahead in background threads (see prefetch_map()). With the queue backend,
+    they run on workers local processes and on the workers of other hosts (see
+    queue_map()). Their duration and I/O are recorded for the profiled stage, if any
+    (see bbdata_profiling).
+    """
+    results = [None] * len(tasks)
+    backend = get_backend(tasks, workers)
+    if backend == 'queue':
+        return [
+            collect_task(output) for output in tqdm(queue_map(tasks, workers), total=len(tasks))
+        ]
+    if backend == 'serial':
+        task_outputs = prefetch_map(lambda task: run_task(*task), tasks, prefetch)
+        for task_idx, task_output in enumerate(tqdm(task_outputs, total=len(tasks))):
+            results[task_idx] = collect_task(task_output)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_task, *task): task_idx for task_idx, task in enumerate(tasks)
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            results[futures[future]] = collect_task(future.result())
+    return results
+
+
+def imap_tasks(tasks, workers=DEFAULT_WORKERS, prefetch=0):
+    """Run (function, *args) tasks and yield their results in task order.
+
+    At most 2 * workers tasks are in flight (prefetch + 1 when run serially, see
+    map_tasks()), so results waiting to be consumed stay bounded. With the queue
+    backend, results wait in the queue directory.
+    """
+    backend = get_backend(tasks, workers)
+    if backend == 'queue':
+        for task_output in tqdm(queue_map(tasks, workers), total=len(tasks)):
+            yield collect_task(task_output)
+        return
+    if backend == 'serial':
+        task_outputs = prefetch_map(lambda task: run_task(*task), tasks, prefetch)
+        for task_output in tqdm(task_outputs, total=len(tasks)):
+            yield collect_task(task_output)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tqdm(tasks):
+            pending.append(executor.submit(run_task, *task))
+            if len(pending) >= 2 * workers:
+                yield collect_task(pending.popleft().result())
+        while pending:
+            yield collect_task(pending.popleft().result())
+
+
+def get_shard_name(task_idx):
+    """Return the file name of a task (shard) of a queue job."""
+    return f'{task_idx:06d}.pkl'
+
+
+def write_pickle(path, value):
+    """Write a value in a pickle file, renamed once complete so readers never see it partial."""
+    tmp_path = f'{path}.{socket.gethostname()}-{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as pickle_file:
+        pickle.dump(value, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_pickle(path):
+    """Return the value of a pickle file."""
+    with open(path, 'rb') as pickle_file:
+        return pickle.load(pickle_file)
+
+
+def get_function_reference(function):
+    """Return the module and name of a task function, to import it in a worker.
+
+    Functions of the script run as __main__ (e.g. bbdata_parser.py) are referenced by
+    the module of the script, since __main__ is the worker script in workers.
+    """
+    module_name = function.__module__
+    if module_name == '__main__':
+        module_name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    return module_name, function.__qualname__
+
+
+def renew_claim(claim_path, done):
+    """Touch a claimed task until done is set, so that its lease does not expire."""
+    while not done.wait(QUEUE_LEASE_SECONDS / 4):
+        try:
+            os.utime(claim_path)
+        except OSError:  # Given back to the queue
+            return
+
+
+def claim_task(job_dir):
+    """Claim the first pending task of a job and return its shard name, None if there is none.
+
+    A task is claimed by moving its shard from tasks/ to claimed/: the rename is atomic,
+    so a task is claimed by a single worker, whatever its host.
+    """
+    try:
+        shard_names = sorted(os.listdir(job_dir + 'tasks/'))
+    except OSError:  # Job finished
+        return None
+    for shard_name in shard_names:
+        try:
+            os.rename(job_dir + 'tasks/' + shard_name, job_dir + 'claimed/' + shard_name)
+        except OSError:  # Claimed by another worker
+            continue
+        os.utime(job_dir + 'claimed/' + shard_name)
+        return shard_name
+    return None
+
+
+def run_claimed_task(job_dir, shard_name):
+    """Run a claimed task and write its output (see run_task()) or its error in results/."""
+    claim_path = job_dir + 'claimed/' + shard_name
+    done = threading.Event()
+    threading.Thread(target=renew_claim, args=(claim_path, done), daemon=True).start()
+    try:
+        (module_name, function_name), *args = read_pickle(claim_path)
+        function = getattr(importlib.import_module(module_name), function_name)
+        result = {'output': run_task(function, *args)}
+    except Exception:  # pylint: disable=broad-except
+        result = {'error': f'{socket.gethostname()}: {traceback.format_exc()}'}
+    finally:
+        done.set()
+    try:
+        write_pickle(job_dir + 'results/' + shard_name, result)
+        os.remove(claim_path)
+    except OSError:  # Job finished or task given back to the queue and run again
+        pass
+
+
+def run_queue_worker(queue_dir=QUEUE_DIR, idle_seconds=None, job_name=None):
+    """Claim and run the tasks of the queue jobs until none is pending for idle_seconds.
+
+    Jobs are processed in name order, their tasks in task order. With job_name, only the
+    tasks of this job are run. With idle_seconds None, the worker waits for new jobs forever.
+    """
+    idle_since = time.monotonic()
+    while idle_seconds is None or time.monotonic() - idle_since <= idle_seconds:
+        job_names = [job_name] if job_name else sorted(os.listdir(queue_dir))
+        for name in job_names:
+            shard_name = claim_task(queue_dir + name + '/')
+            if shard_name is not None:
+                run_claimed_task(queue_dir + name + '/', shard_name)
+                idle_since = time.monotonic()
+                break
+        else:
+            time.sleep(QUEUE_POLL_SECONDS)
+
+
+def release_expired_claims(job_dir):
+    """Give back to the queue the claimed tasks whose worker stopped renewing its claim."""
+    for shard_name in os.listdir(job_dir + 'claimed/'):
+        try:
+            if time.time() - os.path.getmtime(job_dir + 'claimed/' + shard_name) > (
+                QUEUE_LEASE_SECONDS
+            ):
+                os.rename(job_dir + 'claimed/' + shard_name, job_dir + 'tasks/' + shard_name)
+                print(f'Task {shard_name} given back to the queue')
+        except OSError:  # Done meanwhile
+            continue
+
+
+def queue_map(tasks, workers=DEFAULT_WORKERS):
+    """Queue (function, *args) tasks in the queue directory and yield their outputs in order.
+
+    Each task is a pickle file (shard) of a job folder, claimed by the local workers
+    started here and by the workers started on other hosts sharing the queue directory
+    (see bbdata_worker.py), which write their output (see run_task()) next to it.
+    Functions and data paths must be the same on every host: workers run from the
+    same project folder. The job folder is removed once all outputs are read.
+    """
+    job_dir = EXECUTOR['queue_dir'] + (
+        f'{time.strftime("%Y%m%d%H%M%S")}-{socket.gethostname()}-{os.getpid()}'
+        f'-{next(JOB_COUNTER)}/'
+    )
+    for sub_dir in ['tasks/', 'claimed/', 'results/']:
+        os.makedirs(job_dir + sub_dir)
+    # Tasks are written before being moved in tasks/, so workers only claim complete shards
+    for task_idx, task in enumerate(tasks):
+        write_pickle(
+            job_dir + get_shard_name(task_idx), (get_function_reference(task[0]), *task[1:])
+        )
+        os.rename(
+            job_dir + get_shard_name(task_idx), job_dir + 'tasks/' + get_shard_name(task_idx)
+        )
+
+    local_workers = [
+        mp.Process(
+            target=run_queue_worker,
+            args=(EXECUTOR['queue_dir'], None, os.path.basename(job_dir[:-1])),
+            daemon=True,
+        )
+        for _ in range(min(max(workers, 0), len(tasks)))
+    ]
+    for local_worker in local_workers:
+        local_worker.start()
+    try:
+        for task_idx in range(len(tasks)):
+            result_path = job_dir + 'results/' + get_shard_name(task_idx)
+            while not os.path.isfile(result_path):
+                time.sleep(QUEUE_POLL_SECONDS)
+                release_expired_claims(job_dir)
+            result = read_pickle(result_path)
+            os.remove(result_path)
+            if 'error' in result:
+                raise RuntimeError(f'Task {task_idx} failed on {result["error"]}')
+            yield result['output']
+    finally:
+        for local_worker in local_workers:
+            local_worker.terminate()
+            local_worker.join()
+        shutil.rmtree(job_dir, ignore_errors=True)
@@ -0,0 +1,241 @@
+"""
+Created on 17 Oct. 2026.
+
+Synthetic BackBlaze dataset generator: reproducible daily files with the real schema.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bbdata_executor import DEFAULT_WORKERS, map_tasks
+from bbdata_storage import CSV_DIR, PARQUET_DIR, add_storage_arguments, write_parquet
+
+SMART_IDS = [
+    1, 2, 3, 4, 5, 7, 8, 9, 10, 11, 12, 13, 15, 16, 17, 18, 22, 23, 24, 168, 170, 173, 174, 177,
+    179, 181, 182, 183, 184, 187, 188, 189, 190, 191, 192, 193, 194, 195, 196, 197, 198, 199, 200,
+    201, 218, 220, 222, 223, 224, 225, 226, 231, 232, 233, 235, 240, 241, 242, 250, 251, 252, 254,
+    255,
+]  # fmt: skip
+SEAGATE_SMART_IDS = [
+    1, 3, 4, 5, 7, 9, 10, 12, 183, 184, 187, 188, 189, 190, 191, 192, 193, 194, 195, 197, 198, 199,
+    240, 241, 242,
+]  # fmt: skip
+HGST_SMART_IDS = [1, 2, 3, 4, 5, 7, 8, 9, 10, 12, 22, 192, 193, 194, 196, 197, 198, 199]
+WDC_SMART_IDS = [1, 3, 4, 5, 7, 9, 10, 11, 12, 192, 193, 194, 196, 197, 198, 199, 200]
+MODELS = {
+    'ST4000DM000': (4000787030016, SEAGATE_SMART_IDS),
+    'ST12000NM0007': (12000138625024, SEAGATE_SMART_IDS),
+    'HGST HMS5C4040BLE640': (4000787030016, HGST_SMART_IDS),
+    'WDC WD30EFRX': (3000592982016, WDC_SMART_IDS),
+}
+# Error counters drifting before a failure
+DRIFT_SMART_IDS = [5, 184, 187, 196, 197, 198]
+DRIFT_DAYS = 90
+GENERATOR_FORMATS = ['csv', 'parquet']
+DEFAULT_GENERATOR_OPTIONS = {
+    'start_date': '2019-01-01',
+    'failure_rate': 0.05,
+    'smart_drift': 0.05,
+    'initial_fraction': 0.5,
+    'zombie_rate': 0.02,
+    'seed': 0,
+    'compression': None,
+    'optimized': False,
+}
+
+
+def generate_fleet(drives, days, **options):
+    """Return the disks of the fleet, with their model and observation period.
+
+    options override DEFAULT_GENERATOR_OPTIONS. initial_fraction of the disks are
+    seen from the first day, the others are installed on a uniformly drawn day.
+    Each disk fails with an annualized failure_rate, then is no longer reported,
+    except zombie_rate of the failed disks that keep being reported a few days
+    with failure = 0 (a strange behavior for the parser).
+    """
+    options = {**DEFAULT_GENERATOR_OPTIONS, **options}
+    rng = np.random.default_rng([options['seed'], drives])
+
+    first_days = np.where(
+        rng.random(drives) < options['initial_fraction'], 0, rng.integers(0, days, drives)
+    )
+    failure_days = first_days + rng.geometric(options['failure_rate'] / 365, drives) - 1
+    failed = failure_days < days
+    last_days = np.where(failed, failure_days, days - 1)
+    zombie_days = np.where(
+        failed & (rng.random(drives) < options['zombie_rate']), rng.integers(1, 10, drives), 0
+    )
+
+    return pd.DataFrame(
+        {
+            'serial_number': [f'SYN{options["seed"]:02d}{drive:08d}' for drive in range(drives)],
+            'model': rng.choice(list(MODELS), drives),
+            'first_day': first_days,
+            'last_day': last_days,
+            'failed': failed,
+            'zombie_days': zombie_days,
+            'power_on_hours': np.where(first_days == 0, rng.integers(0, 5 * 365 * 24, drives), 0),
+            'error_count': rng.poisson(0.2, drives),
+        }
+    )
+
+
+def get_smart_values(fleet, day, smart_drift, rng):
+    """Return the raw and normalized values of each SMART id for the disks of the day."""
+    ages = day - fleet['first_day'].to_numpy()
+    power_on_hours = fleet['power_on_hours'].to_numpy() + 24 * ages
+    drift_progress = np.clip(DRIFT_DAYS - (fleet['last_day'].to_numpy() - day), 0, None)
+    drift = np.floor(smart_drift * drift_progress**2) * fleet['failed'].to_numpy()
+    error_counts = fleet['error_count'].to_numpy() + drift
+    temperatures = rng.integers(20, 41, len(fleet))
+
+    values = {}
+    for smart_id in SMART_IDS:
+        raw, normalized = np.zeros(len(fleet)), np.full(len(fleet), 100.0)
+        if smart_id == 9:
+            raw, normalized = power_on_hours, 100 - power_on_hours // 8760
+        elif smart_id in DRIFT_SMART_IDS:
+            raw, normalized = error_counts, np.maximum(100 - error_counts, 1)
+        elif smart_id == 194:
+            raw, normalized = temperatures, temperatures
+        elif smart_id in (1, 7, 195):
+            raw = rng.integers(0, 200000000, len(fleet))
+            normalized = rng.integers(75, 120, len(fleet))
+        elif smart_id in (241, 242):
+            raw = (power_on_hours + 1) * rng.integers(10000000, 50000000, len(fleet))
+        values[smart_id] = (np.asarray(raw, dtype=float), np.asarray(normalized, dtype=float))
+    return values
+
+
+def get_day_date(start_date, day):
+    """Return the date (YYYY-mm-dd) of a day of the dataset."""
+    return (pd.Timestamp(start_date) + pd.Timedelta(days=day)).strftime('%Y-%m-%d')
+
+
+def get_day_fleet(fleet, day):
+    """Return the disks reported on a given day."""
+    return fleet[
+        (fleet['first_day'] <= day) & (day <= fleet['last_day'] + fleet['zombie_days'])
+    ].reset_index(drop=True)
+
+
+def generate_day(fleet, day, file_path, options):
+    """Write the daily file of the disks of the day (see get_day_fleet())."""
+    rng = np.random.default_rng([options['seed'], day])
+    columns = {
+        'date': get_day_date(options['start_date'], day),
+        'serial_number': fleet['serial_number'],
+        'model': fleet['model'],
+        'capacity_bytes': fleet['model'].map({model: info[0] for model, info in MODELS.items()}),
+        'failure': (fleet['failed'] & (fleet['last_day'] == day)).astype(int),
+    }
+    for smart_id, (raw, normalized) in get_smart_values(
+        fleet, day, options['smart_drift'], rng
+    ).items():
+        supported = np.isin(
+            fleet['model'], [model for model, info in MODELS.items() if smart_id in info[1]]
+        )
+        columns[f'smart_{smart_id}_normalized'] = np.where(supported, normalized, np.nan)
+        columns[f'smart_{smart_id}_raw'] = np.where(supported, raw, np.nan)
+    dataframe = pd.DataFrame(columns)
+
+    if file_path.endswith('.parquet'):
+        write_parquet(dataframe, file_path, options['compression'], options['optimized'])
+    else:
+        dataframe.to_csv(file_path, index=False)
+    return len(dataframe)
+
+
+def generate_dataset(drives, days, file_format='csv', workers=DEFAULT_WORKERS, **options):
+    """Generate the daily files of a synthetic fleet and return the number of rows written.
+
+    The dataset only depends on drives, days and options: each day draws its values
+    from its own random generator, seeded by the seed and the day.
+    """
+    options = {**DEFAULT_GENERATOR_OPTIONS, **options}
+    print(f'Generating {days} days of {drives} disks...')
+    fleet = generate_fleet(drives, days, **options)
+    directory = CSV_DIR if file_format == 'csv' else PARQUET_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    row_counts = map_tasks(
+        [
+            (
+                generate_day,
+                get_day_fleet(fleet, day),
+                day,
+                f'{directory}{get_day_date(options["start_date"], day)}.{file_format}',
+                options,
+            )
+            for day in range(days)
+        ],
+        workers,
+    )
+    print(f'{sum(row_counts)} rows, {int(fleet["failed"].sum())} failures written in {directory}')
+    return sum(row_counts)
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description='Synthetic BackBlaze data generator.')
+    parser.add_argument('--drives', type=int, default=1000, help='Nombre de disques')
+    parser.add_argument('--days', type=int, default=120, help='Nombre de jours générés')
+    parser.add_argument(
+        '--start_date',
+        type=str,
+        default=DEFAULT_GENERATOR_OPTIONS['start_date'],
+        help='Date du premier fichier journalier (format YYYY-mm-dd)',
+    )
+    parser.add_argument(
+        '--failure_rate',
+        type=float,
+        default=DEFAULT_GENERATOR_OPTIONS['failure_rate'],
+        help='Taux de panne annualisé des disques (0.05 pour 5 %%)',
+    )
+    parser.add_argument(
+        '--smart_drift',
+        type=float,
+        default=DEFAULT_GENERATOR_OPTIONS['smart_drift'],
+        help=f'Dérive des compteurs d\'erreurs SMART pendant les {DRIFT_DAYS} jours avant la panne',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=DEFAULT_GENERATOR_OPTIONS['seed'],
+        help='Graine du générateur aléatoire (même graine, mêmes fichiers)',
+    )
+    parser.add_argument(
+        '--format',
+        type=str,
+        default='csv',
+        choices=GENERATOR_FORMATS,
+        help='Fichiers journaliers csv (data/csv) ou parquet (data/parquet)',
+    )
+    add_storage_arguments(parser, ('compression',))
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help='Nombre de processus utilisés pour écrire les fichiers',
+    )
+
+    args = parser.parse_args()
+
+    generate_dataset(
+        args.drives,
+        args.days,
+        args.format,
+        args.workers,
+        start_date=args.start_date,
+        failure_rate=args.failure_rate,
+        smart_drift=args.smart_drift,
+        seed=args.seed,
+        compression=args.parquet_compression,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""
+Created on 17 Oct. 2026.
+
+Lifecycle index of the BackBlaze disks, built from the daily files in a single scan.
+"""
+
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from bbdata_executor import DEFAULT_PREFETCH, DEFAULT_WORKERS, map_tasks
+from bbdata_profiling import record_cache_hit, record_read, record_write
+from bbdata_serials import (
+    get_serial_ids,
+    intern_serial_numbers,
+    load_serial_dictionary,
+    save_serial_dictionary,
+)
+from bbdata_state import get_stage_files, set_stage_files
+from bbdata_storage import (
+    DATASET_DIR,
+    PROCESS_DIR,
+    get_dataset_part_files,
+    get_dataset_partition,
+    get_new_data_files,
+    get_parquet_data_files,
+    iter_parquet_files,
+    parquet_to_dataframe,
+)
+
+LIFECYCLE_COLUMNS = ['serial_number', 'model', 'failure', 'smart_9_raw']
+SEEN_COLUMNS = ['serial_number', 'model', 'first_seen', 'last_seen', 'first_power_on_hours']
+
+
+def get_lifecycle_chunks(data_files, workers=DEFAULT_WORKERS):
+    """Split data files into contiguous chunks for the lifecycle scan."""
+    chunk_count = min(len(data_files), max(workers, 1) * 4)
+    chunk_size = math.ceil(len(data_files) / chunk_count)
+    return [data_files[idx : idx + chunk_size] for idx in range(0, len(data_files), chunk_size)]
+
+
+def scan_lifecycle_chunk(data_files, prefetch=DEFAULT_PREFETCH):
+    """Return partial lifecycle info (seen dates and failures) of sorted data files.
+
+    Serial numbers are interned in a dictionary local to the chunk: last seen files
+    are kept in an array indexed by serial id and serial numbers are only mapped back
+    to strings once the chunk is scanned.
+    The next prefetch files are read while the current one is scanned.
+    """
+    serial_index = pd.Index([], dtype=object)
+    last_seen = np.empty(0, dtype=np.int32)
+    new_disks_list = []
+    failures_list = []
+
+    for file_idx, (data_file, dataframe) in enumerate(
+        iter_parquet_files(data_files, LIFECYCLE_COLUMNS, prefetch)
+    ):
+        disks = dataframe.drop_duplicates('serial_number')
+        serial_index, serial_ids = intern_serial_numbers(serial_index, disks['serial_number'])
+
+        # Files are sorted, so a serial number is first seen in the first file it appears in
+        new_disks = disks[serial_ids >= len(last_seen)]
+        new_disks_list.append(
+            pd.DataFrame(
+                {
+                    'model': new_disks['model'].to_numpy(),
+                    'first_seen': data_file[:10],
+                    'first_power_on_hours': new_disks['smart_9_raw'].to_numpy(dtype=float),
+                }
+            )
+        )
+        last_seen = np.concatenate(
+            [last_seen, np.empty(len(serial_index) - len(last_seen), dtype=np.int32)]
+        )
+        last_seen[serial_ids] = file_idx
+
+        failed_serial_numbers = dataframe.loc[dataframe['failure'] == 1, 'serial_number']
+        failures_list.append(
+            pd.DataFrame({'serial_number': failed_serial_numbers, 'day': data_file[:10]})
+        )
+
+    seen_df = pd.concat(new_disks_list, ignore_index=True)
+    seen_df.insert(0, 'serial_number', serial_index)
+    seen_df['last_seen'] = np.array([data_file[:10] for data_file in data_files])[last_seen]
+    return seen_df[SEEN_COLUMNS], pd.concat(failures_list, ignore_index=True)
+
+
+def scan_lifecycle_dataset_part(part_file, days=None):
+    """Return partial lifecycle info (seen dates and failures) of a dataset part file."""
+    dataframe = parquet_to_dataframe(
+        part_file,
+        columns=LIFECYCLE_COLUMNS + ['date'],
+        filters=None if days is None else [('date', 'in', days)],
+        directory=DATASET_DIR,
+    )
+    # Part files are sorted by serial number then date
+    seen_df = (
+        dataframe.groupby('serial_number', sort=False)
+        .agg(model=('model', 'first'), first_seen=('date', 'min'), last_seen=('date', 'max'))
+        .reset_index()
+    )
+    seen_df['first_power_on_hours'] = (
+        dataframe.drop_duplicates('serial_number')['smart_9_raw'].astype(float).to_numpy()
+    )
+    failures_df = dataframe.loc[dataframe['failure'] == 1, ['serial_number', 'date']]
+    return seen_df, failures_df.rename(columns={'date': 'day'})
+
+
+def merge_lifecycle_chunks(partials):
+    """Merge partial lifecycle info into the lifecycle index.
+
+    Serial numbers are interned in the serial number dictionary and dates are
+    replaced by their position among the sorted dates: partial info is aggregated
+    on integers. The index keeps the id of each serial number.
+    """
+    seen_df = pd.concat([seen for seen, _ in partials], ignore_index=True)
+    serial_index, seen_df['serial_id'] = intern_serial_numbers(
+        load_serial_dictionary(), seen_df.pop('serial_number')
+    )
+    save_serial_dictionary(serial_index)
+    dates, date_codes = np.unique(
+        seen_df[['first_seen', 'last_seen']].to_numpy(dtype=str), return_inverse=True
+    )
+    seen_df[['first_seen', 'last_seen']] = date_codes.reshape(-1, 2)
+
+    lifecycle_index = seen_df.groupby('serial_id').agg(
+        first_seen=('first_seen', 'min'), last_seen=('last_seen', 'max')
+    )
+    # Model and power on hours of the partial info where the disk is first seen
+    lifecycle_index = lifecycle_index.join(
+        seen_df.sort_values('first_seen', kind='stable')
+        .drop_duplicates('serial_id')
+        .set_index('serial_id')[['model', 'first_power_on_hours']]
+    )
+    for column in ['first_seen', 'last_seen']:
+        lifecycle_index[column] = dates[lifecycle_index[column].to_numpy()]
+    failures_df = pd.concat([failures for _, failures in partials], ignore_index=True)
+    failure_ids = get_serial_ids(serial_index, failures_df['serial_number'])
+    failure_dates = failures_df.groupby(failure_ids)['day'].agg(lambda days: sorted(set(days)))
+
+    lifecycle_index = lifecycle_index.reset_index()
+    lifecycle_index.insert(0, 'serial_number', serial_index[lifecycle_index['serial_id']])
+    lifecycle_index = lifecycle_index.sort_values('serial_number', ignore_index=True)[
+        ['serial_number', 'serial_id', *SEEN_COLUMNS[1:]]
+    ]
+    lifecycle_index['failure_dates'] = [
+        failure_dates.get(serial_id, []) for serial_id in lifecycle_index['serial_id']
+    ]
+    lifecycle_index['last_failure'] = [
+        days[-1] if days else None for days in lifecycle_index['failure_dates']
+    ]
+    lifecycle_index['seen_after_failure'] = lifecycle_index['last_failure'].notna() & (
+        lifecycle_index['last_seen'] > lifecycle_index['last_failure'].fillna('')
+    )
+    return lifecycle_index
+
+
+def split_lifecycle_index(lifecycle_index):
+    """Return the lifecycle index as partial lifecycle info, to fold new data files in."""
+    seen_df = lifecycle_index[SEEN_COLUMNS]
+    failures_df = (
+        lifecycle_index[['serial_number', 'failure_dates']]
+        .explode('failure_dates')
+        .dropna()
+        .rename(columns={'failure_dates': 'day'})
+    )
+    return seen_df, failures_df
+
+
+def scan_lifecycle(
+    data_files,
+    layout='daily',
+    incremental=False,
+    workers=DEFAULT_WORKERS,
+    prefetch=DEFAULT_PREFETCH,
+):
+    """Scan data files in parallel and return their partial lifecycle info."""
+    if layout == 'dataset':
+        days = [data_file[:10] for data_file in data_files] if incremental else None
+        partitions = {get_dataset_partition(data_file[:10]) for data_file in data_files}
+        tasks = [
+            (scan_lifecycle_dataset_part, part_file, days)
+            for part_file in get_dataset_part_files()
+            if os.path.dirname(part_file) in partitions
+        ]
+    else:
+        tasks = [
+            (scan_lifecycle_chunk, chunk, prefetch)
+            for chunk in get_lifecycle_chunks(data_files, workers)
+        ]
+
+    return map_tasks(tasks, workers, prefetch)
+
+
+def save_lifecycle_index(lifecycle_index, data_files):
+    """Write the lifecycle index of data files in its process file, for the next runs."""
+    process_path = PROCESS_DIR + f'lifecycle_index_{data_files[0][:10]}.parquet'
+    lifecycle_index.to_parquet(process_path)
+    record_write(process_path, len(lifecycle_index))
+    set_stage_files('lifecycle_index', data_files)
+
+
+def get_lifecycle_index(layout='daily', workers=DEFAULT_WORKERS, prefetch=DEFAULT_PREFETCH):
+    """Return the per serial number lifecycle index, scanning all data files once if needed.
+
+    The index holds, for each serial number, its id in the serial number dictionary
+    (see bbdata_serials), its model, first and last seen dates,
+    power on hours when first seen, failure dates and whether the disk was still seen
+    after its last failure.
+    Data files added since the last run are folded into the existing index.
+    prefetch is the number of files read ahead of the one being scanned.
+    """
+    print('\n---Building lifecycle index...---')
+    data_files = get_parquet_data_files()
+    process_file_name = f'lifecycle_index_{data_files[0][:10]}.parquet'
+    new_files = get_new_data_files(get_stage_files('lifecycle_index'), data_files)
+    partials = []
+
+    # Get Info from old run
+    lifecycle_index = None
+    if new_files is not None and os.path.isfile(PROCESS_DIR + process_file_name):
+        print(f'Found process file : {process_file_name}')
+        lifecycle_index = pd.read_parquet(PROCESS_DIR + process_file_name)
+        record_read(PROCESS_DIR + process_file_name, len(lifecycle_index))
+        # Indexes written before serial number ids do not match the serial number dictionary
+        if not (set(SEEN_COLUMNS) | {'serial_id'}).issubset(lifecycle_index.columns):
+            print('Process file is outdated, indexing all data files again')
+            lifecycle_index = None
+
+    if lifecycle_index is not None:
+        record_cache_hit()
+        if not new_files:
+            return lifecycle_index
+        print(f'{len(new_files)} new data files to index')
+        partials.append(split_lifecycle_index(lifecycle_index))
+        partials.extend(scan_lifecycle(new_files, layout, True, workers, prefetch))
+    else:
+        partials.extend(scan_lifecycle(data_files, layout, False, workers, prefetch))
+    lifecycle_index = merge_lifecycle_chunks(partials)
+
+    # Saving for next run
+    save_lifecycle_index(lifecycle_index, data_files)
+
+    print(f'{len(lifecycle_index)} serial numbers indexed')
+    return lifecycle_index
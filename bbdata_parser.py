@@ -5,126 +5,92 @@ Created on 25 March. 2023.
 """
 
 import argparse
-import json
-import multiprocessing as mp
 import os
+import shutil
 import sys
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
-
-CSV_DIR = 'data/csv/'
-PARQUET_DIR = 'data/parquet/'
-PROCESS_DIR = 'process/'
-
-
-def convert_csv_to_parquet(csv_file_name):
-    """Convert csv to parquet files."""
-    csv_path = os.path.join(CSV_DIR, csv_file_name)
-    parquet_path = os.path.join(PARQUET_DIR, csv_file_name.replace('.csv', '.parquet'))
-
-    if not os.path.exists(parquet_path):
-        dataframe = pd.read_csv(csv_path)
-        dataframe.to_parquet(parquet_path, compression=None)
-
-
-def convert_csvs_to_parquets():
-    """Convert csv to parquet files."""
-    print('Converting csv to parquet files...')
-    csv_files = get_csv_data_files()
-
-    for csv_file in csv_files.copy():
-        if os.path.exists(os.path.join(PARQUET_DIR, csv_file.replace('.csv', '.parquet'))):
-            csv_files.remove(csv_file)
-
-    if csv_files:
-        with ProcessPoolExecutor(max_workers=mp.cpu_count()) as executor:
-            futures = [
-                executor.submit(convert_csv_to_parquet, csv_file_name)
-                for csv_file_name in csv_files
-            ]
-
-            for _ in tqdm(as_completed(futures), total=len(futures)):
-                pass
-    print('All csv files have been converted to parquet files...')
-
-
-def csv_to_dataframe(csv_name) -> pd.DataFrame:
-    """Transform a csv to a dataframe object."""
-    try:
-        dataframe = pd.read_csv(CSV_DIR + csv_name)
-        return dataframe
-    except (Exception,):  # pylint: disable=broad-except
-        print(f'Cannot read {csv_name}')
-        if input('Delete file ? (y/n)') == 'y':
-            os.remove(CSV_DIR + csv_name)
-        sys.exit(1)
-
-
-def parquet_to_dataframe(parquet_name) -> pd.DataFrame:
-    """Transform a csv to a dataframe object."""
-    try:
-        dataframe = pd.read_parquet(PARQUET_DIR + parquet_name)
-        return dataframe
-    except (Exception,):  # pylint: disable=broad-except
-        print(f'Cannot read {PARQUET_DIR + parquet_name}')
-        sys.exit(1)
-
-
-def get_csv_data_files(reverse=False):
-    """Return data csv files list from data folder."""
-    return sorted((file for file in os.listdir(CSV_DIR) if file.endswith('.csv')), reverse=reverse)
-
-
-def get_parquet_data_files(reverse=False):
-    """Return data parquet files list from data folder."""
-    return sorted(
-        (file for file in os.listdir(PARQUET_DIR) if file.endswith('.parquet')), reverse=reverse
-    )
-
-
-def get_first_file_date():
-    """Return older file date."""
-    return get_parquet_data_files()[0][:10]
-
-
-def get_start_files(sn_dict):
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bbdata_executor import (
+    DEFAULT_PREFETCH,
+    DEFAULT_WORKERS,
+    EXECUTOR_BACKENDS,
+    QUEUE_DIR,
+    configure_executor,
+    imap_tasks,
+    map_tasks,
+)
+from bbdata_lifecycle import get_lifecycle_index
+from bbdata_profiling import (
+    enable_profiling,
+    profile_stage,
+    record_cache_hit,
+    record_read,
+    record_write,
+)
+from bbdata_serials import intern_serial_numbers, load_serial_dictionary
+from bbdata_state import (
+    clear_parsed,
+    get_parsed,
+    get_plan_signatures,
+    get_plans,
+    get_stage_files,
+    save_parsed,
+    save_plans,
+    set_stage_files,
+)
+from bbdata_storage import (
+    ARROW_CACHE_DIR,
+    CSV_DIR,
+    DATASET_DIR,
+    PARQUET_DIR,
+    PROCESS_DIR,
+    ROW_GROUP_SIZE,
+    STREAM_BUCKETS,
+    add_storage_arguments,
+    cast_to_dtypes,
+    compact_parquet_files,
+    configure_arrow_cache,
+    convert_csvs_to_parquets,
+    get_arrow_schema,
+    get_dataset_part_file,
+    get_dataset_partition,
+    get_first_file_date,
+    get_new_data_files,
+    get_parquet_data_files,
+    get_restored_dtypes,
+    get_serial_number_buckets,
+    parquet_to_dataframe,
+    reconvert_parquets,
+    restore_smart_dtypes,
+)
+from bbdata_survival import SURVIVAL_BUCKET_DAYS, create_survival_file
+
+RESULT_FORMATS = ['csv', 'parquet']
+PROFILE_REPORT = PROCESS_DIR + 'profile.json'
+DEFAULT_OPTIONS = {
+    'compression': None,
+    'optimized': False,
+    'layout': 'daily',
+    'workers': DEFAULT_WORKERS,
+    'stream': False,
+    'output': 'csv',
+    'survival': None,
+    'prefetch': DEFAULT_PREFETCH,
+}
+
+
+def get_start_files(sn_dict, lifecycle_index):
     """Return serial numbers first appearance in data files."""
     print('\n---Looking for start file...---')
     data_files = get_parquet_data_files()
-    process_file_name = f'start_file_{data_files[0][:10]}.json'
+    first_seen = lifecycle_index.set_index('serial_number')['first_seen']
 
-    # Get Info from old run
-    if os.path.isfile(PROCESS_DIR + process_file_name):
-        print(f'Found process file : {process_file_name}')
-        with open(PROCESS_DIR + process_file_name, 'r', encoding='utf-8') as process_file:
-            sn_dict = json.load(process_file)
-
-    else:
-        for serial_number, sn_info in sn_dict.items():
-            sn_info['start_file'] = None
-        sn_not_computed = list(sn_dict.keys())
-
-        # Compute start file for SNs that were not found in the process file
-
-        print(f'\n{len(sn_not_computed)} still not computed')
-        print('\nGetting start file')
-        for data_file in tqdm(data_files):
-            sn_found_list = get_start_files_process(sn_not_computed, data_file)
-            for sn_found in sn_found_list:
-                sn_not_computed.remove(sn_found)
-                sn_info = sn_dict[sn_found]
-                if sn_info['start_file'] is None or datetime.strptime(
-                    data_file[:10], '%Y-%m-%d'
-                ) < datetime.strptime(sn_info['start_file'][:10], '%Y-%m-%d'):
-                    sn_info['start_file'] = data_file
-
-        # Saving for next run
-        os.makedirs('process', exist_ok=True)
-        with open(PROCESS_DIR + process_file_name, 'w', encoding='utf-8') as process_file:
-            json.dump(sn_dict, process_file)
+    for serial_number, sn_info in sn_dict.items():
+        sn_info['start_file'] = first_seen[serial_number] + '.parquet'
 
     # Remove SNs that have their start file in the first data file
     sn_dict = {
@@ -139,54 +105,277 @@ def get_start_files(sn_dict):
     return sn_dict
 
 
-def get_start_files_process(sn_to_process, data_file):
-    """Return serial number first appearance in data files."""
-    dataframe = parquet_to_dataframe(data_file)
-    existing_serial_numbers = dataframe['serial_number'].values
-    sn_found = list(set(sn_to_process) & set(existing_serial_numbers))
-
-    return sn_found
-
-
 def parse_file(file_path, serial_numbers):
     """Parse input csv file from BackBlaze."""
-    dataframe = parquet_to_dataframe(file_path)
-    mask = dataframe['serial_number'].isin(serial_numbers)
-    results_df = dataframe.loc[mask]
+    results_df = parquet_to_dataframe(
+        file_path, filters=[('serial_number', 'in', list(serial_numbers))]
+    )
 
     if results_df.empty:
         return None
-    return results_df
+    return restore_smart_dtypes(results_df)
+
+
+def parse_dataset_part(part_file, requested_df):
+    """Parse the requested (serial_number, date) rows of a dataset part file."""
+    results_df = parquet_to_dataframe(
+        part_file,
+        filters=[
+            ('serial_number', 'in', requested_df['serial_number'].unique().tolist()),
+            ('date', 'in', requested_df['date'].unique().tolist()),
+        ],
+        directory=DATASET_DIR,
+    )
+    results_df = results_df.merge(requested_df, on=['serial_number', 'date'])
+
+    if results_df.empty:
+        return None
+    return restore_smart_dtypes(results_df)
+
+
+def get_dataset_parts_to_open(files_to_open):
+    """Group (serial_number, file) pairs to open by dataset part file, as (serial_number, date)."""
+    requested_df = pd.DataFrame(
+        {'serial_number': files_to_open['serial_number'], 'date': files_to_open['file'].str[:10]}
+    )
+    buckets = get_serial_number_buckets(requested_df['serial_number'])
+    part_files = [
+        get_dataset_part_file(get_dataset_partition(day), bucket)
+        for day, bucket in zip(requested_df['date'], buckets)
+    ]
+    return dict(tuple(requested_df.groupby(part_files)))
+
+
+def resolve_plan(plan, data_files, serial_index) -> pd.DataFrame:
+    """Return the (serial_number, file) pairs to open of a plan of date intervals.
+
+    Intervals are resolved against the sorted data files with a binary search,
+    then expanded to one pair per existing data file in the interval. Pairs are
+    expanded and deduplicated as (serial id, file position) integers, serial_index
+    being the serial number dictionary (see bbdata_serials).
+    """
+    serial_index, serial_ids = intern_serial_numbers(serial_index, plan['serial_number'])
+    days = np.array([data_file[:10] for data_file in data_files])
+    first_indexes = np.searchsorted(days, plan['start'].to_numpy(dtype=days.dtype), 'left')
+    last_indexes = np.searchsorted(days, plan['end'].to_numpy(dtype=days.dtype), 'right')
+
+    lengths = np.maximum(last_indexes - first_indexes, 0)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    pairs = pd.DataFrame(
+        {
+            'serial_id': np.repeat(serial_ids, lengths),
+            'file_idx': np.repeat(first_indexes, lengths) + offsets,
+        }
+    ).drop_duplicates(ignore_index=True)
+    return pd.DataFrame(
+        {
+            'serial_number': serial_index[pairs['serial_id'].to_numpy()],
+            'file': np.asarray(data_files)[pairs['file_idx'].to_numpy()],
+        }
+    )
+
+
+def get_parse_tasks(files_to_parse, layout='daily'):
+    """Return parse tasks of (serial_number, file) pairs and the parquet files they read."""
+    if layout == 'dataset':
+        parts_to_open = get_dataset_parts_to_open(files_to_parse)
+        tasks = [
+            (parse_dataset_part, part_file, requested_df)
+            for part_file, requested_df in parts_to_open.items()
+        ]
+        return tasks, [DATASET_DIR + part_file for part_file in parts_to_open]
+
+    files_to_parse = files_to_parse.groupby('file', sort=True)['serial_number']
+    tasks = [
+        (parse_file, filename, serial_numbers.tolist())
+        for filename, serial_numbers in files_to_parse
+    ]
+    return tasks, [PARQUET_DIR + filename for filename, _ in files_to_parse]
+
+
+def get_next_part_prefix(process_dir_name):
+    """Return the prefix of the next part file of the parsed data folder."""
+    os.makedirs(PROCESS_DIR + process_dir_name, exist_ok=True)
+    part_prefixes = {file_name[:9] for file_name in os.listdir(PROCESS_DIR + process_dir_name)}
+    return f'part-{len(part_prefixes):04d}'
+
 
+def write_parsed_part(tasks, process_dir_name, workers=DEFAULT_WORKERS, prefetch=DEFAULT_PREFETCH):
+    """Parse files and write all extracted rows to one part file.
 
-def parse_files(files_to_open):
-    """Parse input csv files from BackBlaze."""
+    Return the part file name, or None if no row was extracted.
+    """
+    results_list = [data for data in map_tasks(tasks, workers, prefetch) if data is not None]
+    if not results_list:
+        return None
+
+    results_df = pd.concat(results_list, ignore_index=True)
+    results_df['date'] = pd.to_datetime(results_df['date'])
+    del results_list  # Free ram
+    part_name = get_next_part_prefix(process_dir_name) + '.parquet'
+    # Needs a lot of ram. You should increase SWAP size before using the program.
+    results_df.to_parquet(PROCESS_DIR + process_dir_name + part_name)
+    record_write(PROCESS_DIR + process_dir_name + part_name, len(results_df))
+    return part_name
+
+
+def write_parsed_buckets(
+    tasks, process_dir_name, dtypes, workers=DEFAULT_WORKERS, prefetch=DEFAULT_PREFETCH
+):
+    """Parse files and append extracted rows to one part file per serial number bucket.
+
+    Rows are appended as files are parsed, so memory is bounded by the files being
+    parsed and one row group buffer per bucket. Return the part file name of each bucket.
+    """
+    part_prefix = get_next_part_prefix(process_dir_name)
+    schema = get_arrow_schema(dtypes)
+    writers = {}
+    buffers = {}
+    part_names = {}
+    row_counts = {}
+
+    def flush(bucket):
+        if bucket not in writers:
+            part_names[bucket] = f'{part_prefix}-b{bucket:02d}.parquet'
+            writers[bucket] = pq.ParquetWriter(
+                PROCESS_DIR + process_dir_name + part_names[bucket], schema
+            )
+        table = pa.Table.from_pandas(
+            pd.concat(buffers.pop(bucket), ignore_index=True), schema=schema, preserve_index=False
+        )
+        writers[bucket].write_table(table)
+        row_counts[bucket] = row_counts.get(bucket, 0) + table.num_rows
+
+    for data in imap_tasks(tasks, workers, prefetch):
+        if data is None:
+            continue
+        data = cast_to_dtypes(data, dtypes)
+        buckets = get_serial_number_buckets(data['serial_number'], STREAM_BUCKETS)
+        for bucket, bucket_df in data.groupby(buckets):
+            buffers.setdefault(bucket, []).append(bucket_df)
+            if sum(len(buffer_df) for buffer_df in buffers[bucket]) >= ROW_GROUP_SIZE:
+                flush(bucket)
+
+    for bucket in list(buffers):
+        flush(bucket)
+    for bucket, writer in writers.items():
+        writer.close()
+        record_write(PROCESS_DIR + process_dir_name + part_names[bucket], row_counts[bucket])
+
+    return part_names
+
+
+def read_parsed_data(process_dir_name, parts):
+    """Read back the serial numbers rows of parsed data part files."""
+    parsed_dfs = []
+    for part_name, serial_numbers in sorted(parts.items()):
+        parsed_dfs.append(
+            pd.read_parquet(
+                PROCESS_DIR + process_dir_name + part_name,
+                filters=[('serial_number', 'in', serial_numbers)],
+            )
+        )
+        record_read(PROCESS_DIR + process_dir_name + part_name, len(parsed_dfs[-1]))
+    return pd.concat(parsed_dfs, ignore_index=True)
+
+
+def iter_parsed_data(process_dir_name, parts):
+    """Read back the serial numbers rows of parsed data part files, one bucket at a time."""
+    bucket_parts = {}
+    for part_name, serial_numbers in parts.items():
+        buckets = get_serial_number_buckets(serial_numbers, STREAM_BUCKETS)
+        for bucket, serial_number in zip(buckets, serial_numbers):
+            bucket_parts.setdefault(bucket, {}).setdefault(part_name, []).append(serial_number)
+
+    for bucket in sorted(bucket_parts):
+        yield read_parsed_data(process_dir_name, bucket_parts[bucket])
+
+
+def get_parsed_serial_numbers(data_files, serial_numbers, process_dir_name):
+    """Return the plan signature and part file of the serial numbers already parsed.
+
+    Parsed data is only reused if data files were only added after the last run:
+    otherwise, the part files of the parsed data folder are removed with their state.
+    """
+    parsed_files = get_stage_files('parsed_data')
+    new_files = get_new_data_files(parsed_files, data_files)
+    if new_files is not None and all(new_file > parsed_files[-1] for new_file in new_files):
+        return get_parsed(serial_numbers)
+    clear_parsed()
+    shutil.rmtree(PROCESS_DIR + process_dir_name, ignore_errors=True)
+    return {}
+
+
+def parse_files(
+    plan, layout='daily', workers=DEFAULT_WORKERS, stream=False, prefetch=DEFAULT_PREFETCH
+):
+    """Parse input csv files from BackBlaze, for the date intervals of a plan.
+
+    Extracted rows are stored in part files of the parsed data folder. Serial numbers
+    already extracted with the same plan are read back, only the others are parsed.
+    In stream mode, rows are written as they are extracted and read back one serial
+    number bucket at a time: an iterator of dataframes is returned.
+    When parsed serially, the next prefetch files are read while the current one is parsed.
+    """
     data_files = get_parquet_data_files()
-    process_file_name = f'parsed_data_{data_files[0][:10]}.parquet'
+    process_dir_name = f'parsed_data_{data_files[0][:10]}/'
     print('\n---Opening files to get history---')
 
+    requested = set(plan['serial_number'])
+    planned = get_plan_signatures(requested)
+    parsed = get_parsed_serial_numbers(data_files, requested, process_dir_name)
+    to_parse = {
+        serial_number
+        for serial_number in requested
+        if serial_number not in parsed
+        or parsed[serial_number]['signature'] != planned.get(serial_number)
+    }
+
     # Get Info from old run
-    if os.path.isfile(PROCESS_DIR + process_file_name):
-        # with open(PROCESS_DIR + process_file_name, 'rb') as process_file:
-        print(f'Found process file : {process_file_name}')
-        results_df = pd.read_parquet(PROCESS_DIR + process_file_name)
-    else:
-        results_list = []
-        for filename, serial_numbers in tqdm(files_to_open.items()):
-            data = parse_file(filename, serial_numbers)
-            if data is not None:
-                results_list.append(data)
-        if not results_list:
-            print('Parsing failed. No data available')
-            return None
+    if len(to_parse) < len(requested):
+        print(f'Found process file : {process_dir_name}')
+        record_cache_hit()
+
+    if to_parse:
+        tasks, parquet_paths = get_parse_tasks(
+            resolve_plan(
+                plan[plan['serial_number'].isin(to_parse)], data_files, load_serial_dictionary()
+            ),
+            layout,
+        )
 
-        results_df = pd.concat(results_list, ignore_index=True)
-        results_df['date'] = pd.to_datetime(results_df['date'])
-        del results_list  # Free ram
-        # Needs a lot of ram. You should increase SWAP size before using the program.
-        results_df.to_parquet(PROCESS_DIR + process_file_name)
+        if stream:
+            bucket_part_names = write_parsed_buckets(
+                tasks, process_dir_name, get_restored_dtypes(parquet_paths), workers, prefetch
+            )
+            buckets = get_serial_number_buckets(list(to_parse), STREAM_BUCKETS)
+            part_names = {
+                serial_number: bucket_part_names.get(bucket)
+                for serial_number, bucket in zip(to_parse, buckets)
+            }
+        else:
+            part_name = write_parsed_part(tasks, process_dir_name, workers, prefetch)
+            part_names = dict.fromkeys(to_parse, part_name)
+
+        newly_parsed = {
+            serial_number: {'signature': planned[serial_number], 'part': part_names[serial_number]}
+            for serial_number in to_parse
+        }
+        save_parsed(newly_parsed)
+        set_stage_files('parsed_data', data_files)
+        parsed.update(newly_parsed)
+
+    parts = {}
+    for serial_number in requested:
+        if parsed[serial_number]['part'] is not None:
+            parts.setdefault(parsed[serial_number]['part'], []).append(serial_number)
+    if not parts:
+        print('Parsing failed. No data available')
+        return None
 
-    return results_df
+    if stream:
+        return iter_parsed_data(process_dir_name, parts)
+    return read_parsed_data(process_dir_name, parts)
 
 
 def merge_lists(list1, list2):
@@ -196,95 +385,33 @@ def merge_lists(list1, list2):
     return merged_list
 
 
-def get_failed_serial_number_from_file(file):
-    """Get failed serial numbers list from file."""
-    serial_numbers = []
-
-    dataframe = parquet_to_dataframe(file)
-    failures_dataframe = dataframe[(dataframe['failure'] == 1)]
-    for index, _ in failures_dataframe.iterrows():
-        serial_numbers.append(dataframe.iloc[index]['serial_number'])
-
-    return serial_numbers
-
-
-def get_failed_serial_number_from_files(files_to_process):
-    """Check failures presence in dataframe."""
-    sn_dict = {}
-    data_files = get_parquet_data_files()
-    process_file_name = f'failed_sn_{data_files[0][:10]}.json'
+def get_failed_serial_number_from_files(lifecycle_index, files_to_process):
+    """Return failed serial numbers with their last failure file among files_to_process."""
     print('\n---Getting failed sn...---')
+    days = [file[:10] for file in files_to_process]
 
-    # Get Info from old run
-    if os.path.isfile(PROCESS_DIR + process_file_name):
-        print(f'Found process file : {process_file_name}')
-        with open(PROCESS_DIR + process_file_name, 'r', encoding='utf-8') as process_file:
-            sn_dict = json.load(process_file)
-    else:
-        for file in tqdm(files_to_process):
-            serial_numbers = get_failed_serial_number_from_file(file)
-            if serial_numbers:
-                for serial_number in serial_numbers:
-                    if serial_number not in sn_dict:
-                        sn_dict[serial_number] = {'file': file}
-                    elif isinstance(sn_dict[serial_number], str):
-                        sn_dict[serial_number] = {'file': file}
-                    elif datetime.fromisoformat(
-                        sn_dict[serial_number]['file'][:10]
-                    ) < datetime.fromisoformat(file[:10]):
-                        sn_dict[serial_number]['file'] = file
-
-        # Saving for next run
-        with open(PROCESS_DIR + process_file_name, 'w', encoding='utf-8') as process_file:
-            json.dump(sn_dict, process_file, indent=4)
+    failures = lifecycle_index[['serial_number', 'failure_dates']].explode('failure_dates')
+    failures = failures[failures['failure_dates'].isin(days)]
+    last_failures = failures.groupby('serial_number')['failure_dates'].max()
+    sn_dict = {
+        serial_number: {'file': day + '.parquet'} for serial_number, day in last_failures.items()
+    }
 
     print(f'\n{len(sn_dict)} serial numbers found')
     return sn_dict
 
 
-def get_sn_from_file(file, sns_to_check):
-    """Get present sn from data file."""
-    dataframe = parquet_to_dataframe(file)
-    mask = dataframe['serial_number'].isin(sns_to_check)
-    strange_serial_numbers = dataframe.loc[mask]['serial_number'].tolist()
-
-    return strange_serial_numbers
-
-
-def remove_strange_behaviors(sn_dict: dict):
+def remove_strange_behaviors(sn_dict: dict, lifecycle_index):
     """Remove strange failure behaviors from sn_dict."""
-    data_files = get_parquet_data_files(reverse=True)
-    process_file_name = f'strange_behaviors_{data_files[-1][:10]}.json'
     print('\n---Getting strange behaviors...---')
-    sns_to_check = list(sn_dict.keys())
-
-    # Get Info from old run
-    if os.path.isfile(PROCESS_DIR + process_file_name):
-        print(f'Found process file : {process_file_name}')
-        with open(PROCESS_DIR + process_file_name, 'r', encoding='utf-8') as process_file:
-            sn_dict = json.load(process_file)
-    else:
+    lifecycle_index = lifecycle_index.set_index('serial_number')
 
-        for val in sn_dict.values():
-            val['strange'] = None
-
-        # Checking if some disks are still ok after a failure, removing them if so
-        for file in tqdm(data_files):
-            candidates = get_sn_from_file(file, sns_to_check)
-            if candidates:
-                for serial_number in candidates:
-                    if datetime.fromisoformat(
-                        sn_dict[serial_number]['file'][:10]
-                    ) < datetime.fromisoformat(file[:10]):
-                        sn_dict[serial_number]['strange'] = file
-                        # print(f"{serial_number} died on {sn_dict[serial_number]['file']} but still working on {file}")
-                    sns_to_check.remove(serial_number)
-
-        # Saving for next run
-        with open(PROCESS_DIR + process_file_name, 'w', encoding='utf-8') as process_file:
-            json.dump(sn_dict, process_file, indent=4)
+    # Checking if some disks are still ok after a failure, removing them if so
+    for serial_number, sn_info in sn_dict.items():
+        sn_info['strange'] = None
+        if lifecycle_index.at[serial_number, 'seen_after_failure']:
+            sn_info['strange'] = lifecycle_index.at[serial_number, 'last_seen'] + '.parquet'
 
-    # Remove SNs that have their start file in the first data file
     sn_dict = {
         serial_number: sn_info
         for serial_number, sn_info in sn_dict.items()
@@ -295,55 +422,87 @@ def remove_strange_behaviors(sn_dict: dict):
     return sn_dict
 
 
-def get_files_to_open(sn_dict, history_length_recent, history_length_old):
-    """Return list of files to open."""
-    print('\n---Getting files to open---')
-    data_files = get_parquet_data_files()
-    process_file_name = f'files_to_open_{data_files[0][:10]}.json'
-    files_to_open = {}
-
-    if os.path.isfile(PROCESS_DIR + process_file_name):
-        with open(PROCESS_DIR + process_file_name, 'r', encoding='utf-8') as process_file:
-            print(f'Found process file : {process_file_name}')
-            return json.load(process_file)
+def get_plan_intervals(sn_dict, history_length_recent, history_length_old) -> pd.DataFrame:
+    """Return the date intervals (start and end included) of history to get for each disk."""
+    serial_numbers = list(sn_dict.keys())
+    failure_dates = pd.to_datetime([sn_dict[sn]['file'][:10] for sn in serial_numbers])
+    start_dates = pd.to_datetime([sn_dict[sn]['start_file'][:10] for sn in serial_numbers])
 
     if history_length_recent == 0 or history_length_old == 0:
         print('Getting all data from all files for each failure.')
-        for serial_number, info_dict in tqdm(sn_dict.items()):
-            start_date = datetime.strptime(info_dict['start_file'][:10], '%Y-%m-%d')
-            failure_date = datetime.strptime(info_dict['file'][:10], '%Y-%m-%d')
-            delta = failure_date - start_date
-            for idx in range(delta.days + 1):
-                file_to_open = (start_date + timedelta(days=idx)).strftime('%Y-%m-%d') + '.parquet'
-                if file_to_open in data_files:
-                    files_to_open.setdefault(file_to_open, []).append(serial_number)
+        windows = [(start_dates, failure_dates)]
     else:
-        for serial_number, info_dict in tqdm(sn_dict.items()):
+        windows = [
             # Most recent history
-            failure_date = datetime.strptime(info_dict['file'][:10], '%Y-%m-%d')
-            for idx in range(history_length_recent):
-                file_to_open = (failure_date - timedelta(days=idx)).strftime(
-                    '%Y-%m-%d'
-                ) + '.parquet'
-                if file_to_open in data_files:
-                    files_to_open.setdefault(file_to_open, []).append(serial_number)
-
+            (failure_dates - pd.Timedelta(days=history_length_recent - 1), failure_dates),
             # Older history
-            start_date = datetime.strptime(info_dict['start_file'][:10], '%Y-%m-%d')
-            for idx in range(history_length_old):
-                file_to_open = (start_date + timedelta(days=idx)).strftime('%Y-%m-%d') + '.parquet'
-                if file_to_open in data_files:
-                    if file_to_open in files_to_open:
-                        files_to_open[file_to_open].append(serial_number)
-                    else:
-                        files_to_open[file_to_open] = [serial_number]
+            (start_dates, start_dates + pd.Timedelta(days=history_length_old - 1)),
+        ]
+
+    return pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    'serial_number': serial_numbers,
+                    'start': start.strftime('%Y-%m-%d'),
+                    'end': end.strftime('%Y-%m-%d'),
+                }
+            )
+            for start, end in windows
+        ],
+        ignore_index=True,
+    )
+
 
-    with open(PROCESS_DIR + process_file_name, 'w', encoding='utf-8') as process_file:
-        json.dump(files_to_open, process_file, indent=4)
+def count_plan_files(plan, data_files):
+    """Return the number of data files covered by a plan."""
+    days = np.array([data_file[:10] for data_file in data_files])
+    coverage = np.zeros(len(days) + 1, dtype=np.int64)
+    np.add.at(coverage, np.searchsorted(days, plan['start'].to_numpy(dtype=days.dtype)), 1)
+    np.add.at(coverage, np.searchsorted(days, plan['end'].to_numpy(dtype=days.dtype), 'right'), -1)
+    return int(np.count_nonzero(np.cumsum(coverage)[:-1] > 0))
+
+
+def get_files_to_open(sn_dict, history_length_recent, history_length_old):
+    """Return the plan of files to open, as date intervals per serial number.
 
-    print(f'{len(files_to_open.keys())} files to open')
+    Plans are kept in the process state: only serial numbers not planned yet with the
+    same failure file, start file and history lengths are planned again.
+    """
+    print('\n---Getting files to open---')
+    data_files = get_parquet_data_files()
+    signatures = {
+        serial_number: (
+            info_dict['file'],
+            info_dict['start_file'],
+            history_length_recent,
+            history_length_old,
+        )
+        for serial_number, info_dict in sn_dict.items()
+    }
+    planned = get_plan_signatures(signatures)
+    if planned:
+        print(f'Found {len(planned)} plans in process state')
+        record_cache_hit()
+
+    sn_to_plan = {
+        serial_number: sn_dict[serial_number]
+        for serial_number, signature in signatures.items()
+        if planned.get(serial_number) != signature
+    }
+    if sn_to_plan:
+        # Outdated plans of serial numbers planned again are replaced
+        save_plans(
+            {serial_number: signatures[serial_number] for serial_number in sn_to_plan},
+            get_plan_intervals(sn_to_plan, history_length_recent, history_length_old),
+        )
 
-    return files_to_open
+    # Only open files for the serial numbers to process now
+    plan = get_plans(sn_dict)
+
+    print(f'{count_plan_files(plan, data_files)} files to open')
+
+    return plan
 
 
 def create_csv_file(serial_number, sn_dict, disk_df):
@@ -361,23 +520,70 @@ def create_csv_file(serial_number, sn_dict, disk_df):
         sep='\t',
         decimal=',',
     )
+    record_write(result_path + result_filename, len(disk_df))
 
 
-def create_csv_files(sn_dict, results_df):
+def create_csv_files(sn_dict, results_df, workers=DEFAULT_WORKERS):
     """Generate csv files."""
     print('\n---Creating csv files...---')
-    with ProcessPoolExecutor(max_workers=mp.cpu_count()) as executor:
-        futures = [
-            executor.submit(
+    map_tasks(
+        [
+            (
                 create_csv_file,
                 serial_number,
-                sn_dict,
+                {serial_number: sn_dict[serial_number]} if serial_number in sn_dict else {},
                 disk_df,
             )
             for serial_number, disk_df in results_df.groupby('serial_number')
-        ]
-        for _ in tqdm(as_completed(futures), total=len(futures)):
-            pass
+        ],
+        workers,
+    )
+
+
+def get_stored_result_filenames():
+    """Return result filenames of the disks already in the columnar result store."""
+    result_path = f'results/{get_first_file_date()}_store/'
+    if not os.path.isdir(result_path):
+        return set()
+    return {
+        result_filename
+        for part_file in os.listdir(result_path)
+        if part_file.endswith('.parquet')
+        for result_filename in pd.read_parquet(
+            result_path + part_file, columns=['result_filename']
+        )['result_filename'].unique()
+    }
+
+
+def create_store_file(sn_dict, results_df):
+    """Append disks history to the columnar result store.
+
+    The store is a folder of parquet part files with typed columns, keyed by serial
+    number: rows are sorted by serial number then by date (most recent first) and
+    the result_filename column gives the name the csv file of the disk would have.
+    """
+    print('\n---Writing result store...---')
+    result_path = f'results/{get_first_file_date()}_store/'
+    result_filenames = {
+        serial_number: sn_info['result_filename']
+        for serial_number, sn_info in sn_dict.items()
+        if sn_info['result_filename'] is not None
+    }
+    results_df = results_df[results_df['serial_number'].isin(result_filenames)]
+    if results_df.empty:
+        return
+
+    results_df = results_df.assign(
+        result_filename=results_df['serial_number'].map(result_filenames)
+    ).sort_values(['serial_number', 'date'], ascending=[True, False], ignore_index=True)
+    os.makedirs(result_path, exist_ok=True)
+    part_count = len([part for part in os.listdir(result_path) if part.endswith('.parquet')])
+    results_df.to_parquet(
+        result_path + f'part-{part_count:04d}.parquet',
+        index=False,
+        row_group_size=ROW_GROUP_SIZE,
+    )
+    record_write(result_path + f'part-{part_count:04d}.parquet', len(results_df))
 
 
 def set_result_filename(sn_dict, history_length_recent, history_length_old):
@@ -400,10 +606,47 @@ def set_result_filename(sn_dict, history_length_recent, history_length_old):
     return sn_dict
 
 
-def process(history_length_recent, history_length_old, failure_start_date):
-    """Process data_files."""
+def remove_processed_serial_numbers(sn_dict, output='csv'):
+    """Remove serial numbers without result filename or whose result already exists."""
+    stored_result_filenames = get_stored_result_filenames() if output == 'parquet' else set()
+    for serial_number in list(sn_dict.keys()).copy():
+        if sn_dict[serial_number]['result_filename'] is None:
+            del sn_dict[serial_number]
+        elif sn_dict[serial_number]['result_filename'] in stored_result_filenames:
+            del sn_dict[serial_number]
+        elif output == 'csv' and os.path.isfile(
+            f'results/{get_first_file_date()}/' + sn_dict[serial_number]['result_filename']
+        ):
+            del sn_dict[serial_number]
+    return sn_dict
+
+
+def display_process_range(data_files, failure_start_date):
+    """Display the data files computed and where failures are looked for."""
+    text1 = f'Computing files from {data_files[-1][:10]} to {data_files[0][:10]}'
+    text2 = f'Looking for failures from {failure_start_date} to {data_files[0][:10]}'
+    line = '-' * max(len(text1), len(text2))
+    print(line)
+    print(text1)
+    print(text2)
+    print(line)
+
+
+def process(history_length_recent, history_length_old, failure_start_date, **options):
+    """Process data_files.
+
+    options override DEFAULT_OPTIONS: parquet conversion (compression, optimized),
+    data layout, number of workers, streamed extraction, output format, age bucket
+    (in days) of the fleet survival, if wanted, and number of files read ahead.
+    """
     # Variables
-    convert_csvs_to_parquets()
+    options = {**DEFAULT_OPTIONS, **options}
+    layout, workers, output = options['layout'], options['workers'], options['output']
+    with profile_stage('conversion'):
+        convert_csvs_to_parquets(options['compression'], options['optimized'], workers)
+    if layout == 'dataset':
+        with profile_stage('compaction'):
+            compact_parquet_files(options['compression'], workers)
     data_files = get_parquet_data_files(True)
     files_to_process = data_files
     try:
@@ -412,63 +655,67 @@ def process(history_length_recent, history_length_old, failure_start_date):
         print(f'Error with arg :{failure_start_date}')
 
     # Display
-    text1 = f'Computing files from {data_files[-1][:10]} to {data_files[0][:10]}'
-    text2 = f'Looking for failures from {failure_start_date} to {data_files[0][:10]}'
-    line = '-' * max(len(text1), len(text2))
-    print(line)
-    print(text1)
-    print(text2)
-    print(line)
+    display_process_range(data_files, failure_start_date)
+
+    # Index serial numbers lifecycle in a single scan
+    with profile_stage('lifecycle_index'):
+        lifecycle_index = get_lifecycle_index(layout, workers, options['prefetch'])
+    if options['survival']:
+        with profile_stage('survival'):
+            create_survival_file(lifecycle_index, options['survival'])
 
     # Get failed serial-numbers
-    sn_dict = get_failed_serial_number_from_files(files_to_process)
+    with profile_stage('failed_sn_scan'):
+        sn_dict = get_failed_serial_number_from_files(lifecycle_index, files_to_process)
     if not sn_dict:
         print('No sn found !')
         sys.exit(1)
 
     # look for first apparition date
-    sn_dict = get_start_files(sn_dict)
+    with profile_stage('start_files'):
+        sn_dict = get_start_files(sn_dict, lifecycle_index)
 
     # Remove strange behaviors (failure but disk still working ??)
-    sn_dict = remove_strange_behaviors(sn_dict)
+    with profile_stage('strange_behaviors'):
+        sn_dict = remove_strange_behaviors(sn_dict, lifecycle_index)
 
     # Set result filename
     sn_dict = set_result_filename(sn_dict, history_length_recent, history_length_old)
 
     # Skip all serial numbers already processed
-    for serial_number in list(sn_dict.keys()).copy():
-        if sn_dict[serial_number]['result_filename'] is None:
-            del sn_dict[serial_number]
-        elif os.path.isfile(
-            f'results/{data_files[-1][:10]}/' + sn_dict[serial_number]['result_filename']
-        ):
-            del sn_dict[serial_number]
+    with profile_stage('processed_results'):
+        sn_dict = remove_processed_serial_numbers(sn_dict, output)
     if not bool(sn_dict):
         print('\nAll serial numbers csv files exist in result folder\n\n')
         sys.exit(1)
 
     # Which files do we need to open now ?
-    files_to_open = get_files_to_open(
-        sn_dict,
-        history_length_recent,
-        history_length_old,
-    )
+    with profile_stage('planning'):
+        plan = get_files_to_open(
+            sn_dict,
+            history_length_recent,
+            history_length_old,
+        )
 
     # Parsing files to get history
-    results_df = parse_files(files_to_open)
-    if results_df is None:
+    with profile_stage('extraction'):
+        results = parse_files(plan, layout, workers, options['stream'], options['prefetch'])
+    if results is None:
         sys.exit(1)
 
-    # Create csv files
-    create_csv_files(sn_dict, results_df)
+    # Create csv files (in stream mode, extraction is read back bucket by bucket here)
+    with profile_stage('export'):
+        for results_df in results if options['stream'] else [results]:
+            if output == 'parquet':
+                create_store_file(sn_dict, results_df)
+            else:
+                create_csv_files(sn_dict, results_df, workers)
 
     print('\n\n')
 
 
-def main():
-    """Entry point."""
-    # Handle args
-    parser = argparse.ArgumentParser(description='BackBlaze data parser.')
+def add_history_arguments(parser):
+    """Add the lengths of the extracted history to the parser of a script."""
     parser.add_argument(
         '--history_length_recent',
         type=int,
@@ -481,20 +728,128 @@ def main():
         default=30,
         help='Entier représentant la longueur de l\'historique plus ancien',
     )
+
+
+def main():
+    """Entry point."""
+    # Handle args
+    parser = argparse.ArgumentParser(description='BackBlaze data parser.')
+    add_history_arguments(parser)
     parser.add_argument(
         '--failure_start_date',
         type=str,
         default=None,
         help='A partir de quelle date commencer la recherche de failures ? (format YYYY-mm-dd)',
     )
+    add_storage_arguments(parser)
+    parser.add_argument(
+        '--reconvert_parquet',
+        action='store_true',
+        help='Réécrit les fichiers parquet existants avec les options de conversion',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help='Nombre de processus utilisés pour lire les fichiers (1 pour un traitement séquentiel)',
+    )
+    parser.add_argument(
+        '--executor',
+        type=str,
+        default='process',
+        choices=EXECUTOR_BACKENDS,
+        help='Exécution des tâches par fichier : séquentielle (serial), processus locaux '
+        '(process) ou file de tâches partagée avec les workers d\'autres machines (queue)',
+    )
+    parser.add_argument(
+        '--queue_dir',
+        type=str,
+        default=QUEUE_DIR,
+        help='Répertoire de la file de tâches (--executor queue), partagé entre les machines',
+    )
+    parser.add_argument(
+        '--stream_output',
+        action='store_true',
+        help='Écrit l\'historique extrait au fil de la lecture (mémoire bornée, sans SWAP)',
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='csv',
+        choices=RESULT_FORMATS,
+        help='Un fichier CSV par disque (csv) ou un stockage parquet unique par numéro de série',
+    )
+    parser.add_argument(
+        '--survival',
+        action='store_true',
+        help='Calcule la survie (Kaplan-Meier) et le taux de panne de tous les disques par âge',
+    )
+    parser.add_argument(
+        '--survival_bucket_days',
+        type=int,
+        default=SURVIVAL_BUCKET_DAYS,
+        help='Largeur (en jours d\'âge) des intervalles de la survie',
+    )
+
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=DEFAULT_PREFETCH,
+        help='Nombre de fichiers lus à l\'avance (en arrière-plan) pendant le traitement du '
+        'fichier courant, 0 pour désactiver la lecture anticipée',
+    )
+    parser.add_argument(
+        '--arrow_cache',
+        type=int,
+        default=0,
+        help=f'Taille maximale en Mo du cache Arrow ({ARROW_CACHE_DIR}) des colonnes lues dans les '
+        'fichiers parquet, relu sans décodage par projection mémoire, 0 pour le désactiver',
+    )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        nargs='?',
+        const=PROFILE_REPORT,
+        default=None,
+        help=f'Mesure chaque étape (temps, CPU, mémoire, lectures, écritures, latence par fichier) '
+        f'et écrit le rapport json dans le fichier donné ({PROFILE_REPORT} par défaut)',
+    )
+    parser.add_argument(
+        '--profile_stage',
+        type=str,
+        default=None,
+        help='Étape profilée avec cProfile (fichier .prof à côté du rapport), ex : extraction',
+    )
 
     args = parser.parse_args()
 
     os.makedirs(PROCESS_DIR, exist_ok=True)
+    if args.profile:
+        enable_profiling(args.profile, args.profile_stage)
+    if args.arrow_cache:
+        configure_arrow_cache(args.arrow_cache * 1024 * 1024)
+    configure_executor(args.executor, args.queue_dir)
+    if args.executor == 'queue':
+        os.makedirs(args.queue_dir, exist_ok=True)
     os.makedirs(CSV_DIR, exist_ok=True)
     os.makedirs(PARQUET_DIR, exist_ok=True)
 
-    process(args.history_length_recent, args.history_length_old, args.failure_start_date)
+    if args.reconvert_parquet:
+        reconvert_parquets(args.parquet_compression, args.optimized_parquet, args.workers)
+
+    process(
+        args.history_length_recent,
+        args.history_length_old,
+        args.failure_start_date,
+        compression=args.parquet_compression,
+        optimized=args.optimized_parquet,
+        layout=args.layout,
+        workers=args.workers,
+        stream=args.stream_output,
+        output=args.output,
+        survival=args.survival_bucket_days if args.survival else None,
+        prefetch=args.prefetch,
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,199 @@
+"""
+Created on 17 Oct. 2026.
+
+Stage profiling of the BackBlaze data parser and of graph.py.
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+IO_COUNTERS = Counter()
+IO_COUNTERS_LOCK = threading.Lock()
+PROFILE = None
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+def enable_profiling(report_path, cprofile_stage=None):
+    """Profile the stages of this run and write their report in report_path at exit.
+
+    If cprofile_stage is given, the functions called by this stage (in this process)
+    are also profiled with cProfile, in a .prof file next to the report.
+    """
+    global PROFILE  # pylint: disable=global-statement
+    PROFILE = {
+        'report_path': report_path,
+        'cprofile_stage': cprofile_stage,
+        'command': sys.argv,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'stages': [],
+        'current': None,
+    }
+    atexit.register(write_profile_report)
+
+
+def get_file_size(path):
+    """Return the size of a file in bytes, 0 if it cannot be read."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def record_read(path, rows):
+    """Count a file read, with its number of rows and size."""
+    file_size = get_file_size(path)
+    with IO_COUNTERS_LOCK:
+        IO_COUNTERS.update(files_read=1, rows_read=rows, bytes_read=file_size)
+
+
+def record_write(path, rows):
+    """Count a file written, with its number of rows and size."""
+    file_size = get_file_size(path)
+    with IO_COUNTERS_LOCK:
+        IO_COUNTERS.update(files_written=1, rows_written=rows, bytes_written=file_size)
+
+
+def record_cache_hit():
+    """Count a result served from a process file or a cache instead of being computed."""
+    with IO_COUNTERS_LOCK:
+        IO_COUNTERS['cache_hits'] += 1
+
+
+def run_task(function, *args):
+    """Run a task and return its result with its duration and I/O counters.
+
+    Tasks run in worker processes: their counters are sent back with the result and
+    added to those of the parent by collect_task(). Tasks run in threads of this
+    process count directly in IO_COUNTERS.
+    """
+    before = Counter(IO_COUNTERS)
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    counters = Counter(IO_COUNTERS)
+    counters.subtract(before)
+    return result, {'pid': os.getpid(), 'seconds': seconds, 'counters': dict(+counters)}
+
+
+def collect_task(output):
+    """Record the duration and I/O counters of a task run by run_task() and return its result."""
+    result, task_stats = output
+    if PROFILE is not None and PROFILE['current'] is not None:
+        PROFILE['current']['latencies'].append(task_stats['seconds'])
+    if task_stats['pid'] != os.getpid():
+        IO_COUNTERS.update(task_stats['counters'])
+    return result
+
+
+def get_cpu_seconds():
+    """Return the CPU time (user and system) of this process and of its finished children."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def get_max_rss_mb(who):
+    """Return the peak resident memory (MB) of this process or of its finished children."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(who).ru_maxrss / unit, 2)
+
+
+def get_latency_stats(latencies):
+    """Return the percentiles and maximum (in seconds) of the task latencies of a stage."""
+    if not latencies:
+        return None
+    values = np.percentile(latencies, LATENCY_PERCENTILES)
+    return {
+        **{
+            f'p{percentile}': round(float(value), 6)
+            for percentile, value in zip(LATENCY_PERCENTILES, values)
+        },
+        'max': round(max(latencies), 6),
+    }
+
+
+@contextmanager
+def profile_stage(stage):
+    """Measure a stage when profiling is enabled, do nothing otherwise.
+
+    For each stage the report holds the wall and CPU time (children included), the
+    peak resident memory of the process and of its children so far, the files, rows
+    and bytes read and written, the task latency percentiles and whether results
+    were served from a process file or a cache.
+    """
+    if PROFILE is None:
+        yield
+        return
+
+    PROFILE['current'] = {'latencies': []}
+    profiler = cProfile.Profile() if PROFILE['cprofile_stage'] == stage else None
+    counters_before = Counter(IO_COUNTERS)
+    cpu_before = get_cpu_seconds()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(f'{os.path.splitext(PROFILE["report_path"])[0]}_{stage}.prof')
+        wall_seconds = time.perf_counter() - start
+        counters = Counter(IO_COUNTERS)
+        counters.subtract(counters_before)
+        latencies = PROFILE['current']['latencies']
+        PROFILE['current'] = None
+
+        PROFILE['stages'].append(
+            {
+                'stage': stage,
+                'wall_seconds': round(wall_seconds, 4),
+                'cpu_seconds': round(get_cpu_seconds() - cpu_before, 4),
+                'max_rss_mb': get_max_rss_mb(resource.RUSAGE_SELF),
+                'children_max_rss_mb': get_max_rss_mb(resource.RUSAGE_CHILDREN),
+                **{
+                    counter: counters[counter]
+                    for counter in [
+                        'files_read',
+                        'rows_read',
+                        'bytes_read',
+                        'files_written',
+                        'rows_written',
+                        'bytes_written',
+                        'cache_hits',
+                    ]
+                },
+                'cached': counters['cache_hits'] > 0,
+                'rows_read_per_second': (
+                    round(counters['rows_read'] / wall_seconds, 1) if wall_seconds else None
+                ),
+                'tasks': len(latencies),
+                'task_latency_seconds': get_latency_stats(latencies),
+            }
+        )
+
+
+def write_profile_report():
+    """Write the report of the profiled stages as json."""
+    if PROFILE is None or not PROFILE['stages']:
+        return
+    report = {key: PROFILE[key] for key in ['command', 'started', 'stages']}
+    report['total'] = {
+        key: round(sum(stage[key] for stage in PROFILE['stages']), 4)
+        for key in ['wall_seconds', 'cpu_seconds', 'rows_read', 'bytes_read', 'bytes_written']
+    }
+    os.makedirs(os.path.dirname(PROFILE['report_path']) or '.', exist_ok=True)
+    with open(PROFILE['report_path'], 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=4)
+    print(f'Profile saved in {PROFILE["report_path"]}')
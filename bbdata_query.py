@@ -0,0 +1,318 @@
+"""
+Created on 17 Oct. 2026.
+
+History queries: daily rows of any serial numbers, date window and columns, read through
+an index of the serial numbers and dates held by each row group of the parquet data.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from bbdata_executor import DEFAULT_PREFETCH, DEFAULT_WORKERS, map_tasks, prefetch_map
+from bbdata_lifecycle import get_lifecycle_index
+from bbdata_profiling import record_read, record_write
+from bbdata_storage import (
+    DATASET_DIR,
+    PARQUET_DIR,
+    PROCESS_DIR,
+    add_storage_arguments,
+    cast_to_dtypes,
+    get_dataset_part_files,
+    get_first_file_date,
+    get_parquet_data_files,
+    get_restored_dtypes,
+    restore_smart_dtypes,
+)
+
+HISTORY_INDEX_COLUMNS = [
+    'file',
+    'mtime_ns',
+    'row_group',
+    'first_serial_number',
+    'last_serial_number',
+    'first_date',
+    'last_date',
+]
+
+
+def get_history_index_path(layout='daily'):
+    """Return the process file of the row group index of a data layout."""
+    return PROCESS_DIR + f'history_index_{layout}_{get_first_file_date()}.parquet'
+
+
+def index_row_groups(file, layout='daily'):
+    """Return the serial number and date bounds of the row groups of a parquet file.
+
+    Bounds come from the row group statistics of the file footer: no data is read.
+    Daily files hold one day, given by their name. Bounds missing from the footer
+    are None and match every query.
+    """
+    path = (DATASET_DIR if layout == 'dataset' else PARQUET_DIR) + file
+    metadata = pq.ParquetFile(path).metadata
+    mtime_ns = os.stat(path).st_mtime_ns
+    column_indexes = {name: idx for idx, name in enumerate(metadata.schema.names)}
+    row_groups = []
+    for row_group in range(metadata.num_row_groups):
+        bounds = {}
+        for column in ['serial_number', 'date']:
+            statistics = None
+            if column in column_indexes:
+                statistics = (
+                    metadata.row_group(row_group).column(column_indexes[column]).statistics
+                )
+            has_bounds = statistics is not None and statistics.has_min_max
+            bounds[column] = (statistics.min, statistics.max) if has_bounds else (None, None)
+        if layout == 'daily':
+            bounds['date'] = (file[:10], file[:10])
+        row_groups.append((file, mtime_ns, row_group, *bounds['serial_number'], *bounds['date']))
+    return row_groups
+
+
+def get_history_index_files(layout='daily'):
+    """Return the sorted parquet files indexed for a data layout."""
+    return get_dataset_part_files() if layout == 'dataset' else get_parquet_data_files()
+
+
+def get_history_index(layout='daily', prefetch=DEFAULT_PREFETCH) -> pd.DataFrame:
+    """Return the row group index of the data files of a layout, updating it if needed.
+
+    Only the footers of files added or rewritten (e.g. dataset parts compacted again)
+    since the last update are read; removed files are dropped from the index.
+    """
+    directory = DATASET_DIR if layout == 'dataset' else PARQUET_DIR
+    files = get_history_index_files(layout)
+    mtimes = {file: os.stat(directory + file).st_mtime_ns for file in files}
+    index_path = get_history_index_path(layout)
+
+    history_index = pd.DataFrame(columns=HISTORY_INDEX_COLUMNS)
+    if os.path.isfile(index_path):
+        history_index = pd.read_parquet(index_path)
+        record_read(index_path, len(history_index))
+    # Rows of removed or rewritten files are dropped
+    up_to_date = history_index['mtime_ns'] == history_index['file'].map(mtimes)
+
+    files_to_index = sorted(set(files) - set(history_index.loc[up_to_date, 'file']))
+    if files_to_index or not up_to_date.all():
+        print(f'Indexing row groups of {len(files_to_index)} files...')
+        new_rows = [
+            row
+            for rows in prefetch_map(
+                lambda file: index_row_groups(file, layout), files_to_index, prefetch
+            )
+            for row in rows
+        ]
+        history_index = pd.concat(
+            [history_index[up_to_date], pd.DataFrame(new_rows, columns=HISTORY_INDEX_COLUMNS)],
+            ignore_index=True,
+        ).sort_values(['file', 'row_group'], ignore_index=True)
+        history_index.to_parquet(index_path, index=False)
+        record_write(index_path, len(history_index))
+    return history_index
+
+
+def get_serial_windows(
+    serial_numbers,
+    start=None,
+    end=None,
+    *,
+    layout='daily',
+    workers=DEFAULT_WORKERS,
+    prefetch=DEFAULT_PREFETCH,
+):
+    """Return the dates between which each serial number is seen, within start and end.
+
+    Dates come from the lifecycle index (first and last seen dates of each serial number,
+    see bbdata_lifecycle), updated with workers processes if needed. Unknown serial
+    numbers, or not seen between start and end, are dropped.
+    """
+    lifecycle_index = get_lifecycle_index(layout, workers, prefetch)
+    windows = lifecycle_index.loc[
+        lifecycle_index['serial_number'].isin(serial_numbers),
+        ['serial_number', 'first_seen', 'last_seen'],
+    ].rename(columns={'first_seen': 'start', 'last_seen': 'end'})
+    if start is not None:
+        windows['start'] = windows['start'].where(windows['start'] > start, start)
+    if end is not None:
+        windows['end'] = windows['end'].where(windows['end'] < end, end)
+    return windows[windows['start'] <= windows['end']].reset_index(drop=True)
+
+
+def get_row_groups_to_read(history_index, serial_windows):
+    """Return, by file, the row groups that may hold rows of serial numbers in their windows.
+
+    serial_windows gives the first and last date to read (start and end) of each serial
+    number (see get_serial_windows()). A row group is kept when one of the serial numbers
+    lies between its first and last serial numbers and its dates overlap the window of
+    this serial number.
+    """
+    first_serial_numbers = history_index['first_serial_number'].fillna('').to_numpy(dtype=str)
+    last_serial_numbers = (
+        history_index['last_serial_number'].fillna('\U0010ffff').to_numpy(dtype=str)
+    )
+    first_dates = history_index['first_date'].fillna('').to_numpy(dtype=str)
+    last_dates = history_index['last_date'].fillna('\U0010ffff').to_numpy(dtype=str)
+
+    selected = np.zeros(len(history_index), dtype=bool)
+    for serial_number, start, end in serial_windows[['serial_number', 'start', 'end']].itertuples(
+        index=False
+    ):
+        selected |= (
+            (first_serial_numbers <= serial_number)
+            & (last_serial_numbers >= serial_number)
+            & (first_dates <= end)
+            & (last_dates >= start)
+        )
+    return history_index[selected].groupby('file', sort=True)['row_group'].agg(list).to_dict()
+
+
+def read_row_groups(path, row_groups, columns, filters):
+    """Return the rows of the row groups of a parquet file that match filters."""
+    table = pq.ParquetFile(path).read_row_groups(
+        row_groups, columns=columns, use_pandas_metadata=True
+    )
+    table = table.filter(pq.filters_to_expression(filters))
+    record_read(path, table.num_rows)
+    return restore_smart_dtypes(table.to_pandas())
+
+
+def load_history(
+    serial_numbers,
+    start=None,
+    end=None,
+    columns=None,
+    *,
+    layout='daily',
+    workers=DEFAULT_WORKERS,
+    prefetch=DEFAULT_PREFETCH,
+) -> pd.DataFrame:
+    """Return the daily rows of serial numbers between start and end (YYYY-mm-dd, included).
+
+    columns restricts the columns read (date and serial_number are always returned).
+    The date window of each serial number is first narrowed to the dates it is seen
+    (see get_serial_windows()), then only the row groups whose serial number and date
+    bounds match are read (see get_history_index()), the next prefetch ones while the
+    current one is filtered.
+    The first query of an archive, or of new data files, builds or updates the lifecycle
+    index with workers processes: it scans the new daily files and saves the index and
+    its state in process/, as bbdata_parser.py does.
+    Rows are sorted by serial number then date, with the dtypes the parser gives
+    to extracted history (see get_restored_dtypes()).
+    e.g. load_history(['ZA13R1Z5'], '2023-01-01', '2023-03-01', ['smart_5_raw'])
+    """
+    directory = DATASET_DIR if layout == 'dataset' else PARQUET_DIR
+    if columns is not None:
+        columns = ['date', 'serial_number'] + [
+            column for column in columns if column not in ('date', 'serial_number')
+        ]
+    serial_numbers = list(dict.fromkeys(serial_numbers))
+    filters = [('serial_number', 'in', serial_numbers)]
+    filters += [] if start is None else [('date', '>=', start)]
+    filters += [] if end is None else [('date', '<=', end)]
+
+    row_groups = get_row_groups_to_read(
+        get_history_index(layout, prefetch),
+        get_serial_windows(
+            serial_numbers, start, end, layout=layout, workers=workers, prefetch=prefetch
+        ),
+    )
+    # Without matching row group, the columns of the last data file are returned
+    dtypes = get_restored_dtypes(
+        [directory + file for file in row_groups or get_history_index_files(layout)[-1:]]
+    )
+    dtypes = {'date': 'datetime64[ns]', 'serial_number': 'object', **dtypes}
+    if columns is not None:
+        dtypes = {column: dtypes.get(column, 'object') for column in columns}
+    history_dfs = map_tasks(
+        [
+            (read_row_groups, directory + file, file_row_groups, columns, filters)
+            for file, file_row_groups in row_groups.items()
+        ],
+        workers=1,
+        prefetch=prefetch,
+    )
+    if not history_dfs:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+    history_df = cast_to_dtypes(pd.concat(history_dfs, ignore_index=True), dtypes)
+    return history_df.sort_values(['serial_number', 'date'], ignore_index=True)
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description='BackBlaze history query.')
+    parser.add_argument(
+        'serial_numbers',
+        type=str,
+        nargs='*',
+        help='Numéros de série des disques',
+    )
+    parser.add_argument(
+        '--serial_numbers_file',
+        type=str,
+        default=None,
+        help='Fichier texte contenant un numéro de série par ligne',
+    )
+    parser.add_argument(
+        '--start',
+        type=str,
+        default=None,
+        help='Premier jour de l\'historique (format YYYY-mm-dd, inclus)',
+    )
+    parser.add_argument(
+        '--end',
+        type=str,
+        default=None,
+        help='Dernier jour de l\'historique (format YYYY-mm-dd, inclus)',
+    )
+    parser.add_argument(
+        '--columns',
+        type=str,
+        nargs='+',
+        default=None,
+        help='Colonnes lues, ex : smart_5_raw smart_187_raw (toutes par défaut)',
+    )
+    add_storage_arguments(parser, ('layout',))
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help='Nombre de processus utilisés pour construire l\'index des disques à la première requête',
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='Fichier de sortie (.csv ou .parquet) ; sinon, l\'historique est affiché',
+    )
+
+    args = parser.parse_args()
+
+    serial_numbers = list(args.serial_numbers)
+    if args.serial_numbers_file:
+        with open(args.serial_numbers_file, 'r', encoding='utf-8') as serial_numbers_file:
+            serial_numbers.extend(line.strip() for line in serial_numbers_file if line.strip())
+    if not serial_numbers:
+        parser.error('no serial number given')
+
+    history_df = load_history(
+        serial_numbers,
+        args.start,
+        args.end,
+        args.columns,
+        layout=args.layout,
+        workers=args.workers,
+    )
+    if args.output is None:
+        print(history_df)
+    elif args.output.endswith('.parquet'):
+        history_df.to_parquet(args.output, index=False)
+    else:
+        history_df.to_csv(args.output, sep='\t', decimal=',', index=False)
+    print(f'{len(history_df)} rows of {history_df["serial_number"].nunique()} disks')
+
+
+if __name__ == '__main__':
+    main()
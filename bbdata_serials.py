@@ -0,0 +1,56 @@
+"""
+Created on 17 Oct. 2026.
+
+Serial number dictionary: compact int32 ids of the serial numbers of the data files.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from bbdata_profiling import record_read, record_write
+from bbdata_storage import PROCESS_DIR, get_first_file_date
+
+SERIAL_ID_DTYPE = np.int32
+
+
+def get_serial_dictionary_path():
+    """Return the process file of the serial number dictionary."""
+    return PROCESS_DIR + f'serial_numbers_{get_first_file_date()}.parquet'
+
+
+def load_serial_dictionary() -> pd.Index:
+    """Return the serial numbers of the dictionary: the id of a serial number is its position."""
+    dictionary_path = get_serial_dictionary_path()
+    if not os.path.isfile(dictionary_path):
+        return pd.Index([], dtype=object)
+    serial_numbers = pd.read_parquet(dictionary_path)['serial_number']
+    record_read(dictionary_path, len(serial_numbers))
+    return pd.Index(serial_numbers)
+
+
+def save_serial_dictionary(serial_index):
+    """Write the serial number dictionary in its process file."""
+    dictionary_path = get_serial_dictionary_path()
+    pd.DataFrame({'serial_number': serial_index}).to_parquet(dictionary_path, index=False)
+    record_write(dictionary_path, len(serial_index))
+
+
+def intern_serial_numbers(serial_index, serial_numbers):
+    """Return the dictionary extended with unknown serial numbers and the ids of serial_numbers.
+
+    Unknown serial numbers get the next ids, in order of first appearance: ids already
+    given never change.
+    """
+    serial_numbers = pd.Index(serial_numbers)
+    serial_ids = serial_index.get_indexer(serial_numbers)
+    if (serial_ids == -1).any():
+        serial_index = serial_index.append(serial_numbers[serial_ids == -1].unique())
+        serial_ids = serial_index.get_indexer(serial_numbers)
+    return serial_index, serial_ids.astype(SERIAL_ID_DTYPE)
+
+
+def get_serial_ids(serial_index, serial_numbers):
+    """Return the ids of serial numbers in the dictionary, -1 for unknown ones."""
+    return serial_index.get_indexer(pd.Index(serial_numbers)).astype(SERIAL_ID_DTYPE)
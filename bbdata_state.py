@@ -0,0 +1,174 @@
+"""
+Created on 17 Oct. 2026.
+
+Process state store: SQLite database of the data files consumed by each stage, of the
+extraction plans and of the serial numbers already extracted.
+"""
+
+import sqlite3
+from contextlib import closing, contextmanager
+
+import pandas as pd
+
+from bbdata_profiling import record_read, record_write
+from bbdata_storage import PROCESS_DIR, get_first_file_date
+
+# Plan signature: a serial number is planned again when one of these changes
+SIGNATURE_COLUMNS = {
+    'failure_file': 'TEXT',
+    'start_file': 'TEXT',
+    'history_length_recent': 'INTEGER',
+    'history_length_old': 'INTEGER',
+}
+SIGNATURE_SCHEMA = ', '.join(
+    f'{column} {sql_type}' for column, sql_type in SIGNATURE_COLUMNS.items()
+)
+STATE_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS stage_files (
+    stage TEXT NOT NULL,
+    file TEXT NOT NULL,
+    PRIMARY KEY (stage, file)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS plans (
+    serial_number TEXT PRIMARY KEY,
+    {SIGNATURE_SCHEMA}
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS plan_intervals (
+    serial_number TEXT NOT NULL,
+    start_day TEXT NOT NULL,
+    end_day TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plan_intervals_serial_number ON plan_intervals (serial_number);
+CREATE TABLE IF NOT EXISTS parsed (
+    serial_number TEXT PRIMARY KEY,
+    {SIGNATURE_SCHEMA},
+    part TEXT
+) WITHOUT ROWID;
+'''
+
+
+def get_state_path():
+    """Return the database file of the process state."""
+    return PROCESS_DIR + f'state_{get_first_file_date()}.sqlite'
+
+
+@contextmanager
+def open_state():
+    """Yield a connection to the process state, committed if no exception is raised."""
+    with closing(sqlite3.connect(get_state_path())) as connection:
+        connection.executescript(STATE_SCHEMA)
+        with connection:
+            yield connection
+
+
+def select_serial_numbers(connection, query, serial_numbers):
+    """Return the rows of a query restricted to the serial numbers of the requested table.
+
+    Serial numbers are loaded in a temporary table, so that the query looks them up
+    in the serial number indexes, e.g. 'SELECT * FROM plans JOIN requested USING
+    (serial_number)'.
+    """
+    connection.execute(
+        'CREATE TEMP TABLE IF NOT EXISTS requested (serial_number TEXT PRIMARY KEY)'
+    )
+    connection.execute('DELETE FROM requested')
+    connection.executemany(
+        'INSERT OR IGNORE INTO requested VALUES (?)',
+        ((serial_number,) for serial_number in serial_numbers),
+    )
+    return connection.execute(query).fetchall()
+
+
+def get_stage_files(stage):
+    """Return the sorted data files consumed by a stage at its last run."""
+    with open_state() as connection:
+        rows = connection.execute(
+            'SELECT file FROM stage_files WHERE stage = ? ORDER BY file', (stage,)
+        ).fetchall()
+    return [file for (file,) in rows]
+
+
+def set_stage_files(stage, data_files):
+    """Record the data files consumed by a stage."""
+    with open_state() as connection:
+        connection.execute('DELETE FROM stage_files WHERE stage = ?', (stage,))
+        connection.executemany(
+            'INSERT INTO stage_files VALUES (?, ?)', ((stage, file) for file in data_files)
+        )
+
+
+def get_plan_signatures(serial_numbers):
+    """Return the plan signature of the serial numbers already planned (see SIGNATURE_COLUMNS)."""
+    with open_state() as connection:
+        rows = select_serial_numbers(
+            connection,
+            f'SELECT serial_number, {", ".join(SIGNATURE_COLUMNS)} '
+            'FROM plans JOIN requested USING (serial_number)',
+            serial_numbers,
+        )
+    return {serial_number: tuple(signature) for serial_number, *signature in rows}
+
+
+def save_plans(signatures, plan):
+    """Replace the plans of the serial numbers of signatures by their intervals in plan."""
+    with open_state() as connection:
+        select_serial_numbers(connection, 'SELECT 1', signatures)
+        connection.execute(
+            'DELETE FROM plan_intervals WHERE serial_number IN (SELECT * FROM requested)'
+        )
+        connection.executemany(
+            'INSERT INTO plan_intervals VALUES (?, ?, ?)',
+            plan[['serial_number', 'start', 'end']].itertuples(index=False, name=None),
+        )
+        connection.executemany(
+            f'INSERT OR REPLACE INTO plans VALUES (?, {", ".join("?" * len(SIGNATURE_COLUMNS))})',
+            ((serial_number, *signature) for serial_number, signature in signatures.items()),
+        )
+    record_write(get_state_path(), len(plan))
+
+
+def get_plans(serial_numbers) -> pd.DataFrame:
+    """Return the planned date intervals (start and end included) of serial numbers."""
+    with open_state() as connection:
+        rows = select_serial_numbers(
+            connection,
+            'SELECT serial_number, start_day, end_day FROM plan_intervals '
+            'JOIN requested USING (serial_number) ORDER BY serial_number, start_day',
+            serial_numbers,
+        )
+    record_read(get_state_path(), len(rows))
+    return pd.DataFrame(rows, columns=['serial_number', 'start', 'end'])
+
+
+def get_parsed(serial_numbers):
+    """Return the plan signature and part file of the serial numbers already extracted."""
+    with open_state() as connection:
+        rows = select_serial_numbers(
+            connection,
+            f'SELECT serial_number, {", ".join(SIGNATURE_COLUMNS)}, part '
+            'FROM parsed JOIN requested USING (serial_number)',
+            serial_numbers,
+        )
+    return {
+        serial_number: {'signature': tuple(signature), 'part': part}
+        for serial_number, *signature, part in rows
+    }
+
+
+def save_parsed(parsed):
+    """Record the plan signature and part file of extracted serial numbers."""
+    with open_state() as connection:
+        connection.executemany(
+            f'INSERT OR REPLACE INTO parsed VALUES '
+            f'(?, {", ".join("?" * len(SIGNATURE_COLUMNS))}, ?)',
+            (
+                (serial_number, *parsed_info['signature'], parsed_info['part'])
+                for serial_number, parsed_info in parsed.items()
+            ),
+        )
+
+
+def clear_parsed():
+    """Forget the serial numbers already extracted (their part files are removed by the parser)."""
+    with open_state() as connection:
+        connection.execute('DELETE FROM parsed')
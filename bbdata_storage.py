@@ -0,0 +1,546 @@
+"""
+Created on 17 Oct. 2026.
+
+BackBlaze data storage: csv to parquet conversion, readers, Arrow cache,
+partitioned dataset and new data files detection.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from functools import partial
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bbdata_executor import DEFAULT_PREFETCH, DEFAULT_WORKERS, map_tasks, prefetch_map
+from bbdata_profiling import record_cache_hit, record_read, record_write
+
+CSV_DIR = 'data/csv/'
+PARQUET_DIR = 'data/parquet/'
+PROCESS_DIR = 'process/'
+DATASET_DIR = 'data/dataset/'
+DATASET_BUCKETS = 16
+DATA_LAYOUTS = ['daily', 'dataset']
+PARQUET_COMPRESSIONS = ['none', 'snappy', 'gzip', 'brotli', 'lz4', 'zstd']
+ROW_GROUP_SIZE = 50000
+STREAM_BUCKETS = 64
+ARROW_CACHE_DIR = 'data/arrow_cache/'
+# Set in the environment so that worker processes, forked or spawned, share the setting
+ARROW_CACHE_SIZE_VARIABLE = 'BBDATA_ARROW_CACHE_SIZE'
+INTEGER_DTYPES = {
+    'Int8': (-(2**7), 2**7 - 1),
+    'Int16': (-(2**15), 2**15 - 1),
+    'Int32': (-(2**31), 2**31 - 1),
+    'Int64': (-(2**63), 2**63 - 1),
+}
+
+
+def optimize_dataframe(dataframe) -> pd.DataFrame:
+    """Downcast SMART columns to their narrowest type and sort rows by serial number.
+
+    Integer columns become the narrowest numpy integer type, integral float columns
+    the narrowest nullable integer type and other float columns float32 when it is
+    lossless, so restore_smart_dtypes() can give back the dtypes read from csv.
+    """
+    for column in dataframe.columns:
+        values = dataframe[column]
+        if not column.startswith('smart_') or not pd.api.types.is_numeric_dtype(values):
+            continue
+
+        if pd.api.types.is_integer_dtype(values):
+            dataframe[column] = pd.to_numeric(values, downcast='integer')
+        elif values.dropna().mod(1).eq(0).all():
+            for dtype, bounds in INTEGER_DTYPES.items():
+                if values.dropna().between(*bounds).all():
+                    dataframe[column] = values.astype(dtype)
+                    break
+        elif values.astype('float32').astype('float64').equals(values):
+            dataframe[column] = values.astype('float32')
+
+    return dataframe.sort_values('serial_number', ignore_index=True)
+
+
+def restore_smart_dtypes(dataframe) -> pd.DataFrame:
+    """Give back csv dtypes (int64/float64) to SMART columns of an optimized parquet file."""
+    for column in dataframe.columns:
+        dtype = dataframe[column].dtype
+        if not column.startswith('smart_'):
+            continue
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.name in INTEGER_DTYPES:
+            dataframe[column] = dataframe[column].astype('float64')
+        elif pd.api.types.is_integer_dtype(dtype):
+            dataframe[column] = dataframe[column].astype('int64')
+        elif dtype == 'float32':
+            dataframe[column] = dataframe[column].astype('float64')
+    return dataframe
+
+
+def get_restored_dtypes(parquet_paths):
+    """Return the dtype of each column once parquet files are read, restored and concatenated.
+
+    Columns are int64 when they are integers in every file, float64 when they are
+    numeric, datetime64[ns] for the date and object otherwise, as pd.concat would do
+    after restore_smart_dtypes() and pd.to_datetime() on the date.
+    """
+    columns_dtypes = {}
+    for parquet_path in parquet_paths:
+        pandas_metadata = pq.read_schema(parquet_path).pandas_metadata or {}
+        for column in pandas_metadata.get('columns', []):
+            name, numpy_type = column['name'], column['numpy_type']
+            if name is None or name.startswith('__index_level_'):
+                continue
+            if name == 'date':
+                dtype = 'datetime64[ns]'
+            elif numpy_type in INTEGER_DTYPES or numpy_type.startswith('float'):
+                dtype = 'float64'
+            elif numpy_type.startswith(('int', 'uint')):
+                dtype = 'int64'
+            else:
+                dtype = 'object'
+            columns_dtypes.setdefault(name, []).append(dtype)
+
+    restored_dtypes = {}
+    for name, dtypes in columns_dtypes.items():
+        if len(dtypes) == len(parquet_paths) and len(set(dtypes)) == 1:
+            restored_dtypes[name] = dtypes[0]
+        elif set(dtypes) <= {'int64', 'float64'}:
+            restored_dtypes[name] = 'float64'
+        else:
+            restored_dtypes[name] = 'object'
+    return restored_dtypes
+
+
+def cast_to_dtypes(dataframe, dtypes) -> pd.DataFrame:
+    """Cast a dataframe to dtypes, adding missing columns."""
+    dataframe = dataframe.reindex(columns=list(dtypes))
+    for column, dtype in dtypes.items():
+        if dtype == 'datetime64[ns]':
+            dataframe[column] = pd.to_datetime(dataframe[column]).astype(dtype)
+        elif dtype != 'object':
+            dataframe[column] = dataframe[column].astype(dtype)
+    return dataframe
+
+
+def get_arrow_schema(dtypes):
+    """Return the arrow schema of dataframes cast with cast_to_dtypes()."""
+    arrow_types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'datetime64[ns]': pa.timestamp('ns'),
+        'object': pa.string(),
+    }
+    return pa.schema([(column, arrow_types[dtype]) for column, dtype in dtypes.items()])
+
+
+def write_parquet(dataframe, parquet_path, compression=None, optimized=False):
+    """Write a daily dataframe to parquet.
+
+    In optimized mode SMART columns are downcast, rows are sorted by serial number
+    and written in row groups of ROW_GROUP_SIZE rows, so that their min/max
+    statistics let serial number filters skip row groups. serial_number and model
+    repeat across days and are stored in dictionary pages.
+    """
+    if compression == 'none':
+        compression = None
+    if not optimized:
+        dataframe.to_parquet(parquet_path, compression=compression)
+    else:
+        dataframe = optimize_dataframe(dataframe)
+        dataframe.to_parquet(
+            parquet_path,
+            compression=compression,
+            index=False,
+            row_group_size=ROW_GROUP_SIZE,
+            use_dictionary=True,
+            write_statistics=True,
+        )
+    record_write(parquet_path, len(dataframe))
+
+
+def convert_csv_to_parquet(csv_file_name, compression=None, optimized=False):
+    """Convert csv to parquet files."""
+    csv_path = os.path.join(CSV_DIR, csv_file_name)
+    parquet_path = os.path.join(PARQUET_DIR, csv_file_name.replace('.csv', '.parquet'))
+
+    if not os.path.exists(parquet_path):
+        dataframe = pd.read_csv(csv_path)
+        record_read(csv_path, len(dataframe))
+        write_parquet(dataframe, parquet_path, compression, optimized)
+
+
+def reconvert_parquet(parquet_file_name, compression=None, optimized=False):
+    """Rewrite an existing parquet file with new conversion settings."""
+    parquet_path = os.path.join(PARQUET_DIR, parquet_file_name)
+    dataframe = restore_smart_dtypes(pd.read_parquet(parquet_path))
+    record_read(parquet_path, len(dataframe))
+    write_parquet(dataframe, parquet_path + '.tmp', compression, optimized)
+    os.replace(parquet_path + '.tmp', parquet_path)
+
+
+def convert_csvs_to_parquets(compression=None, optimized=False, workers=DEFAULT_WORKERS):
+    """Convert csv to parquet files."""
+    print('Converting csv to parquet files...')
+    csv_files = get_csv_data_files()
+
+    for csv_file in csv_files.copy():
+        if os.path.exists(os.path.join(PARQUET_DIR, csv_file.replace('.csv', '.parquet'))):
+            csv_files.remove(csv_file)
+
+    if csv_files:
+        map_tasks(
+            [
+                (convert_csv_to_parquet, csv_file_name, compression, optimized)
+                for csv_file_name in csv_files
+            ],
+            workers,
+        )
+    print('All csv files have been converted to parquet files...')
+
+
+def reconvert_parquets(compression=None, optimized=False, workers=DEFAULT_WORKERS):
+    """Rewrite all existing parquet files with new conversion settings."""
+    print('Reconverting parquet files...')
+    parquet_files = get_parquet_data_files()
+
+    map_tasks(
+        [
+            (reconvert_parquet, parquet_file_name, compression, optimized)
+            for parquet_file_name in parquet_files
+        ],
+        workers,
+    )
+    print('All parquet files have been reconverted...')
+
+
+def csv_to_dataframe(csv_name) -> pd.DataFrame:
+    """Transform a csv to a dataframe object."""
+    try:
+        dataframe = pd.read_csv(CSV_DIR + csv_name)
+        return dataframe
+    except (Exception,):  # pylint: disable=broad-except
+        print(f'Cannot read {csv_name}')
+        if input('Delete file ? (y/n)') == 'y':
+            os.remove(CSV_DIR + csv_name)
+        sys.exit(1)
+
+
+def configure_arrow_cache(max_size):
+    """Enable the Arrow cache of projected parquet reads, up to max_size bytes (0 disables it)."""
+    os.environ[ARROW_CACHE_SIZE_VARIABLE] = str(max_size)
+    if max_size and os.path.isdir(ARROW_CACHE_DIR):
+        evict_arrow_cache(max_size)
+
+
+def get_arrow_cache_size():
+    """Return the maximum size in bytes of the Arrow cache, 0 if it is disabled."""
+    return int(os.environ.get(ARROW_CACHE_SIZE_VARIABLE, '0'))
+
+
+def get_arrow_cache_path(parquet_path, columns):
+    """Return the Arrow cache file of the columns of a parquet file.
+
+    The key holds the size and modification time of the parquet file: a rewritten
+    file gets a new entry and the outdated one is evicted in time.
+    """
+    stat = os.stat(parquet_path)
+    key = hashlib.sha256(
+        repr(
+            (os.path.abspath(parquet_path), stat.st_size, stat.st_mtime_ns, sorted(columns))
+        ).encode()
+    ).hexdigest()
+    return f'{ARROW_CACHE_DIR}{os.path.basename(parquet_path)}.{key[:16]}.arrow'
+
+
+def read_arrow_cache(cache_path):
+    """Return the table of an Arrow cache file, memory mapped, or None if it is missing.
+
+    The entry may be evicted by another worker at any time: it is then a miss.
+    """
+    try:
+        with pa.memory_map(cache_path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        os.utime(cache_path)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    return table
+
+
+def write_arrow_cache(cache_path, table, max_size):
+    """Write a table to the Arrow cache uncompressed, then evict entries beyond max_size bytes."""
+    os.makedirs(ARROW_CACHE_DIR, exist_ok=True)
+    # Workers and prefetch threads may write the same entry at the same time
+    tmp_path = f'{cache_path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, cache_path)
+    record_write(cache_path, table.num_rows)
+    evict_arrow_cache(max_size)
+
+
+def evict_arrow_cache(max_size):
+    """Remove the least recently used entries of the Arrow cache until it fits in max_size bytes."""
+    entries = []
+    for entry_name in os.listdir(ARROW_CACHE_DIR):
+        if not entry_name.endswith('.arrow'):
+            continue
+        try:
+            stat = os.stat(ARROW_CACHE_DIR + entry_name)
+        except OSError:  # Removed by another worker
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, entry_name))
+
+    cache_size = sum(entry_size for _, entry_size, _ in entries)
+    for _, entry_size, entry_name in sorted(entries):
+        if cache_size <= max_size:
+            break
+        try:
+            # Tables already mapped by a reader stay readable once their file is removed
+            os.remove(ARROW_CACHE_DIR + entry_name)
+        except OSError:
+            pass
+        cache_size -= entry_size
+
+
+def read_cached_parquet(parquet_path, columns, filters, max_size) -> pd.DataFrame:
+    """Read the columns of a parquet file through the Arrow cache.
+
+    On a miss, all rows of the columns are read and cached; filters are then
+    applied to the memory mapped table.
+    """
+    cache_path = get_arrow_cache_path(parquet_path, columns)
+    table = read_arrow_cache(cache_path)
+    if table is not None:
+        record_read(cache_path, table.num_rows)
+        record_cache_hit()
+    else:
+        table = pq.read_table(parquet_path, columns=columns, use_pandas_metadata=True)
+        record_read(parquet_path, table.num_rows)
+        try:
+            write_arrow_cache(cache_path, table, max_size)
+        except OSError:  # The cache is only an optimization
+            print(f'Cannot write {cache_path}')
+
+    if filters is not None:
+        table = table.filter(pq.filters_to_expression(filters))
+    return table.to_pandas()
+
+
+def parquet_to_dataframe(
+    parquet_name, columns=None, filters=None, directory=PARQUET_DIR
+) -> pd.DataFrame:
+    """Transform a parquet file to a dataframe object.
+
+    columns and filters are pushed down to the parquet reader, so only the
+    requested columns of the matching row groups are decoded.
+    e.g. filters=[('serial_number', 'in', serial_numbers)] or [('failure', '==', 1)]
+    When the Arrow cache is enabled (see configure_arrow_cache()), projected reads
+    are served from uncompressed memory mapped copies of their columns.
+    """
+    try:
+        max_size = get_arrow_cache_size()
+        if max_size and columns is not None:
+            return read_cached_parquet(directory + parquet_name, columns, filters, max_size)
+        dataframe = pd.read_parquet(directory + parquet_name, columns=columns, filters=filters)
+        record_read(directory + parquet_name, len(dataframe))
+        return dataframe
+    except (Exception,):  # pylint: disable=broad-except
+        print(f'Cannot read {directory + parquet_name}')
+        sys.exit(1)
+
+
+def iter_parquet_files(
+    parquet_names, columns=None, prefetch=DEFAULT_PREFETCH, directory=PARQUET_DIR
+):
+    """Yield (parquet_name, dataframe) of parquet files in order, reading the next ones ahead.
+
+    Up to prefetch files are read in background threads while the current one is
+    processed (see prefetch_map()), e.g. iter_parquet_files(get_parquet_data_files()).
+    """
+    yield from zip(
+        parquet_names,
+        prefetch_map(
+            partial(parquet_to_dataframe, columns=columns, directory=directory),
+            parquet_names,
+            prefetch,
+        ),
+    )
+
+
+def get_csv_data_files(reverse=False):
+    """Return data csv files list from data folder."""
+    return sorted((file for file in os.listdir(CSV_DIR) if file.endswith('.csv')), reverse=reverse)
+
+
+def get_parquet_data_files(reverse=False):
+    """Return data parquet files list from data folder."""
+    return sorted(
+        (file for file in os.listdir(PARQUET_DIR) if file.endswith('.parquet')), reverse=reverse
+    )
+
+
+def get_dataset_partition(day):
+    """Return the year/quarter dataset partition of a day (YYYY-mm-dd)."""
+    return f'year={day[:4]}/quarter={(int(day[5:7]) - 1) // 3 + 1}'
+
+
+def get_serial_number_buckets(serial_numbers, bucket_count=DATASET_BUCKETS):
+    """Return the bucket of each serial number (stable across processes)."""
+    hashes = pd.util.hash_pandas_object(pd.Series(serial_numbers, dtype=object), index=False)
+    return hashes.to_numpy() % bucket_count
+
+
+def get_dataset_part_file(partition, bucket):
+    """Return the dataset part file holding a partition bucket."""
+    return f'{partition}/part-{bucket:02d}.parquet'
+
+
+def get_dataset_part_files():
+    """Return dataset part files list, sorted by partition."""
+    part_files = []
+    for directory, _, file_names in os.walk(DATASET_DIR):
+        part_files.extend(
+            os.path.relpath(os.path.join(directory, file_name), DATASET_DIR)
+            for file_name in file_names
+            if file_name.startswith('part-') and file_name.endswith('.parquet')
+        )
+    return sorted(part_files)
+
+
+def split_parquet_file(data_file):
+    """Split a daily file by serial number bucket into the dataset temporary folder."""
+    dataframe = parquet_to_dataframe(data_file)
+    partition_dir = DATASET_DIR + '_tmp/' + get_dataset_partition(data_file[:10])
+    buckets = get_serial_number_buckets(dataframe['serial_number'])
+
+    for bucket, bucket_df in dataframe.groupby(buckets):
+        bucket_dir = f'{partition_dir}/bucket={bucket:02d}/'
+        os.makedirs(bucket_dir, exist_ok=True)
+        bucket_df.to_parquet(bucket_dir + data_file, compression=None, index=False)
+        record_write(bucket_dir + data_file, len(bucket_df))
+
+
+def sort_dataset_part(partition, bucket, compression=None):
+    """Write a dataset part file sorted by serial number then date from its temporary splits."""
+    bucket_dir = f'{DATASET_DIR}_tmp/{partition}/bucket={bucket:02d}/'
+    if not os.path.isdir(bucket_dir):
+        return
+
+    split_dfs = []
+    for file_name in sorted(os.listdir(bucket_dir)):
+        split_dfs.append(pd.read_parquet(bucket_dir + file_name))
+        record_read(bucket_dir + file_name, len(split_dfs[-1]))
+    dataframe = pd.concat(split_dfs, ignore_index=True)
+    dataframe = dataframe.sort_values(['serial_number', 'date'], ignore_index=True)
+
+    os.makedirs(DATASET_DIR + partition, exist_ok=True)
+    dataframe.to_parquet(
+        DATASET_DIR + get_dataset_part_file(partition, bucket),
+        compression=None if compression == 'none' else compression,
+        index=False,
+        row_group_size=ROW_GROUP_SIZE,
+        write_statistics=True,
+    )
+    record_write(DATASET_DIR + get_dataset_part_file(partition, bucket), len(dataframe))
+    shutil.rmtree(bucket_dir)
+
+
+def compact_parquet_files(compression=None, workers=DEFAULT_WORKERS):
+    """Rewrite daily parquet files into a year/quarter partitioned dataset.
+
+    Each partition is split in DATASET_BUCKETS part files by serial number hash,
+    sorted by serial number then date, so that a disk history only touches a few
+    row groups of one part file per quarter. Only partitions whose daily files
+    changed since the last compaction are rewritten.
+    """
+    print('\n---Compacting parquet files into dataset...---')
+    data_files = get_parquet_data_files()
+    days_file_name = DATASET_DIR + '_days.json'
+
+    compacted_files = []
+    if os.path.isfile(days_file_name):
+        with open(days_file_name, 'r', encoding='utf-8') as days_file:
+            compacted_files = json.load(days_file)
+
+    partitions = sorted(
+        {
+            get_dataset_partition(data_file[:10])
+            for data_file in set(data_files) ^ set(compacted_files)
+        }
+    )
+    if not partitions:
+        print('Dataset is up to date')
+        return
+
+    files_to_split = [
+        data_file
+        for data_file in data_files
+        if get_dataset_partition(data_file[:10]) in partitions
+    ]
+    for partition in partitions:
+        shutil.rmtree(DATASET_DIR + partition, ignore_errors=True)
+    shutil.rmtree(DATASET_DIR + '_tmp', ignore_errors=True)
+
+    map_tasks([(split_parquet_file, data_file) for data_file in files_to_split], workers)
+    map_tasks(
+        [
+            (sort_dataset_part, partition, bucket, compression)
+            for partition in partitions
+            for bucket in range(DATASET_BUCKETS)
+        ],
+        workers,
+    )
+    shutil.rmtree(DATASET_DIR + '_tmp', ignore_errors=True)
+
+    with open(days_file_name, 'w', encoding='utf-8') as days_file:
+        json.dump(data_files, days_file, indent=4)
+    print(f'{len(partitions)} partitions compacted')
+
+
+def get_new_data_files(consumed_files, data_files):
+    """Return data files not consumed yet, or None if consumed files were removed."""
+    if not consumed_files or not set(consumed_files) <= set(data_files):
+        return None
+    consumed_files = set(consumed_files)
+    return [data_file for data_file in data_files if data_file not in consumed_files]
+
+
+def get_first_file_date():
+    """Return older file date."""
+    return get_parquet_data_files()[0][:10]
+
+
+def add_storage_arguments(parser, arguments=('compression', 'optimized', 'layout')):
+    """Add the command line options of the parquet data to the parser of a script.
+
+    arguments selects the options among compression (--parquet_compression), optimized
+    (--optimized_parquet) and layout (--layout).
+    """
+    if 'compression' in arguments:
+        parser.add_argument(
+            '--parquet_compression',
+            type=str,
+            default='none',
+            choices=PARQUET_COMPRESSIONS,
+            help='Codec de compression des fichiers parquet',
+        )
+    if 'optimized' in arguments:
+        parser.add_argument(
+            '--optimized_parquet',
+            action='store_true',
+            help='Convertit en parquet typé (données SMART réduites, triées par numéro de série)',
+        )
+    if 'layout' in arguments:
+        parser.add_argument(
+            '--layout',
+            type=str,
+            default='daily',
+            choices=DATA_LAYOUTS,
+            help='Lecture des fichiers journaliers (daily) ou du dataset partitionné compacté '
+            '(dataset)',
+        )
@@ -0,0 +1,149 @@
+"""
+Created on 17 Oct. 2026.
+
+Survival analysis of the whole fleet (failed and still working disks) from the lifecycle index.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from bbdata_profiling import record_write
+from bbdata_storage import get_first_file_date
+
+SURVIVAL_BUCKET_DAYS = 30
+MAX_POWER_ON_DAYS = 20 * 365
+# Columns of the survival table and their dtypes
+SURVIVAL_COLUMNS = {
+    'age_start_days': np.int64,
+    'age_end_days': np.int64,
+    'disks': np.int64,
+    'drive_days': np.int64,
+    'failures': np.int64,
+    'hazard_rate': np.float64,
+    'annualized_failure_rate': np.float64,
+    'km_survival': np.float64,
+}
+
+
+def get_survival_ages(lifecycle_index):
+    """Return the entry age, exit age (in days) and failure flag of every disk.
+
+    A disk enters observation at its age when first seen, given by its power on hours
+    (left truncation), and leaves it at its first failure or, if it never failed, when
+    last seen (right censoring). Disks with unknown or implausible power on hours enter
+    observation at age 0.
+    """
+    first_failures = pd.Series(
+        [days[0] if len(days) else None for days in lifecycle_index['failure_dates']],
+        index=lifecycle_index.index,
+    )
+    failed = first_failures.notna().to_numpy()
+    ends = pd.to_datetime(first_failures.fillna(lifecycle_index['last_seen']))
+    durations = (ends - pd.to_datetime(lifecycle_index['first_seen'])).dt.days.to_numpy()
+
+    power_on_days = lifecycle_index['first_power_on_hours'].to_numpy(dtype=float) // 24
+    power_on_days[~((power_on_days >= 0) & (power_on_days <= MAX_POWER_ON_DAYS))] = 0
+    entry_ages = power_on_days.astype(np.int64)
+    return entry_ages, entry_ages + durations, failed
+
+
+def get_age_counts(lifecycle_index):
+    """Return the number of disks entering, leaving and failing at each day of age.
+
+    A disk is counted in 'exits' the day after its exit age, so that the disks at risk
+    at an age are the cumulative sum of entries minus exits. Counts of several sets of
+    disks add up, e.g. to update them as disks are seen (see add_age_counts()).
+    """
+    entry_ages, exit_ages, failed = get_survival_ages(lifecycle_index)
+    age_count = int(exit_ages.max()) + 2 if len(exit_ages) else 1
+    return {
+        'entries': np.bincount(entry_ages, minlength=age_count),
+        'exits': np.bincount(exit_ages + 1, minlength=age_count),
+        'failures': np.bincount(exit_ages[failed], minlength=age_count),
+    }
+
+
+def add_age_counts(age_counts, other_counts, sign=1):
+    """Return age counts plus (or minus, with sign = -1) other age counts."""
+    age_count = max(len(age_counts['entries']), len(other_counts['entries']))
+    return {
+        key: np.pad(age_counts[key], (0, age_count - len(age_counts[key])))
+        + sign * np.pad(other_counts[key], (0, age_count - len(other_counts[key])))
+        for key in age_counts
+    }
+
+
+def get_survival_table(lifecycle_index, bucket_days=SURVIVAL_BUCKET_DAYS, age_counts=None):
+    """Return Kaplan-Meier survival and hazard rate of the fleet by age bucket.
+
+    The risk set of each day of age is the number of disks whose observation covers it:
+    it is computed for all ages at once from the counts of entry and exit ages (see
+    get_age_counts(), or given as age_counts). For each bucket, the table holds the
+    number of disks and drive-days at risk, the failures, the hazard rate (failures per
+    drive-day), the annualized failure rate (%) and the Kaplan-Meier survival at the end
+    of the bucket. Without disks, the table is empty.
+    """
+    if age_counts is None:
+        age_counts = get_age_counts(lifecycle_index)
+    if not age_counts['exits'].any():
+        return pd.DataFrame(
+            {column: pd.Series(dtype=dtype) for column, dtype in SURVIVAL_COLUMNS.items()}
+        )
+    # Ages go up to the last exit age
+    age_count = int(np.flatnonzero(age_counts['exits'])[-1])
+
+    # Disks at risk and failures for each day of age
+    at_risk = np.cumsum(age_counts['entries'] - age_counts['exits'])[:age_count]
+    failures = age_counts['failures'][:age_count]
+    daily_hazard = np.divide(failures, at_risk, out=np.zeros(age_count), where=at_risk > 0)
+    survival = np.cumprod(1 - daily_hazard)
+
+    # Aggregation by age bucket
+    buckets = np.arange(age_count) // bucket_days
+    bucket_starts = np.arange(buckets[-1] + 1) * bucket_days
+    bucket_ends = np.minimum(bucket_starts + bucket_days, age_count) - 1
+    drive_days = np.bincount(buckets, weights=at_risk)
+    bucket_failures = np.bincount(buckets, weights=failures).astype(np.int64)
+    hazard_rate = np.divide(
+        bucket_failures, drive_days, out=np.zeros(len(drive_days)), where=drive_days > 0
+    )
+
+    # Disks observed during the bucket: entered before its end and not exited before its start
+    disks = (
+        np.cumsum(age_counts['entries'])[bucket_ends]
+        - np.cumsum(age_counts['exits'])[bucket_starts]
+    )
+
+    return pd.DataFrame(
+        {
+            'age_start_days': bucket_starts,
+            'age_end_days': bucket_ends,
+            'disks': disks,
+            'drive_days': drive_days.astype(np.int64),
+            'failures': bucket_failures,
+            'hazard_rate': hazard_rate,
+            'annualized_failure_rate': hazard_rate * 365 * 100,
+            'km_survival': survival[bucket_ends],
+        }
+    )
+
+
+def get_survival_path():
+    """Return the survival csv file of the fleet."""
+    return f'results/{get_first_file_date()}_survival.csv'
+
+
+def create_survival_file(lifecycle_index, bucket_days=SURVIVAL_BUCKET_DAYS):
+    """Generate the survival csv file of the fleet."""
+    print('\n---Computing fleet survival...---')
+    survival_df = get_survival_table(lifecycle_index, bucket_days)
+    os.makedirs('results/', exist_ok=True)
+    survival_path = get_survival_path()
+    survival_df.to_csv(survival_path, sep='\t', decimal=',', index=False)
+    record_write(survival_path, len(survival_df))
+    print(
+        f'{len(lifecycle_index)} disks, {survival_df["failures"].sum()} failures, '
+        f'survival by {bucket_days} days of age saved in {survival_path}'
+    )
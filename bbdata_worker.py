@@ -0,0 +1,61 @@
+"""
+Created on 17 Oct. 2026.
+
+Work queue worker: runs the tasks queued by bbdata_parser.py --executor queue, on this
+host or on any host sharing the queue directory.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+
+from bbdata_executor import DEFAULT_WORKERS, QUEUE_DIR, run_queue_worker
+from bbdata_storage import ARROW_CACHE_DIR, configure_arrow_cache
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description='BackBlaze work queue worker.')
+    parser.add_argument(
+        '--queue_dir',
+        type=str,
+        default=QUEUE_DIR,
+        help='Répertoire de la file de tâches, partagé entre les machines',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help='Nombre de processus qui exécutent les tâches sur cette machine',
+    )
+    parser.add_argument(
+        '--idle_timeout',
+        type=float,
+        default=None,
+        help='Arrête les processus après ce nombre de secondes sans tâche (jamais par défaut)',
+    )
+    parser.add_argument(
+        '--arrow_cache',
+        type=int,
+        default=0,
+        help=f'Taille maximale en Mo du cache Arrow ({ARROW_CACHE_DIR}), 0 pour le désactiver',
+    )
+
+    args = parser.parse_args()
+
+    os.makedirs(args.queue_dir, exist_ok=True)
+    if args.arrow_cache:
+        configure_arrow_cache(args.arrow_cache * 1024 * 1024)
+    print(f'{args.workers} workers waiting for tasks in {args.queue_dir}')
+    workers = [
+        mp.Process(target=run_queue_worker, args=(args.queue_dir, args.idle_timeout))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    main()
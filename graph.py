@@ -5,7 +5,9 @@ Created on 25 March. 2023.
 
 Notation :
 
-trace = la date relative des 90 derniers jours et des 30 premiers jours
+trace = la date relative des derniers jours (avant la panne) et des premiers jours de vie du disque
+jours_avant_panne = nombre de jours entre la date et la panne du disque
+jours_depuis_debut = nombre de jours entre la première apparition du disque et la date
 
 """
 
@@ -14,18 +16,75 @@ import csv
 import math
 import multiprocessing
 import os
-import pickle
 from collections import Counter
+from functools import partial
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from tqdm import tqdm
 
+from bbdata_profiling import collect_task, enable_profiling, profile_stage, record_read, run_task
+from graph_cache import (
+    REPERTOIRE_CACHE,
+    TAILLE_MAX_CACHE,
+    afficher_statistiques_cache,
+    cle_cache,
+    configurer_cache,
+    ecrire_cache,
+    empreinte_fichiers,
+    lire_cache,
+)
+from graph_weibull import ajuster_courbes, taux_panne_modele
+
 # ====================     Variables Globales    ====================
 # NOM_FICHIER = '/home/nicolas/git/sr09-backblaze/results/2013-04-10-90-30'
 NOM_FICHIER = 'C:\\Users\\utcpret\\Documents\\Benjamin\\P23\\SR09\\v4\\2013-04-10'
 DICO_DUREE_VIE = {}
+DONNEES_SMART = [
+    'smart_1_raw',
+    'smart_2_raw',
+    'smart_3_raw',
+    'smart_5_raw',
+    'smart_7_raw',
+    'smart_10_raw',
+    'smart_11_raw',
+    'smart_22_raw',
+    'smart_160_raw',
+    'smart_165_raw',
+    'smart_167_raw',
+    'smart_173_raw',
+    'smart_174_raw',
+    'smart_177_raw',
+    'smart_178_raw',
+    'smart_183_raw',
+    'smart_187_raw',
+    'smart_188_raw',
+    'smart_190_raw',
+    'smart_196_raw',
+    'smart_197_raw',
+    'smart_198_raw',
+    'smart_201_raw',
+    'smart_220_raw',
+]
+DONNEES_SMART_WEIBULL = [
+    'smart_220_raw',
+    'smart_1_raw',
+    'smart_5_raw',
+    'smart_7_raw',
+    'smart_11_raw',
+    'smart_167_raw',
+    'smart_183_raw',
+    'smart_187_raw',
+    'smart_188_raw',
+    'smart_196_raw',
+    'smart_197_raw',
+    'smart_198_raw',
+    'smart_201_raw',
+]
+ANNEES_DONNEES_SMART = [2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020, 2021, 2022]
+RAPPORT_PROFIL = 'results/profil_graph.json'
 
 
 # --------------------- Utilitaire ---------------------
@@ -70,75 +129,128 @@ def chaine_caractere_vers_liste_string(string_input):
     return result
 
 
-# --------------------- Utilitaire pour les données smart ---------------------
+def ajouter_dates_relatives(nom, disque):
+    """
+    Ajoute les dates relatives d'un disque, calculées à partir de la colonne date et du nom du
+    résultat (panne_debut_old_recent_numero.csv, voir bbdata_parser.set_result_filename()).
+    La trace place les derniers jours de vie en haut de l'échelle (la panne vaut old + recent - 1)
+    et les premiers jours en bas (la première apparition vaut 0). Si tout l'historique a été extrait,
+    la trace correspond au nombre de jours depuis la première apparition.
+    """
+    date_panne, date_debut, history_length_old, history_length_recent, _ = nom.split('_', 4)
+    history_length_old, history_length_recent = int(history_length_old), int(history_length_recent)
+    dates = pd.to_datetime(disque['date'])
+    disque['jours_avant_panne'] = (pd.Timestamp(date_panne) - dates).dt.days
+    disque['jours_depuis_debut'] = (dates - pd.Timestamp(date_debut)).dt.days
+
+    if history_length_old == 0 or history_length_recent == 0:
+        disque['trace'] = disque['jours_depuis_debut']
+    else:
+        disque['trace'] = np.where(
+            disque['jours_avant_panne'] < history_length_recent,
+            history_length_old + history_length_recent - 1 - disque['jours_avant_panne'],
+            disque['jours_depuis_debut'],
+        )
+    return disque
 
 
-def remplir_dico_moyenne(fichiers, smart_list):
-    """Fonction qui permet d'initialiser le dictionnaire des valeurs des données SMART."""
-    print('-> Entrée dans la fonction : remplir_dico_moyenne()')
+def lire_fichier_disques(fichier, colonnes=None):
+    """
+    Lit un fichier de résultats et retourne la liste des (nom, historique) des disques qu'il contient.
+    Un fichier CSV contient l'historique d'un seul disque. Un fichier parquet du stockage en colonnes
+    (bbdata_parser.py --output parquet) contient l'historique de plusieurs disques, dont le nom est
+    donné par la colonne result_filename. Les dates relatives sont ajoutées à la lecture.
+    Si colonnes est donné, seules ces colonnes (si elles existent) sont lues.
+    """
+    if fichier.endswith('.parquet'):
+        if colonnes is not None:
+            colonnes = [colonne for colonne in pq.read_schema(fichier).names if colonne in colonnes]
+        dataframe = pd.read_parquet(fichier, columns=colonnes)
+        disques = dataframe.groupby('result_filename', sort=False)
+    else:
+        usecols = None if colonnes is None else lambda colonne: colonne in colonnes
+        dataframe = pd.read_csv(fichier, sep='\t', decimal=',', usecols=usecols)
+        disques = [(os.path.basename(fichier), dataframe)]
 
-    dico = {}
-    liste_valeurs = {}
-    nb_valeurs_par_date = {}
+    record_read(fichier, len(dataframe))
+    return [
+        (nom, ajouter_dates_relatives(nom, disque.reset_index(drop=True)))
+        for nom, disque in disques
+    ]
 
-    print('# Etape 1 : Somme des valeurs pour tous les disques')
 
-    for fichier in tqdm(fichiers, total=len(fichiers)):
-        dataframe = pd.read_csv(fichier, sep='\t')
-        if dataframe.empty:
-            continue  # Ignorer les fichiers vides
-        dataframe = dataframe.fillna(0)
+def iterer_disques(fichiers):
+    """Parcourt l'historique de tous les disques des fichiers de résultats."""
+    for fichier in tqdm(fichiers):
+        yield from lire_fichier_disques(fichier)
 
-        for smart in smart_list:
-            dataframe[smart] = dataframe[smart].apply(
-                lambda x: float(x.replace(',', '.')) if isinstance(x, str) else x
-            )
-            dico.setdefault(smart, {})
-            liste_valeurs.setdefault(smart, {})
-            nb_valeurs_par_date.setdefault(smart, {})
 
-            for i in range(len(dataframe)):
-                date = dataframe.loc[i, 'trace']
-                valeur = dataframe.loc[i, smart]
+# --------------------- Utilitaire pour les données smart ---------------------
 
-                liste_valeurs[smart].setdefault(date, [])
 
-                if isinstance(valeur, float) and valeur != 0:
-                    liste_valeurs[smart][date].append(valeur)
-                    dico[smart].setdefault(date, 0)
-                    nb_valeurs_par_date[smart].setdefault(date, 0)
-                    dico[smart][date] += valeur
-                    nb_valeurs_par_date[smart][date] += 1
+def agreger_disques(disques, smart_list):
+    """
+    Agrège les données SMART de l'historique des disques par date relative (trace).
+    Retourne, pour chaque (trace, donnée SMART), le nombre de valeurs non nulles, leur somme et la
+    somme des carrés des écarts à leur moyenne (m2).
+    """
+    if not disques:
+        return None
+    dataframe = pd.concat([disque for _, disque in disques], ignore_index=True)
+
+    # Les valeurs manquantes ou nulles sont ignorées
+    valeurs = dataframe[smart_list].astype(float)
+    valeurs = valeurs.where(valeurs != 0)
+    trace = dataframe['trace']
+    groupes = valeurs.groupby(trace)
+    ecarts = valeurs - groupes.transform('mean')
+
+    agregat = pd.concat(
+        {
+            'n': groupes.count().stack(),
+            'somme': groupes.sum().stack(),
+            'm2': (ecarts**2).groupby(trace).sum().stack(),
+        },
+        axis=1,
+    )
+    agregat.index.names = ['trace', 'smart']
+    return agregat[agregat['n'] > 0]
 
-    print("# Etape 2 : Calcul de la moyenne et de l'erreur")
 
-    for smart in tqdm(dico):
-        for date in dico[smart]:
-            moyenne = dico[smart][date] / nb_valeurs_par_date[smart][date]
-            erreur = np.nanstd(liste_valeurs[smart][date]) / np.sqrt(
-                nb_valeurs_par_date[smart][date]
-            )
-            dico[smart][date] = (moyenne, erreur)
+def fusionner_agregats(agregats):
+    """Fusionne des agrégats partiels (formule de Chan pour la somme des carrés des écarts)."""
+    agregat = pd.concat(agregats)
+    groupes = agregat.groupby(level=['trace', 'smart'])
+    total = groupes[['n', 'somme']].sum()
+    ecart = agregat['somme'] / agregat['n'] - (total['somme'] / total['n']).reindex(agregat.index)
+    m2 = agregat['m2'] + agregat['n'] * ecart**2
+    total['m2'] = m2.groupby(level=['trace', 'smart']).sum()
+    return total
 
-    print('<- Fin de la fonction : remplir_dico_moyenne()')
-    return dico
 
+def remplir_dico_moyenne(fichiers, smart_list, agregat=None):
+    """
+    Fonction qui permet d'initialiser le dictionnaire des valeurs des données SMART.
+    Si l'agrégat n'est pas donné (voir analyser_resultats()), les résultats sont lus.
+    """
+    print('-> Entrée dans la fonction : remplir_dico_moyenne()')
+
+    if agregat is None:
+        print('# Etape 1 : Somme des valeurs pour tous les disques')
+        agregat = analyser_resultats(fichiers, {'moyenne': smart_list})['moyenne']
 
-def ajouter_colonne_trace(fichiers):
-    """Ajoute la colonne "trace" - date relative, afin que les disques aient la même date de début et de fin."""
-    print('# Ajout de la colone des dates relatives')
-    with multiprocessing.Pool(processes=None) as pool:
-        for _ in tqdm(pool.imap_unordered(process_file, fichiers), total=len(fichiers)):
-            pass
+    print("# Etape 2 : Calcul de la moyenne et de l'erreur")
 
+    dico = {smart: {} for smart in smart_list}
+    if agregat is not None:
+        agregat = agregat.sort_index()
+        agregat['moyenne'] = agregat['somme'] / agregat['n']
+        agregat['erreur'] = np.sqrt(agregat['m2'] / agregat['n']) / np.sqrt(agregat['n'])
+        for (date, smart), ligne in agregat[['moyenne', 'erreur']].iterrows():
+            dico[smart][date] = (ligne['moyenne'], ligne['erreur'])
 
-def process_file(file):
-    """Fonction qui permet de paralléliser l'exécution du code ajouter_colonne_trace()."""
-    dataframe = pd.read_csv(file, sep='\t')
-    if 'trace' not in dataframe.columns:
-        trace = pd.Series(range(121, -1, -1))
-        dataframe['trace'] = trace[: len(dataframe)]
-        dataframe.to_csv(file, sep='\t', index=False, columns=list(dataframe.columns) + ['trace'])
+    print('<- Fin de la fonction : remplir_dico_moyenne()')
+    return dico
 
 
 def tracer_dico(dico):
@@ -165,32 +277,24 @@ def tracer_dico(dico):
 # --------------------- Utilitaire pour la courbe en baignoire  ---------------------
 
 
-def calcul_duree_vie(fichiers, annee_voulu, duree):
+def extraire_durees_vie(disques, annee_voulu, duree):
     """
-    Fonction qui permet de préparer le calcul pour la courbe en baignoire.
-    Peut être ramené à utiliser la fonction calcul_vie_donnee_smart_duree()
-    sur la donnée smart_9_raw qui correspond à la durée de vie
+    Retourne le nombre de disques des années voulues et leur durée de vie (en mois ou en trimestres),
+    par numéro de série.
     """
-    compteur = 0
     mois = 0.0
     nb_disques = 0
+    durees_vie = {}
 
-    print(f'-> Ajouter duree de vie pour les années {annee_voulu}')
-    for fichier in tqdm(fichiers):
-        dataframe = pd.read_csv(fichier, sep='\t')
+    for nom, dataframe in disques:
 
         # Sélection des années voulues
-        if any(os.path.basename(fichier).startswith(str(annee)) for annee in annee_voulu):
+        if any(nom.startswith(str(annee)) for annee in annee_voulu):
 
             nb_disques += 1
             nb_heures_tot = dataframe.iloc[0]['smart_9_raw']
-            if isinstance(nb_heures_tot, str):
-                nb_heures_tot = nb_heures_tot.replace(',', '.')[
-                    :-2
-                ]  # remplace la virgule par un point
-            else:
-                if math.isnan(nb_heures_tot):
-                    continue
+            if math.isnan(nb_heures_tot):
+                continue
 
             if duree == 'mois':
                 mois = round(int(nb_heures_tot) / (30 * 24), 0)
@@ -200,10 +304,23 @@ def calcul_duree_vie(fichiers, annee_voulu, duree):
             serial_number = dataframe.iloc[0]['serial_number']
             # model = dataframe.iloc[0]['model']
 
-            DICO_DUREE_VIE[serial_number] = round(mois, 0)
+            durees_vie[serial_number] = round(mois, 0)
+
+    return nb_disques, durees_vie
 
-        else:
-            compteur = compteur + 1
+
+def calcul_duree_vie(fichiers, annee_voulu, duree, durees_vie=None):
+    """
+    Fonction qui permet de préparer le calcul pour la courbe en baignoire.
+    Peut être ramené à utiliser la fonction calcul_vie_donnee_smart_duree()
+    sur la donnée smart_9_raw qui correspond à la durée de vie
+    Si les durées de vie ne sont pas données (voir analyser_resultats()), les résultats sont lus.
+    """
+    print(f'-> Ajouter duree de vie pour les années {annee_voulu}')
+    if durees_vie is None:
+        durees_vie = analyser_resultats(fichiers, {'duree_vie': (annee_voulu, duree)})['duree_vie']
+    nb_disques, dico_duree_vie = durees_vie
+    DICO_DUREE_VIE.update(dico_duree_vie)
 
     print("<- Fin de l'ajout duree de vie")
 
@@ -220,19 +337,21 @@ def calcul_vie_donnee_smart_duree(fichiers, annee_voulu, donnee):
     nb_disques = 0
 
     print(f'-> Ajouter duree de vie pour les années {annee_voulu}')
-    for fichier in tqdm(fichiers):
-        dataframe = pd.read_csv(fichier, sep='\t')
+    cle = cle_cache(empreinte_fichiers(fichiers), 'duree_smart', list(annee_voulu), donnee)
+    trouve, resultat = lire_cache(cle)
+    if trouve:
+        print("<- Fin de l'ajout duree de vie")
+        return resultat
+
+    for nom, dataframe in iterer_disques(fichiers):
 
         # Sélection des années voulues
-        if any(os.path.basename(fichier).startswith(str(annee)) for annee in annee_voulu):
+        if any(nom.startswith(str(annee)) for annee in annee_voulu):
 
             nb_disques += 1
             valeur_totale = dataframe.iloc[0][donnee]
-            if isinstance(valeur_totale, str):
-                valeur_totale = valeur_totale.replace(',', '.')[:-2]
-            else:
-                if math.isnan(valeur_totale):
-                    continue
+            if math.isnan(valeur_totale):
+                continue
 
             semaine = round(int(valeur_totale) / (24 * 7), 0)
 
@@ -242,75 +361,101 @@ def calcul_vie_donnee_smart_duree(fichiers, annee_voulu, donnee):
         else:
             compteur = compteur + 1
 
-    print("<- Fin de l'ajout duree de vie")
-    return Counter(dico_duree_vie.values()), nb_disques
+    resultat = Counter(dico_duree_vie.values()), nb_disques
+    ecrire_cache(cle, resultat)
 
+    print("<- Fin de l'ajout duree de vie")
+    return resultat
 
-def calcul_vie_donnee_smart_valeur(fichiers, annee_voulu, donnee, nb_points):
-    """Fonction qui permet de préparer le calcul pour la courbe en baignoire pour les données SMART"""
 
-    dico_duree_vie = {}
-    nb_disques = 0
-    print()
-    print()
-    print(f'-> Ajouter duree de vie pour {donnee}')
-    filename = f'{donnee}.bin'
-    filename_disk = f'{donnee}_disk.bin'
-
-    if os.path.exists(filename):
-        with open(filename, 'rb') as fichier:
-            dico_duree_vie = pickle.load(fichier)
-        with open(filename_disk, 'rb') as fichier:
-            nb_disques = pickle.load(fichier)
-    else:
-        for fichier in tqdm(fichiers):
-            dataframe = pd.read_csv(fichier, sep='\t')
+def extraire_valeurs(disques, annee_voulu, smart_list):
+    """
+    Retourne, pour chaque donnée SMART, le nombre de disques des années voulues dont la dernière
+    valeur est non nulle et cette valeur, par numéro de série.
+    """
+    valeurs = {smart: [0, {}] for smart in smart_list}
 
-            # Sélection des années voulues
-            if any(os.path.basename(fichier).startswith(str(annee)) for annee in annee_voulu):
+    for nom, dataframe in disques:
 
-                valeur_totale = dataframe.iloc[0][donnee]
-                if isinstance(valeur_totale, str):
-                    valeur_totale = valeur_totale.replace(',', '.')[:-2]
-                else:
-                    if math.isnan(valeur_totale):
-                        continue
+        # Sélection des années voulues
+        if any(nom.startswith(str(annee)) for annee in annee_voulu):
 
-                if valeur_totale in ['0,0', '0', '', '0.0']:
+            premiere_ligne = dataframe.iloc[0]
+            for smart in smart_list:
+                valeur_totale = premiere_ligne[smart]
+                if math.isnan(valeur_totale) or valeur_totale == 0:
                     continue
-                nb_disques += 1
-                serial_number = dataframe.iloc[0]['serial_number']
-                dico_duree_vie[serial_number] = int(valeur_totale)
+                valeurs[smart][0] += 1
+                valeurs[smart][1][premiere_ligne['serial_number']] = int(valeur_totale)
 
-    # Pour sauvegarder
-    with open(filename, 'wb') as fichier:
-        pickle.dump(dico_duree_vie, fichier)
-    with open(filename_disk, 'wb') as fichier:
-        pickle.dump(nb_disques, fichier)
+    return valeurs
 
-    dico_duree_vie = dict(sorted(dico_duree_vie.items(), key=lambda x: x[1]))
-    for _ in range(0):
-        dico_duree_vie.popitem()
 
-    # Phase de subdivition
-    min_value = int(min(dico_duree_vie.values(), key=int))
-    max_value = int(max(dico_duree_vie.values(), key=int))
-    print(f'# Pour {donnee} : max {max_value} et min {min_value}')
+def calcul_vie_donnee_smart_valeur(
+    fichiers, annee_voulu, donnee, nb_points, methode='lineaire', *, valeurs=None
+):
+    """
+    Fonction qui permet de préparer le calcul pour la courbe en baignoire pour les données SMART
+    Si les valeurs ne sont pas données (voir analyser_resultats()), les résultats sont lus.
+    """
 
-    # Générer les points subdivisés
-    points = np.linspace(min_value, max_value, num=nb_points)
+    print()
+    print()
+    print(f'-> Ajouter duree de vie pour {donnee}')
+    cle = cle_cache(
+        empreinte_fichiers(fichiers), 'baignoire', list(annee_voulu), donnee, nb_points, methode
+    )
+    trouve, resultat = lire_cache(cle)
+    if trouve:
+        print("<- Fin de l'ajout duree de vie")
+        return resultat
+
+    if valeurs is None:
+        valeurs = analyser_resultats(fichiers, {'valeurs': (annee_voulu, [donnee])})['valeurs'][
+            donnee
+        ]
+    nb_disques, dico_duree_vie = valeurs
+
+    valeurs = np.fromiter(dico_duree_vie.values(), dtype=np.int64, count=len(dico_duree_vie))
+    print(f'# Pour {donnee} : max {valeurs.max()} et min {valeurs.min()}')
+    resultat = regrouper_valeurs(valeurs, nb_points, methode), nb_disques
+    ecrire_cache(cle, resultat)
 
-    dico_organise = {}
+    print("<- Fin de l'ajout duree de vie")
+    return resultat
 
-    for key, val in dico_duree_vie.items():
-        # Trouver la valeur la plus proche dans les points subdivisés
-        new_val = min(points, key=lambda x: abs(x - int(val)))  # pylint: disable=cell-var-from-loop
-        dico_organise[key] = new_val
 
-    dico_organise = dict(sorted(dico_organise.items()))
+def subdiviser(valeurs, nb_points, methode='lineaire'):
+    """
+    Retourne les points (triés) de la subdivision des valeurs :
+    - lineaire : points régulièrement espacés entre le minimum et le maximum
+    - log : points régulièrement espacés sur une échelle logarithmique, adaptés aux compteurs à
+      queue lourde (smart_1_raw, smart_7_raw, etc.)
+    - quantile : chaque point regroupe à peu près le même nombre de disques
+    """
+    if methode == 'lineaire':
+        return np.linspace(valeurs.min(), valeurs.max(), num=nb_points)
+    if methode == 'log':
+        return np.geomspace(max(valeurs.min(), 1), max(valeurs.max(), 1), num=nb_points)
+    if methode == 'quantile':
+        return np.unique(np.quantile(valeurs, np.linspace(0, 1, num=nb_points)))
+    raise ValueError(f'Méthode de subdivision inconnue : {methode}')
 
-    print("<- Fin de l'ajout duree de vie")
-    return Counter(dico_organise.values()), nb_disques
+
+def regrouper_valeurs(valeurs, nb_points, methode='lineaire'):
+    """
+    Associe chaque valeur au point de la subdivision le plus proche et retourne le nombre de
+    valeurs par point. Une recherche dichotomique dans les points triés donne les deux points
+    qui encadrent chaque valeur ; le plus proche est retenu, le plus petit en cas d'égalité.
+    """
+    points = subdiviser(valeurs, nb_points, methode)
+    haut = np.clip(np.searchsorted(points, valeurs), 0, len(points) - 1)
+    bas = np.clip(haut - 1, 0, len(points) - 1)
+    plus_proche = np.where(
+        np.abs(valeurs - points[haut]) < np.abs(valeurs - points[bas]), haut, bas
+    )
+    indices, nb_valeurs = np.unique(plus_proche, return_counts=True)
+    return Counter(dict(zip(points[indices], nb_valeurs.tolist())))
 
 
 def init_courbe_baignoire():
@@ -345,8 +490,39 @@ def weib(x_axis, k, scale):
     return (k / scale) * (x_axis / scale) ** (k - 1) * np.exp(-((x_axis / scale) ** k))
 
 
-def tracer_courbe_baignoire(annees_voulues, duree, nb_disques, dict_baignoire, donnee):
-    """Fonction qui trace la courbe en baignoire."""
+def sauver_ajustement(donnee, ajustement):
+    """Sauvegarde les paramètres des lois de Weibull ajustées dans weibull_<donnee>.csv."""
+    with open(f'weibull_{donnee}.csv', 'w', newline='', encoding='utf-8') as fichier:
+        writer = csv.writer(fichier)
+        writer.writerow(
+            ['modele', 'phase', 'debut', 'fin', 'forme', 'echelle', 'log_vraisemblance', 'nb_pannes']
+        )
+        for modele, phases in ajustement.items():
+            for numero, phase in enumerate(phases or []):
+                if phase is None:
+                    continue
+                writer.writerow(
+                    [
+                        modele,
+                        numero + 1,
+                        phase['debut'],
+                        phase['fin'],
+                        phase['forme'],
+                        phase['echelle'],
+                        phase['log_vraisemblance'],
+                        phase['nb_pannes'],
+                    ]
+                )
+
+
+def tracer_courbe_baignoire(
+    annees_voulues, duree, nb_disques, dict_baignoire, donnee, *, ajustement=None
+):
+    """
+    Fonction qui trace la courbe en baignoire.
+    Si l'ajustement est donné (voir graph_weibull.ajuster_courbe()), le taux de panne des lois de
+    Weibull ajustées est ajouté au CSV et au graphique, et leurs paramètres sont sauvegardés.
+    """
     # Calcul du nombre cumulatif de défaillances
     x_axis = sorted(dict_baignoire.keys())
     print('-> Début du tracer de la courbe en baignoire')
@@ -356,16 +532,33 @@ def tracer_courbe_baignoire(annees_voulues, duree, nb_disques, dict_baignoire, d
         y_axis.append(dict_baignoire[mois] / nb_disques)
         nb_disques -= dict_baignoire[mois]
 
+    # Taux de panne des modèles ajustés
+    modeles = {
+        modele: phases
+        for modele, phases in (ajustement or {}).items()
+        if phases is not None and any(phase is not None for phase in phases)
+    }
+    y_modeles = {modele: taux_panne_modele(x_axis, phases) for modele, phases in modeles.items()}
+
     # Sauvegarde des valeurs
     fichier_csv = 'baignoire_' + donnee + '.csv'
     with open(fichier_csv, 'w', newline='', encoding='utf-8') as fichier:
         writer = csv.writer(fichier)
-        writer.writerow(['x', 'y'])  # Écriture de l'en-tête
-        writer.writerows(zip(x_axis, y_axis))  # Écriture des données
+        writer.writerow(['x', 'y'] + [f'y_{modele}' for modele in y_modeles])  # Écriture de l'en-tête
+        writer.writerows(zip(x_axis, y_axis, *y_modeles.values()))  # Écriture des données
+    if ajustement is not None:
+        sauver_ajustement(donnee, ajustement)
 
     # Tracé des points et de la courbe de tendance
     plt.figure(figsize=(10, 6))
     plt.plot(x_axis, y_axis, '.', label='Données')
+    for modele, y_modele in y_modeles.items():
+        parametres = ', '.join(
+            f'k={phase["forme"]:.3g} λ={phase["echelle"]:.3g}'
+            for phase in modeles[modele]
+            if phase is not None
+        )
+        plt.plot(x_axis, y_modele, '-', label=f'{modele} ({parametres})')
 
     annee_string = ''
     for annee_voulue in annees_voulues:
@@ -375,30 +568,185 @@ def tracer_courbe_baignoire(annees_voulues, duree, nb_disques, dict_baignoire, d
     plt.title(donnee + annee_string)
     plt.xlabel('Temps (en ' + duree + ' )')
     plt.ylabel('Taux de disque en panne')
+    plt.legend()
 
     # Afficher le graphique
     plt.savefig(f'baignoire_{donnee}.png')
     plt.show(block=False)
 
 
-# ====================     Main     ====================
+def tracer_courbes_baignoire(courbes, phases=False):
+    """
+    Ajuste en parallèle les lois de Weibull de toutes les courbes en baignoire, puis les trace.
+    Chaque courbe est donnée par les arguments de tracer_courbe_baignoire().
+    """
+    print('-> Ajustement des lois de Weibull')
+    ajustements = ajuster_courbes([courbe[3] for courbe in courbes], phases)
+    for courbe, ajustement in zip(courbes, ajustements):
+        tracer_courbe_baignoire(*courbe, ajustement=ajustement)
 
 
-def main():
-    """Entry point."""
-    print('-----------------------------------------------------------')
-    print()
-    print('---------------  SR09  ~  Tracé des graphs  ---------------')
-    print()
-    print('-----------------------------------------------------------')
-    print()
-    print()
+def tracer_courbe_survie(fichier):
+    """
+    Trace la survie (Kaplan-Meier) et le taux de panne annualisé de tous les disques en fonction
+    de leur âge, à partir du fichier <date>_survival.csv de bbdata_parser.py --survival.
+    Contrairement à la courbe en baignoire, les disques qui ne sont pas tombés en panne sont pris
+    en compte.
+    """
+    print('-> Début du tracer de la courbe de survie')
+    survie = pd.read_csv(fichier, sep='\t', decimal=',')
+    age_mois = (survie['age_start_days'] + survie['age_end_days'] + 1) / 2 / 30
+
+    _, (axe_survie, axe_taux) = plt.subplots(2, 1, figsize=(10, 10), sharex=True)
+    axe_survie.step(age_mois, survie['km_survival'], where='mid')
+    axe_survie.set_title('Survie de Kaplan-Meier')
+    axe_survie.set_ylabel('Proportion de disques en vie')
+    axe_taux.plot(age_mois, survie['annualized_failure_rate'], '.-')
+    axe_taux.set_title('Taux de panne annualisé')
+    axe_taux.set_xlabel('Âge (en mois)')
+    axe_taux.set_ylabel('Taux de panne annualisé (%)')
+
+    plt.savefig('survie.png')
+    plt.show(block=False)
 
-    # Variables
-    fichiers = parcourir_repertoire(NOM_FICHIER)
-    choix_mois = 'mois'
 
-    # Créer le parseur d'arguments
+# --------------------- Lecture unique des résultats ---------------------
+
+
+def colonnes_necessaires(analyses):
+    """Retourne les colonnes des fichiers de résultats nécessaires aux analyses demandées."""
+    colonnes = {'date', 'serial_number', 'result_filename'}
+    if 'moyenne' in analyses:
+        colonnes.update(analyses['moyenne'])
+    if 'duree_vie' in analyses:
+        colonnes.add('smart_9_raw')
+    if 'valeurs' in analyses:
+        colonnes.update(analyses['valeurs'][1])
+    return colonnes
+
+
+def analyser_fichier(fichier, analyses):
+    """Lit un fichier de résultats et calcule le résultat partiel de chaque analyse demandée."""
+    disques = [
+        (nom, dataframe)
+        for nom, dataframe in lire_fichier_disques(fichier, colonnes_necessaires(analyses))
+        if not dataframe.empty
+    ]
+    resultats = {}
+    if 'moyenne' in analyses:
+        resultats['moyenne'] = agreger_disques(disques, analyses['moyenne'])
+    if 'duree_vie' in analyses:
+        resultats['duree_vie'] = extraire_durees_vie(disques, *analyses['duree_vie'])
+    if 'valeurs' in analyses:
+        resultats['valeurs'] = extraire_valeurs(disques, *analyses['valeurs'])
+    return resultats
+
+
+def cles_analyses(fichiers, analyses):
+    """
+    Retourne la clé du cache de chaque résultat des analyses demandées, par (analyse, donnée SMART).
+    Les valeurs des données SMART sont mises en cache séparément pour chaque donnée.
+    """
+    empreinte = empreinte_fichiers(fichiers)
+    cles = {}
+    if 'moyenne' in analyses:
+        cles[('moyenne', None)] = cle_cache(empreinte, 'moyenne', list(analyses['moyenne']))
+    if 'duree_vie' in analyses:
+        annee_voulu, duree = analyses['duree_vie']
+        cles[('duree_vie', None)] = cle_cache(empreinte, 'duree_vie', list(annee_voulu), duree)
+    if 'valeurs' in analyses:
+        annee_voulu, smart_list = analyses['valeurs']
+        for smart in smart_list:
+            cles[('valeurs', smart)] = cle_cache(empreinte, 'valeurs', list(annee_voulu), smart)
+    return cles
+
+
+def analyser_resultats(fichiers, analyses, taille_fusion=256):
+    """
+    Calcule les analyses demandées (voir lire_resultats()). Les résultats déjà calculés sur les
+    mêmes fichiers avec les mêmes paramètres sont lus dans le cache ; les autres sont calculés en
+    une seule lecture des résultats, puis ajoutés au cache.
+    """
+    resultats = {'moyenne': None, 'duree_vie': [0, {}], 'valeurs': {}}
+    manquants = {}
+    for (analyse, smart), cle in cles_analyses(fichiers, analyses).items():
+        trouve, valeur = lire_cache(cle)
+        if not trouve:
+            manquants[(analyse, smart)] = cle
+        elif analyse == 'valeurs':
+            resultats['valeurs'][smart] = valeur
+        else:
+            resultats[analyse] = valeur
+
+    if not manquants:
+        return resultats
+
+    analyses_manquantes = {
+        analyse: parametres
+        for analyse, parametres in analyses.items()
+        if analyse != 'valeurs' and (analyse, None) in manquants
+    }
+    if 'valeurs' in analyses:
+        smart_list = [smart for analyse, smart in manquants if analyse == 'valeurs']
+        if smart_list:
+            analyses_manquantes['valeurs'] = (analyses['valeurs'][0], smart_list)
+
+    lus = lire_resultats(fichiers, analyses_manquantes, taille_fusion)
+    for (analyse, smart), cle in manquants.items():
+        if analyse == 'valeurs':
+            valeur = resultats['valeurs'][smart] = lus['valeurs'][smart]
+        else:
+            valeur = resultats[analyse] = lus[analyse]
+        ecrire_cache(cle, valeur)
+    return resultats
+
+
+def lire_resultats(fichiers, analyses, taille_fusion=256):
+    """
+    Lit une seule fois chaque fichier de résultats (seulement les colonnes nécessaires) et calcule
+    toutes les analyses demandées, en parallèle sur les fichiers :
+    - moyenne : liste des données SMART dont on veut la moyenne par trace (remplir_dico_moyenne())
+    - duree_vie : (années voulues, durée) pour la courbe en baignoire (calcul_duree_vie())
+    - valeurs : (années voulues, liste des données SMART) pour les courbes en baignoire des données
+      SMART (calcul_vie_donnee_smart_valeur())
+    """
+    print(f'-> Lecture des résultats pour les analyses : {", ".join(analyses)}')
+    agregats = []
+    durees_vie = [0, {}]
+    valeurs = {smart: [0, {}] for smart in analyses.get('valeurs', ([], []))[1]}
+
+    with multiprocessing.Pool(processes=None) as pool:
+        for resultats in tqdm(
+            map(
+                collect_task,
+                pool.imap(partial(run_task, partial(analyser_fichier, analyses=analyses)), fichiers),
+            ),
+            total=len(fichiers),
+        ):
+            if resultats.get('moyenne') is not None:
+                agregats.append(resultats['moyenne'])
+                if len(agregats) >= taille_fusion:
+                    agregats = [fusionner_agregats(agregats)]
+            if 'duree_vie' in resultats:
+                durees_vie[0] += resultats['duree_vie'][0]
+                durees_vie[1].update(resultats['duree_vie'][1])
+            for smart, (nb_disques, valeurs_disques) in resultats.get('valeurs', {}).items():
+                valeurs[smart][0] += nb_disques
+                valeurs[smart][1].update(valeurs_disques)
+
+    print('<- Fin de la lecture des résultats')
+    return {
+        'moyenne': fusionner_agregats(agregats) if agregats else None,
+        'duree_vie': durees_vie,
+        'valeurs': valeurs,
+    }
+
+
+# ====================     Main     ====================
+
+
+def creer_parseur():
+    """Crée le parseur des arguments de la ligne de commande."""
     parser = argparse.ArgumentParser(description='?')
     parser.add_argument(
         '--donnee-smart',
@@ -442,85 +790,170 @@ def main():
         help='Permet de donner si on le souhaite la liste des données smarts, pour les courbes de Weibull. Syntaxe : [smart_5_raw, smart_1_raw]. Une valeur par défaut est déjà présente.',
     )
 
+    parser.add_argument(
+        '--nb-points',
+        '-n',
+        type=int,
+        default=100,
+        help='Nombre de points de la subdivision des valeurs des données SMART, pour les courbes de '
+        'Weibull. La valeur par défaut est 100.',
+    )
+
+    parser.add_argument(
+        '--methode-subdivision',
+        '-m',
+        choices=['lineaire', 'log', 'quantile'],
+        default='lineaire',
+        help='Subdivision des valeurs des données SMART, pour les courbes de Weibull : "lineaire" (par '
+        'défaut), "log" (échelle logarithmique, pour les compteurs à queue lourde) ou "quantile" '
+        '(même nombre de disques par point).',
+    )
+
+    parser.add_argument(
+        '--weibull-phases',
+        action='store_true',
+        help='Ajuste aussi une loi de Weibull sur chacune des trois phases de la courbe en baignoire '
+        '(mortalité infantile, vie utile, usure).',
+    )
+
+    parser.add_argument(
+        '--courbe-survie',
+        type=str,
+        help='Trace la survie et le taux de panne de tous les disques par âge, à partir du fichier '
+        '<date>_survival.csv créé par bbdata_parser.py --survival.',
+    )
+
+    parser.add_argument(
+        '--repertoire-cache',
+        type=str,
+        default=REPERTOIRE_CACHE,
+        help=f'Répertoire du cache des calculs par disque. La valeur par défaut est "{REPERTOIRE_CACHE}".',
+    )
+
+    parser.add_argument(
+        '--taille-cache',
+        type=int,
+        default=TAILLE_MAX_CACHE // (1024 * 1024),
+        help='Taille maximale du cache en Mo : les entrées les moins récemment utilisées sont supprimées '
+        'au-delà. La valeur par défaut est 512.',
+    )
+
+    parser.add_argument(
+        '--profile',
+        type=str,
+        nargs='?',
+        const=RAPPORT_PROFIL,
+        help='Mesure chaque étape (temps, CPU, mémoire, fichiers lus, latence par fichier, cache) et '
+        f'écrit le rapport json dans le fichier donné. La valeur par défaut est "{RAPPORT_PROFIL}".',
+    )
+
+    parser.add_argument(
+        '--profile-etape',
+        type=str,
+        help='Étape profilée avec cProfile (fichier .prof à côté du rapport), par exemple : lecture_resultats',
+    )
+
+    return parser
+
+
+def planifier_analyses(args):
+    """Retourne les analyses demandées par les arguments de la ligne de commande (voir lire_resultats())."""
+    analyses = {}
+    if args.donnee_smart:
+        liste_des_donnees_smart = DONNEES_SMART
+        if args.liste_donnee_smart is not None:
+            liste_des_donnees_smart = chaine_caractere_vers_liste_string(args.liste_donnee_smart)
+        analyses['moyenne'] = liste_des_donnees_smart
+
+    if args.weibull_annee_voulu:
+        choix_mois = 'mois'
+        if args.weibull_periode_voulu in ['mois', 'trimestre']:
+            choix_mois = args.weibull_periode_voulu
+        annees_voulues = chaine_caractere_vers_liste_int(args.weibull_annee_voulu)
+        analyses['duree_vie'] = (annees_voulues, choix_mois)
+
+    if args.weibull_donnee_smart:
+        liste_des_donnees_smart_courbe_weibull = DONNEES_SMART_WEIBULL
+        if args.weibull_donnee_smart_voulu is not None:
+            liste_des_donnees_smart_courbe_weibull = chaine_caractere_vers_liste_string(
+                args.weibull_donnee_smart_voulu
+            )
+        analyses['valeurs'] = (ANNEES_DONNEES_SMART, liste_des_donnees_smart_courbe_weibull)
+
+    return analyses
+
+
+def main():
+    """Entry point."""
+    print('-----------------------------------------------------------')
+    print()
+    print('---------------  SR09  ~  Tracé des graphs  ---------------')
+    print()
+    print('-----------------------------------------------------------')
+    print()
+    print()
+
+    # Variables
+    fichiers = parcourir_repertoire(NOM_FICHIER)
+
+    parser = creer_parseur()
+
     # Analyser les arguments de la ligne de commande
     args = parser.parse_args()
+    configurer_cache(args.repertoire_cache, args.taille_cache * 1024 * 1024)
+    if args.profile:
+        enable_profiling(args.profile, args.profile_etape)
+
+    # Planification des analyses : les résultats ne sont lus qu'une fois pour toutes les analyses
+    analyses = planifier_analyses(args)
 
-    if args.d:
+    with profile_stage('lecture_resultats'):
+        resultats = analyser_resultats(fichiers, analyses) if analyses else {}
+
+    if args.donnee_smart:
         # ====================     Données smart     ====================
         print('--------------- Traitement des donées smart  --------------')
 
-        if args.e is not None:
-            liste_des_donnees_smart = chaine_caractere_vers_liste_string(args.e)
-        else:
-            liste_des_donnees_smart = [
-                'smart_1_raw',
-                'smart_2_raw',
-                'smart_3_raw',
-                'smart_5_raw',
-                'smart_7_raw',
-                'smart_10_raw',
-                'smart_11_raw',
-                'smart_22_raw',
-                'smart_160_raw',
-                'smart_165_raw',
-                'smart_167_raw',
-                'smart_173_raw',
-                'smart_174_raw',
-                'smart_177_raw',
-                'smart_178_raw',
-                'smart_183_raw',
-                'smart_187_raw',
-                'smart_188_raw',
-                'smart_190_raw',
-                'smart_196_raw',
-                'smart_197_raw',
-                'smart_198_raw',
-                'smart_201_raw',
-                'smart_220_raw',
-            ]
-
-        ajouter_colonne_trace(fichiers)
-        dictio = remplir_dico_moyenne(fichiers, liste_des_donnees_smart)
-        tracer_dico(dictio)
-
-    if args.b:
-        print('---------- Traitement de la courbe en baignoire  ----------')
-        if args.p in ['mois', 'trimestre']:
-            choix_mois = args.p
-
-        annees_voulues = chaine_caractere_vers_liste_int(args.b)
-
-        # ====================     Courbe en baignoire     ====================
-        nb_disques = calcul_duree_vie(fichiers, annees_voulues, choix_mois)
-        dict_baignoire = init_courbe_baignoire()
-        tracer_courbe_baignoire(annees_voulues, choix_mois, nb_disques, dict_baignoire, 'durée vie')
-
-    if args.s:
-
-        if args.w is not None:
-            liste_des_donnees_smart_courbe_weibull = chaine_caractere_vers_liste_string(args.w)
-        else:
-            liste_des_donnees_smart_courbe_weibull = [
-                'smart_220_raw',
-                'smart_1_raw',
-                'smart_5_raw',
-                'smart_7_raw',
-                'smart_11_raw',
-                'smart_167_raw',
-                'smart_183_raw',
-                'smart_187_raw',
-                'smart_188_raw',
-                'smart_196_raw',
-                'smart_197_raw',
-                'smart_198_raw',
-                'smart_201_raw',
-            ]
-
-        for smart in liste_des_donnees_smart_courbe_weibull:
-            dico, nb_disques = calcul_vie_donnee_smart_valeur(
-                fichiers, [2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020, 2021, 2022], smart, 100
+        with profile_stage('moyenne'):
+            dictio = remplir_dico_moyenne(fichiers, analyses['moyenne'], resultats['moyenne'])
+            tracer_dico(dictio)
+
+    courbes = []
+    with profile_stage('baignoire'):
+        if args.weibull_annee_voulu:
+            print('---------- Traitement de la courbe en baignoire  ----------')
+
+            # ====================     Courbe en baignoire     ====================
+            annees_voulues, choix_mois = analyses['duree_vie']
+            nb_disques = calcul_duree_vie(
+                fichiers, annees_voulues, choix_mois, resultats['duree_vie']
             )
-            tracer_courbe_baignoire([2013, 2022], 'mois', nb_disques, dico, smart)
+            dict_baignoire = init_courbe_baignoire()
+            courbes.append((annees_voulues, choix_mois, nb_disques, dict_baignoire, 'durée vie'))
+
+        if args.weibull_donnee_smart:
+
+            for smart in analyses['valeurs'][1]:
+                dico, nb_disques = calcul_vie_donnee_smart_valeur(
+                    fichiers,
+                    ANNEES_DONNEES_SMART,
+                    smart,
+                    args.nb_points,
+                    args.methode_subdivision,
+                    valeurs=resultats['valeurs'].get(smart),
+                )
+                courbes.append(([2013, 2022], 'mois', nb_disques, dico, smart))
+
+    if courbes:
+        with profile_stage('ajustement'):
+            tracer_courbes_baignoire(courbes, args.weibull_phases)
+
+    if args.courbe_survie:
+        print('------------- Traitement de la courbe de survie -----------')
+        with profile_stage('survie'):
+            tracer_courbe_survie(args.courbe_survie)
+
+    afficher_statistiques_cache()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,112 @@
+"""
+Created on 17 Oct. 2026.
+
+Cache des calculs par disque de graph.py.
+
+Chaque entrée est un fichier pickle dont le nom est l'empreinte (sha256) de sa clé : empreinte de
+l'ensemble des fichiers de résultats lus (chemin, taille et date de modification), nom du calcul
+et paramètres (données SMART, années voulues, subdivision, etc.). Une modification des résultats
+ou des paramètres donne donc une autre clé : le cache n'est jamais périmé.
+
+La taille du cache est bornée : les entrées les moins récemment utilisées sont supprimées en premier.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import Counter
+
+from bbdata_profiling import record_cache_hit
+
+# ====================     Variables Globales    ====================
+REPERTOIRE_CACHE = '.cache_graph'
+TAILLE_MAX_CACHE = 512 * 1024 * 1024
+STATISTIQUES_CACHE = Counter()
+
+
+def configurer_cache(repertoire=None, taille_max=None):
+    """Change le répertoire et la taille maximale (en octets) du cache, puis applique cette taille."""
+    global REPERTOIRE_CACHE, TAILLE_MAX_CACHE  # pylint: disable=global-statement
+    if repertoire is not None:
+        REPERTOIRE_CACHE = repertoire
+    if taille_max is not None:
+        TAILLE_MAX_CACHE = taille_max
+    if os.path.isdir(REPERTOIRE_CACHE):
+        evincer_cache()
+
+
+def empreinte_fichiers(fichiers):
+    """Retourne l'empreinte de l'ensemble des fichiers : chemin, taille et date de modification."""
+    empreinte = hashlib.sha256()
+    for fichier in sorted(fichiers):
+        statistiques = os.stat(fichier)
+        empreinte.update(
+            f'{os.path.abspath(fichier)}\t{statistiques.st_size}\t{statistiques.st_mtime_ns}\n'.encode()
+        )
+    return empreinte.hexdigest()
+
+
+def cle_cache(*elements):
+    """Retourne la clé du cache correspondant aux éléments (chaînes, nombres, listes, tuples)."""
+    return hashlib.sha256(repr(elements).encode()).hexdigest()
+
+
+def chemin_cache(cle):
+    """Retourne le chemin du fichier du cache correspondant à la clé."""
+    return os.path.join(REPERTOIRE_CACHE, f'{cle}.pkl')
+
+
+def lire_cache(cle):
+    """
+    Retourne (True, valeur) si la clé est dans le cache, (False, None) sinon.
+    La date de modification de l'entrée est mise à jour : elle sert à l'éviction.
+    """
+    chemin = chemin_cache(cle)
+    try:
+        with open(chemin, 'rb') as fichier:
+            valeur = pickle.load(fichier)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        STATISTIQUES_CACHE['echecs'] += 1
+        return False, None
+
+    os.utime(chemin)
+    STATISTIQUES_CACHE['succes'] += 1
+    record_cache_hit()
+    return True, valeur
+
+
+def ecrire_cache(cle, valeur):
+    """Ajoute la valeur au cache, puis supprime les entrées les plus anciennes si besoin."""
+    os.makedirs(REPERTOIRE_CACHE, exist_ok=True)
+    chemin = chemin_cache(cle)
+    with open(f'{chemin}.tmp', 'wb') as fichier:
+        pickle.dump(valeur, fichier, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{chemin}.tmp', chemin)
+    STATISTIQUES_CACHE['ecritures'] += 1
+    evincer_cache()
+
+
+def evincer_cache():
+    """Supprime les entrées les moins récemment utilisées jusqu'à respecter la taille maximale."""
+    entrees = []
+    for nom in os.listdir(REPERTOIRE_CACHE):
+        if nom.endswith('.pkl'):
+            statistiques = os.stat(os.path.join(REPERTOIRE_CACHE, nom))
+            entrees.append((statistiques.st_mtime_ns, statistiques.st_size, nom))
+
+    taille = sum(taille_entree for _, taille_entree, _ in entrees)
+    for _, taille_entree, nom in sorted(entrees):
+        if taille <= TAILLE_MAX_CACHE:
+            break
+        os.remove(os.path.join(REPERTOIRE_CACHE, nom))
+        taille -= taille_entree
+        STATISTIQUES_CACHE['evictions'] += 1
+
+
+def afficher_statistiques_cache():
+    """Affiche le nombre de succès, d'échecs, d'écritures et d'évictions du cache."""
+    print(
+        f'# Cache {REPERTOIRE_CACHE} : {STATISTIQUES_CACHE["succes"]} succès, '
+        f'{STATISTIQUES_CACHE["echecs"]} échecs, {STATISTIQUES_CACHE["ecritures"]} écritures, '
+        f'{STATISTIQUES_CACHE["evictions"]} évictions'
+    )
@@ -0,0 +1,158 @@
+"""
+Created on 17 Oct. 2026.
+
+Ajustement de lois de Weibull sur les courbes en baignoire de graph.py.
+
+Les données sont groupées : chaque valeur (durée de vie en mois, valeur d'une donnée SMART) est
+associée au nombre de disques tombés en panne à cette valeur. Les paramètres sont estimés par
+maximum de vraisemblance : à forme k fixée, l'échelle optimale a une expression explicite, donc la
+vraisemblance profilée ne dépend que de k. Elle est évaluée en une seule opération NumPy sur une
+grille de formes, puis sur des grilles de plus en plus fines autour du maximum.
+
+Le modèle par phases ajuste une loi de Weibull sur chacune des trois phases de la courbe en
+baignoire (mortalité infantile, vie utile, usure). Dans une phase, les disques sont tronqués à gauche
+au début de la phase et les disques encore en vie à sa fin sont censurés à droite. Les bornes des
+phases sont choisies parmi des quantiles des pannes, pour maximiser la vraisemblance totale.
+"""
+
+import multiprocessing
+from functools import partial
+from itertools import combinations
+
+import numpy as np
+
+# ====================     Variables Globales    ====================
+GRILLE_FORMES = np.geomspace(0.05, 20, num=400)
+NB_AFFINAGES = 3
+QUANTILES_PHASES = np.linspace(0.05, 0.95, num=19)
+
+
+def log_vraisemblance_profilee(formes, valeurs, nombres, debut=0.0, fin=np.inf):
+    """
+    Retourne, pour chaque forme, la log-vraisemblance profilée et l'échelle optimale des pannes
+    observées dans [debut, fin[ (valeurs strictement positives, avec leur nombre de pannes).
+    Les pannes antérieures sont ignorées (troncature) et les pannes postérieures sont censurées.
+    """
+    dans_phase = (valeurs >= debut) & (valeurs < fin)
+    valeurs_phase, nombres_phase = valeurs[dans_phase], nombres[dans_phase]
+    nb_pannes = nombres_phase.sum()
+    nb_survivants = nombres[valeurs >= fin].sum()
+
+    debut_formes = debut**formes
+    fin_formes = np.zeros_like(formes) if nb_survivants == 0 else fin**formes
+    puissances = valeurs_phase[np.newaxis, :] ** formes[:, np.newaxis]
+    theta = (
+        ((puissances - debut_formes[:, np.newaxis]) * nombres_phase).sum(axis=1)
+        + nb_survivants * (fin_formes - debut_formes)
+    ) / nb_pannes
+
+    log_vraisemblance = (
+        nb_pannes * (np.log(formes) - np.log(theta) - 1)
+        + (formes - 1) * (nombres_phase * np.log(valeurs_phase)).sum()
+    )
+    return log_vraisemblance, theta ** (1 / formes)
+
+
+def ajuster_weibull(valeurs, nombres, debut=0.0, fin=np.inf):
+    """
+    Ajuste une loi de Weibull par maximum de vraisemblance sur les pannes de [debut, fin[.
+    Retourne la forme, l'échelle, la log-vraisemblance et le nombre de pannes, ou None s'il n'y a
+    pas de panne dans la phase ou si le maximum est atteint au bord de la grille des formes.
+    """
+    nb_pannes = int(nombres[(valeurs >= debut) & (valeurs < fin)].sum())
+    if nb_pannes == 0:
+        return None
+
+    # Les valeurs sont normalisées pour éviter les dépassements de capacité dans x ** k
+    unite = valeurs.max()
+    valeurs, debut, fin = valeurs / unite, debut / unite, fin / unite
+
+    formes = GRILLE_FORMES
+    for _ in range(NB_AFFINAGES):
+        log_vraisemblance, echelles = log_vraisemblance_profilee(
+            formes, valeurs, nombres, debut, fin
+        )
+        meilleur = int(np.nanargmax(log_vraisemblance))
+        if formes is GRILLE_FORMES and meilleur in (0, len(formes) - 1):
+            # Pas de maximum à l'intérieur de la grille : la loi est dégénérée
+            return None
+        forme, echelle = formes[meilleur], echelles[meilleur]
+        formes = np.geomspace(
+            formes[max(meilleur - 1, 0)], formes[min(meilleur + 1, len(formes) - 1)], num=50
+        )
+
+    return {
+        'debut': float(debut * unite),
+        'fin': float(fin * unite),
+        'forme': float(forme),
+        'echelle': float(echelle * unite),
+        'log_vraisemblance': float(log_vraisemblance[meilleur] - nb_pannes * np.log(unite)),
+        'nb_pannes': nb_pannes,
+    }
+
+
+def ajuster_phases(valeurs, nombres):
+    """
+    Ajuste une loi de Weibull sur chacune des trois phases de la courbe en baignoire.
+    Retourne la liste des trois ajustements, ou None si les pannes ne permettent pas de découper
+    trois phases.
+    """
+    frequences_cumulees = np.cumsum(nombres) / nombres.sum()
+    bornes = np.unique(valeurs[np.searchsorted(frequences_cumulees, QUANTILES_PHASES)])
+
+    meilleures_phases, meilleure_log_vraisemblance = None, -np.inf
+    for borne_1, borne_2 in combinations(bornes, 2):
+        phases = [
+            ajuster_weibull(valeurs, nombres, debut, fin)
+            for debut, fin in [(0.0, borne_1), (borne_1, borne_2), (borne_2, np.inf)]
+        ]
+        if any(phase is None for phase in phases):
+            continue
+        log_vraisemblance = sum(phase['log_vraisemblance'] for phase in phases)
+        if log_vraisemblance > meilleure_log_vraisemblance:
+            meilleures_phases, meilleure_log_vraisemblance = phases, log_vraisemblance
+
+    return meilleures_phases
+
+
+def ajuster_courbe(dict_baignoire, phases=False):
+    """
+    Ajuste une loi de Weibull (et, si demandé, le modèle par phases) sur les pannes d'une courbe
+    en baignoire {valeur: nombre de pannes}. Les valeurs nulles ou négatives sont ignorées.
+    """
+    valeurs = np.array(sorted(dict_baignoire), dtype=float)
+    nombres = np.array([dict_baignoire[valeur] for valeur in sorted(dict_baignoire)], dtype=float)
+    positives = valeurs > 0
+    valeurs, nombres = valeurs[positives], nombres[positives]
+
+    ajustement = {'weibull': None, 'phases': None}
+    if nombres.sum() == 0:
+        return ajustement
+    # Une loi dégénérée (maximum au bord de la grille) n'est pas un modèle
+    weibull = ajuster_weibull(valeurs, nombres)
+    ajustement['weibull'] = None if weibull is None else [weibull]
+    if phases:
+        ajustement['phases'] = ajuster_phases(valeurs, nombres)
+    return ajustement
+
+
+def ajuster_courbes(dicts_baignoire, phases=False):
+    """Ajuste en parallèle (un processus par courbe) les lois de Weibull de plusieurs courbes."""
+    with multiprocessing.Pool(processes=None) as pool:
+        return pool.map(partial(ajuster_courbe, phases=phases), dicts_baignoire)
+
+
+def taux_panne_modele(x_axis, modele):
+    """
+    Retourne le taux de panne du modèle (liste de lois de Weibull par phase) entre chaque point de
+    la courbe en baignoire et le précédent : proportion des disques en vie au point précédent qui
+    tombent en panne avant le point, comme pour la courbe observée.
+    """
+    x_axis = np.asarray(x_axis, dtype=float)
+    risque_cumule = np.zeros_like(x_axis)
+    for phase in (phase for phase in modele if phase is not None):
+        x_phase = np.clip(x_axis, phase['debut'], phase['fin'])
+        risque_cumule += (x_phase / phase['echelle']) ** phase['forme'] - (
+            phase['debut'] / phase['echelle']
+        ) ** phase['forme']
+    return 1 - np.exp(-np.diff(risque_cumule, prepend=0.0))
@@ -0,0 +1,45 @@
+"""
+Created on 17 Oct. 2026.
+
+Shared fixtures of the tests: the modules of the repository are importable and run in a
+temporary working directory, where they create their data/, process/ and results/ folders.
+"""
+
+import os
+import sys
+
+import matplotlib
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+matplotlib.use('Agg')
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in an empty working directory holding data/parquet/ and process/."""
+    monkeypatch.chdir(tmp_path)
+    for directory in ['data/csv', 'data/parquet', 'process']:
+        os.makedirs(directory)
+    return tmp_path
+
+
+def write_daily_files(days):
+    """Write daily parquet files in data/parquet/, from {day: [(serial_number, failure), ...]}.
+
+    Each disk is a model 'M1' disk whose smart_9_raw grows by 24 hours a day and whose
+    smart_5_raw is the number of days since 2015-01-01.
+    """
+    for day, disks in days.items():
+        day_number = (pd.Timestamp(day) - pd.Timestamp('2015-01-01')).days
+        pd.DataFrame(
+            {
+                'date': day,
+                'serial_number': [serial_number for serial_number, _ in disks],
+                'model': 'M1',
+                'failure': [failure for _, failure in disks],
+                'smart_5_raw': float(day_number),
+                'smart_9_raw': [1000.0 + 24 * day_number] * len(disks),
+            }
+        ).to_parquet(f'data/parquet/{day}.parquet')
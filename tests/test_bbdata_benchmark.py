@@ -0,0 +1,34 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the comparison of benchmark runs of bbdata_benchmark.py.
+"""
+
+from bbdata_benchmark import BENCHMARK_SETTINGS, get_previous_run
+
+RUN = {
+    'drives': 200,
+    'days': 60,
+    'failure_rate': 0.5,
+    'smart_drift': 1.0,
+    'seed': 0,
+    'history_length_recent': 90,
+    'history_length_old': 30,
+    'workers': 1,
+    'prefetch': 2,
+    'layout': 'daily',
+    'compression': None,
+    'optimized': False,
+    'trace_memory': False,
+}
+
+
+def test_runs_are_compared_with_the_same_settings():
+    """A run is compared with the last stored run of the same scale and settings only."""
+    full_history_run = {**RUN, 'history_length_old': 0, 'timestamp': 'full'}
+    runs = [{**RUN, 'timestamp': 'first'}, full_history_run, {**RUN, 'smart_drift': 2.0}]
+
+    assert set(RUN) - {'drives', 'days'} == set(BENCHMARK_SETTINGS)
+    assert get_previous_run(runs, RUN)['timestamp'] == 'first'
+    assert get_previous_run(runs, {**RUN, 'history_length_old': 0}) is full_history_run
+    assert get_previous_run(runs, {**RUN, 'history_length_recent': 30}) is None
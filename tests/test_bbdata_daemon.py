@@ -0,0 +1,106 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the running state of bbdata_daemon.py.
+"""
+
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from conftest import write_daily_files
+
+from bbdata_daemon import (
+    DEFAULT_DAEMON_OPTIONS,
+    MOMENT_LEVELS,
+    is_outdated,
+    load_state,
+    merge_smart_moments,
+    update_state,
+)
+from bbdata_storage import PROCESS_DIR
+
+DAYS = {
+    '2015-01-02': [('A', 0), ('B', 0)],
+    '2015-01-03': [('A', 0), ('B', 1), ('C', 0)],
+    '2015-01-04': [('A', 0), ('C', 0)],
+}
+OPTIONS = {**DEFAULT_DAEMON_OPTIONS, 'prefetch': 0}
+
+
+def get_fresh_state():
+    """Return the running state built from all data files, without process files."""
+    shutil.rmtree(PROCESS_DIR)
+    os.makedirs(PROCESS_DIR)
+    return load_state(OPTIONS)
+
+
+def assert_same_state(state, fresh_state):
+    """Check that two running states hold the same aggregates."""
+    assert state['data_files'] == fresh_state['data_files']
+    for key, counts in state['age_counts'].items():
+        fresh_counts = fresh_state['age_counts'][key]
+        np.testing.assert_array_equal(np.trim_zeros(counts, 'b'), np.trim_zeros(fresh_counts, 'b'))
+    pd.testing.assert_frame_equal(state['smart_moments'], fresh_state['smart_moments'])
+
+
+def test_merge_smart_moments():
+    """Merged moments are the count, sum and sum of squared deviations of all values."""
+    values = [np.array([1.0, 2.0, 6.0]), np.array([3.0, 10.0])]
+    index = pd.MultiIndex.from_tuples([(0, 'smart_5_raw')], names=MOMENT_LEVELS)
+    moments_list = [
+        pd.DataFrame(
+            {'n': [len(part)], 'sum': [part.sum()], 'm2': [((part - part.mean()) ** 2).sum()]},
+            index=index,
+        )
+        for part in values
+    ]
+
+    moments = merge_smart_moments(moments_list).loc[(0, 'smart_5_raw')]
+
+    all_values = np.concatenate(values)
+    assert moments['n'] == len(all_values)
+    assert moments['sum'] == all_values.sum()
+    assert np.isclose(moments['m2'], ((all_values - all_values.mean()) ** 2).sum())
+
+
+def test_new_files_are_folded():
+    """Files dated after the last processed file are folded as if the state was built at once."""
+    write_daily_files(dict(list(DAYS.items())[:2]))
+    state = load_state(OPTIONS)
+    write_daily_files(dict(list(DAYS.items())[2:]))
+
+    update_state(state, ['2015-01-04.parquet'], OPTIONS)
+
+    assert_same_state(state, get_fresh_state())
+
+
+def test_backfilled_files_are_folded():
+    """A file dated before the last processed file, changing entry ages, updates all moments."""
+    write_daily_files(DAYS)
+    state = load_state(OPTIONS)
+    write_daily_files({'2015-01-01': [('A', 0), ('C', 0)]})
+    backfilled_file = pd.read_parquet('data/parquet/2015-01-01.parquet')
+    backfilled_file['smart_9_raw'] = 0.0
+    backfilled_file.to_parquet('data/parquet/2015-01-01.parquet')
+
+    update_state(state, ['2015-01-01.parquet'], OPTIONS)
+
+    assert_same_state(state, get_fresh_state())
+
+
+def test_rewritten_files_rebuild_the_state():
+    """A data file modified after the state was saved outdates it."""
+    write_daily_files(DAYS)
+    state = load_state(OPTIONS)
+    assert not is_outdated(state)
+    write_daily_files({'2015-01-03': [('A', 0), ('B', 0), ('C', 1)]})
+    future = time.time() + 10
+    os.utime('data/parquet/2015-01-03.parquet', (future, future))
+
+    assert is_outdated(state)
+    state = load_state(OPTIONS)
+
+    assert_same_state(state, get_fresh_state())
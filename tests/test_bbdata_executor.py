@@ -0,0 +1,91 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the task backends of bbdata_executor.py.
+"""
+
+import math
+import os
+import time
+
+import pytest
+
+import bbdata_executor
+from bbdata_executor import (
+    EXECUTOR,
+    QUEUE_LEASE_SECONDS,
+    claim_task,
+    configure_executor,
+    imap_tasks,
+    map_tasks,
+    prefetch_map,
+    release_expired_claims,
+    write_pickle,
+)
+
+TASKS = [(math.factorial, number) for number in range(8)]
+RESULTS = [math.factorial(number) for number in range(8)]
+
+
+@pytest.fixture(name='backend')
+def backend_fixture(request, workdir, monkeypatch):
+    """Run the test with the backend given as parameter, the queue in the working directory."""
+    monkeypatch.setattr(bbdata_executor, 'EXECUTOR', dict(EXECUTOR))
+    configure_executor(request.param, str(workdir / 'queue') + '/')
+    return request.param
+
+
+def make_job_dir(job_dir, shard_names):
+    """Create a queue job folder holding pending tasks."""
+    for sub_dir in ['tasks', 'claimed', 'results']:
+        os.makedirs(job_dir / sub_dir)
+    for shard_name in shard_names:
+        write_pickle(job_dir / 'tasks' / shard_name, (('math', 'factorial'), 3))
+    return f'{job_dir}/'
+
+
+@pytest.mark.usefixtures('backend')
+@pytest.mark.parametrize('backend', bbdata_executor.EXECUTOR_BACKENDS, indirect=True)
+@pytest.mark.parametrize('workers', [1, 3])
+def test_map_tasks_keeps_task_order(workers):
+    """Results are returned and yielded in task order, whatever the backend."""
+    assert map_tasks(TASKS, workers) == RESULTS
+    assert list(imap_tasks(TASKS, workers)) == RESULTS
+
+
+@pytest.mark.usefixtures('backend')
+@pytest.mark.parametrize('backend', ['queue'], indirect=True)
+def test_queue_task_errors_are_raised():
+    """A failed queued task raises an error naming its host and exception."""
+    with pytest.raises(RuntimeError, match='(?s)Task 1 failed on .*ValueError'):
+        map_tasks([(math.sqrt, 4), (math.sqrt, -1)], 2)
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_prefetch_map_keeps_item_order(prefetch):
+    """Items are processed ahead but yielded in order."""
+    assert list(prefetch_map(math.factorial, range(8), prefetch)) == RESULTS
+
+
+def test_claim_task_claims_each_task_once(workdir):
+    """Tasks are claimed in order, a single time each."""
+    job_dir = make_job_dir(workdir / 'job', ['000000.pkl', '000001.pkl'])
+
+    assert claim_task(job_dir) == '000000.pkl'
+    assert claim_task(job_dir) == '000001.pkl'
+    assert claim_task(job_dir) is None
+    assert sorted(os.listdir(job_dir + 'claimed')) == ['000000.pkl', '000001.pkl']
+
+
+def test_expired_claims_are_released(workdir):
+    """Claims not renewed for QUEUE_LEASE_SECONDS are given back to the queue."""
+    job_dir = make_job_dir(workdir / 'job', ['000000.pkl', '000001.pkl'])
+    claim_task(job_dir)
+    claim_task(job_dir)
+    expired = time.time() - QUEUE_LEASE_SECONDS - 1
+    os.utime(job_dir + 'claimed/000000.pkl', (expired, expired))
+
+    release_expired_claims(job_dir)
+
+    assert os.listdir(job_dir + 'tasks') == ['000000.pkl']
+    assert claim_task(job_dir) == '000000.pkl'
@@ -0,0 +1,72 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the lifecycle index of bbdata_lifecycle.py.
+"""
+
+import pandas as pd
+import pytest
+from conftest import write_daily_files
+
+from bbdata_lifecycle import get_lifecycle_index
+from bbdata_serials import load_serial_dictionary
+from bbdata_storage import PROCESS_DIR
+
+DAYS = {
+    '2015-01-01': [('A', 0), ('B', 0)],
+    '2015-01-02': [('A', 0), ('B', 1), ('C', 0)],
+    '2015-01-03': [('A', 0), ('B', 0), ('C', 0)],
+    '2015-01-04': [('A', 1), ('C', 0)],
+}
+
+
+def get_disk(lifecycle_index, serial_number):
+    """Return the row of a serial number of the lifecycle index."""
+    return lifecycle_index.set_index('serial_number').loc[serial_number]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_lifecycle_index(workers):
+    """Seen dates, failures and disks seen after their failure are indexed."""
+    write_daily_files(DAYS)
+
+    lifecycle_index = get_lifecycle_index(workers=workers, prefetch=0)
+
+    assert list(lifecycle_index['serial_number']) == ['A', 'B', 'C']
+    disk_b = get_disk(lifecycle_index, 'B')
+    assert (disk_b['first_seen'], disk_b['last_seen']) == ('2015-01-01', '2015-01-03')
+    assert list(disk_b['failure_dates']) == ['2015-01-02']
+    assert disk_b['seen_after_failure']
+    assert not get_disk(lifecycle_index, 'A')['seen_after_failure']
+    assert get_disk(lifecycle_index, 'C')['first_power_on_hours'] == 1024.0
+    serial_index = load_serial_dictionary()
+    assert list(serial_index[lifecycle_index['serial_id']]) == ['A', 'B', 'C']
+
+
+def test_lifecycle_index_folds_new_files(workdir):
+    """Files added after a run are folded in the index as if it was built at once."""
+    write_daily_files(dict(list(DAYS.items())[:2]))
+    get_lifecycle_index(workers=1, prefetch=0)
+    write_daily_files(dict(list(DAYS.items())[2:]))
+
+    lifecycle_index = get_lifecycle_index(workers=1, prefetch=0)
+
+    write_daily_files(DAYS)
+    for process_file in ['lifecycle_index_2015-01-01.parquet', 'state_2015-01-01.sqlite']:
+        (workdir / PROCESS_DIR / process_file).unlink()
+    pd.testing.assert_frame_equal(lifecycle_index, get_lifecycle_index(workers=1, prefetch=0))
+
+
+def test_lifecycle_index_without_serial_ids_is_rebuilt(workdir, capsys):
+    """An index written before serial number ids is rebuilt."""
+    write_daily_files(DAYS)
+    lifecycle_index = get_lifecycle_index(workers=1, prefetch=0)
+    lifecycle_path = workdir / PROCESS_DIR / 'lifecycle_index_2015-01-01.parquet'
+    lifecycle_index.drop(columns='serial_id').to_parquet(lifecycle_path)
+    write_daily_files({'2015-01-05': [('D', 0)]})
+
+    rebuilt_index = get_lifecycle_index(workers=1, prefetch=0)
+
+    assert 'Process file is outdated' in capsys.readouterr().out
+    assert list(rebuilt_index['serial_number']) == ['A', 'B', 'C', 'D']
+    assert 'serial_id' in rebuilt_index.columns
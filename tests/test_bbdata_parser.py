@@ -0,0 +1,60 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the extraction plan of bbdata_parser.py.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import write_daily_files
+
+from bbdata_parser import get_files_to_open, resolve_plan
+from bbdata_serials import load_serial_dictionary
+from bbdata_storage import get_parquet_data_files
+
+# Daily files of January 2015, without the 5th and the 12th
+DAYS = [f'2015-01-{day:02d}' for day in range(1, 21) if day not in (5, 12)]
+SN_DICT = {
+    'A': {'file': '2015-01-18.parquet', 'start_file': '2015-01-02.parquet'},
+    # Recent and older history overlap
+    'B': {'file': '2015-01-09.parquet', 'start_file': '2015-01-01.parquet'},
+    'C': {'file': '2015-01-12.parquet', 'start_file': '2015-01-12.parquet'},
+}
+
+
+def plan_day_by_day(sn_dict, history_length_recent, history_length_old, data_files):
+    """Return the (serial_number, file) pairs to open, listed one day at a time."""
+    pairs = set()
+    for serial_number, info_dict in sn_dict.items():
+        start_date = datetime.strptime(info_dict['start_file'][:10], '%Y-%m-%d')
+        failure_date = datetime.strptime(info_dict['file'][:10], '%Y-%m-%d')
+        if not history_length_recent or not history_length_old:
+            dates = [
+                start_date + timedelta(days=idx)
+                for idx in range((failure_date - start_date).days + 1)
+            ]
+        else:
+            dates = [failure_date - timedelta(days=idx) for idx in range(history_length_recent)]
+            dates += [start_date + timedelta(days=idx) for idx in range(history_length_old)]
+        pairs.update(
+            (serial_number, date.strftime('%Y-%m-%d') + '.parquet')
+            for date in dates
+            if date.strftime('%Y-%m-%d') + '.parquet' in data_files
+        )
+    return pairs
+
+
+@pytest.mark.parametrize('history_lengths', [(5, 3), (10, 10), (90, 0), (0, 30)])
+def test_plan_opens_the_files_of_each_window(history_lengths):
+    """The planned intervals open the files of the recent, older and full-life windows."""
+    write_daily_files({day: [('A', 0), ('B', 0), ('C', 0)] for day in DAYS})
+    data_files = get_parquet_data_files()
+
+    plan = get_files_to_open(SN_DICT, *history_lengths)
+    pairs = resolve_plan(plan, data_files, load_serial_dictionary())
+
+    assert not pairs.duplicated().any()
+    assert set(pairs.itertuples(index=False, name=None)) == plan_day_by_day(
+        SN_DICT, *history_lengths, data_files
+    )
@@ -0,0 +1,97 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the history queries of bbdata_query.py.
+"""
+
+import sys
+
+import pandas as pd
+import pytest
+from conftest import write_daily_files
+
+import bbdata_query
+from bbdata_query import (
+    get_history_index,
+    get_row_groups_to_read,
+    get_serial_windows,
+    load_history,
+)
+from bbdata_storage import PARQUET_DIR
+
+DAYS = {
+    '2015-01-01': [('A', 0), ('B', 0), ('C', 0)],
+    '2015-01-02': [('A', 0), ('B', 0), ('C', 0)],
+    '2015-01-03': [('A', 0), ('B', 1)],
+    '2015-01-04': [('A', 0), ('D', 0)],
+    '2015-01-05': [('A', 0), ('D', 0)],
+}
+
+
+@pytest.fixture
+def history():
+    """Write the daily files of DAYS."""
+    write_daily_files(DAYS)
+
+
+def read_directly(serial_numbers, start, end, columns):
+    """Return the history of serial numbers read from whole daily files."""
+    history_df = pd.concat(
+        [pd.read_parquet(PARQUET_DIR + f'{day}.parquet') for day in DAYS], ignore_index=True
+    )
+    history_df = history_df[
+        history_df['serial_number'].isin(serial_numbers)
+        & (history_df['date'] >= start)
+        & (history_df['date'] <= end)
+    ]
+    history_df['date'] = pd.to_datetime(history_df['date'])
+    return history_df[columns].sort_values(['serial_number', 'date'], ignore_index=True)
+
+
+@pytest.mark.usefixtures('history')
+@pytest.mark.parametrize('workers', [1, 2])
+def test_load_history_matches_direct_read(workers):
+    """A query returns the rows of a direct read of the daily files."""
+    columns = ['date', 'serial_number', 'failure', 'smart_5_raw']
+
+    history_df = load_history(
+        ['B', 'D', 'A'], '2015-01-02', '2015-01-04', columns[2:], workers=workers, prefetch=0
+    )
+
+    expected = read_directly(['A', 'B', 'D'], '2015-01-02', '2015-01-04', columns)
+    pd.testing.assert_frame_equal(history_df, expected, check_dtype=False)
+    assert history_df['failure'].dtype == 'int64'
+
+
+@pytest.mark.usefixtures('history')
+def test_load_history_without_match():
+    """Without matching rows, the requested columns are returned with their dtypes."""
+    history_df = load_history(['UNKNOWN'], columns=['smart_5_raw'], prefetch=0)
+
+    assert history_df.empty
+    assert list(history_df.columns) == ['date', 'serial_number', 'smart_5_raw']
+    assert history_df['date'].dtype == 'datetime64[ns]'
+    assert history_df['smart_5_raw'].dtype == 'float64'
+
+
+@pytest.mark.usefixtures('history')
+def test_main_without_match(monkeypatch, capsys):
+    """The CLI reports an empty history instead of failing."""
+    monkeypatch.setattr(sys, 'argv', ['bbdata_query.py', 'UNKNOWN', '--workers', '1'])
+
+    bbdata_query.main()
+
+    assert capsys.readouterr().out.rstrip().endswith('0 rows of 0 disks')
+
+
+@pytest.mark.usefixtures('history')
+def test_serial_windows_narrow_files_read():
+    """Only the daily files of the dates each serial number is seen are read."""
+    serial_windows = get_serial_windows(['C', 'D', 'UNKNOWN'], '2015-01-02', prefetch=0)
+
+    assert serial_windows.to_dict('records') == [
+        {'serial_number': 'C', 'start': '2015-01-02', 'end': '2015-01-02'},
+        {'serial_number': 'D', 'start': '2015-01-04', 'end': '2015-01-05'},
+    ]
+    row_groups = get_row_groups_to_read(get_history_index(prefetch=0), serial_windows)
+    assert sorted(row_groups) == ['2015-01-02.parquet', '2015-01-04.parquet', '2015-01-05.parquet']
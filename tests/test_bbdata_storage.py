@@ -0,0 +1,53 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the Arrow cache of bbdata_storage.py.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+from conftest import write_daily_files
+
+import bbdata_storage
+from bbdata_storage import ARROW_CACHE_DIR, ARROW_CACHE_SIZE_VARIABLE, parquet_to_dataframe
+
+COLUMNS = ['serial_number', 'failure']
+
+
+@pytest.fixture
+def arrow_cache(monkeypatch):
+    """Enable the Arrow cache and write a daily file."""
+    monkeypatch.setenv(ARROW_CACHE_SIZE_VARIABLE, str(1024 * 1024))
+    write_daily_files({'2015-01-01': [('A', 0), ('B', 1)]})
+
+
+def read_daily_file():
+    """Return the failures of the daily file, read through the Arrow cache."""
+    return parquet_to_dataframe('2015-01-01.parquet', COLUMNS, [('failure', '==', 1)])
+
+
+@pytest.mark.usefixtures('arrow_cache')
+def test_arrow_cache_hit_matches_parquet_read():
+    """A read served by the cache returns the rows of the parquet file."""
+    expected = read_daily_file()
+    assert len(os.listdir(ARROW_CACHE_DIR)) == 1
+
+    pd.testing.assert_frame_equal(read_daily_file(), expected)
+    assert list(expected['serial_number']) == ['B']
+
+
+@pytest.mark.usefixtures('arrow_cache')
+def test_arrow_cache_entry_evicted_while_read(monkeypatch):
+    """An entry evicted by another worker during a read falls back to the parquet file."""
+    expected = read_daily_file()
+    utime = os.utime
+
+    def evicted(path, *args, **kwargs):
+        if path.startswith(ARROW_CACHE_DIR):
+            raise FileNotFoundError(path)
+        return utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(bbdata_storage.os, 'utime', evicted)
+    pd.testing.assert_frame_equal(read_daily_file(), expected)
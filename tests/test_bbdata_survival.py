@@ -0,0 +1,93 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests of the fleet survival of bbdata_survival.py.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bbdata_survival import (
+    SURVIVAL_COLUMNS,
+    add_age_counts,
+    get_age_counts,
+    get_survival_ages,
+    get_survival_table,
+)
+
+
+def make_lifecycle_index(disks):
+    """Return a lifecycle index from (first_seen, last_seen, failure_dates, power_on_hours)."""
+    return pd.DataFrame(
+        [
+            {
+                'serial_number': f'S{idx}',
+                'first_seen': first_seen,
+                'last_seen': last_seen,
+                'failure_dates': failure_dates,
+                'first_power_on_hours': power_on_hours,
+            }
+            for idx, (first_seen, last_seen, failure_dates, power_on_hours) in enumerate(disks)
+        ]
+    )
+
+
+LIFECYCLE_INDEX = make_lifecycle_index(
+    [
+        # Seen from age 0 to 3, failed at age 3
+        ('2015-01-01', '2015-01-04', ['2015-01-04'], 0.0),
+        # Seen from age 2 (left truncation) to 5, censored
+        ('2015-01-01', '2015-01-04', [], 48.0),
+        # Seen from age 1, failed at age 2, still reported after its failure
+        ('2015-01-02', '2015-01-05', ['2015-01-03'], 24.0),
+        # Implausible power on hours: enters at age 0, censored at age 1
+        ('2015-01-03', '2015-01-04', [], -5.0),
+    ]
+)
+
+
+def test_survival_ages():
+    """Disks enter at their age when first seen and leave at their first failure or last seen."""
+    entry_ages, exit_ages, failed = get_survival_ages(LIFECYCLE_INDEX)
+
+    assert entry_ages.tolist() == [0, 2, 1, 0]
+    assert exit_ages.tolist() == [3, 5, 2, 1]
+    assert failed.tolist() == [True, False, True, False]
+
+
+def test_survival_table():
+    """Risk sets, failures and Kaplan-Meier survival follow the entry and exit ages."""
+    survival_df = get_survival_table(LIFECYCLE_INDEX, bucket_days=2)
+
+    # Disks at risk by day of age: 2, 3, 3, 2, 1, 1
+    assert survival_df['age_start_days'].tolist() == [0, 2, 4]
+    assert survival_df['drive_days'].tolist() == [5, 5, 2]
+    assert survival_df['failures'].tolist() == [0, 2, 0]
+    assert survival_df['disks'].tolist() == [3, 3, 1]
+    assert survival_df['hazard_rate'].tolist() == pytest.approx([0, 0.4, 0])
+    assert survival_df['km_survival'].tolist() == pytest.approx([1, 1 / 3, 1 / 3])
+
+
+def test_age_counts_add_up():
+    """Age counts of disjoint sets of disks add up to those of all disks."""
+    age_counts = add_age_counts(
+        get_age_counts(LIFECYCLE_INDEX.iloc[:1]), get_age_counts(LIFECYCLE_INDEX.iloc[1:])
+    )
+
+    expected = get_survival_table(LIFECYCLE_INDEX)
+    pd.testing.assert_frame_equal(get_survival_table(None, age_counts=age_counts), expected)
+    removed = add_age_counts(age_counts, get_age_counts(LIFECYCLE_INDEX.iloc[:1]), -1)
+    pd.testing.assert_frame_equal(
+        get_survival_table(None, age_counts=removed), get_survival_table(LIFECYCLE_INDEX.iloc[1:])
+    )
+
+
+def test_survival_table_without_disks():
+    """Without disks, the survival table is empty."""
+    survival_df = get_survival_table(LIFECYCLE_INDEX.iloc[:0])
+
+    assert survival_df.empty
+    assert survival_df.dtypes.to_dict() == {
+        column: np.dtype(dtype) for column, dtype in SURVIVAL_COLUMNS.items()
+    }
@@ -0,0 +1,75 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests des agrégats de données SMART de graph.py.
+"""
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import graph
+
+SMART_LIST = ['smart_5_raw', 'smart_187_raw']
+
+
+def historique_disque(graine, nb_jours=6):
+    """Retourne l'historique aléatoire d'un disque, avec des valeurs nulles et manquantes."""
+    generateur = np.random.default_rng(graine)
+    historique = pd.DataFrame(
+        {
+            'trace': np.arange(nb_jours) % 3,
+            **{smart: generateur.integers(0, 4, nb_jours) * 2.5 for smart in SMART_LIST},
+        }
+    )
+    historique.loc[generateur.integers(0, nb_jours), 'smart_187_raw'] = np.nan
+    return historique
+
+
+def test_fusionner_agregats_donne_la_moyenne_et_l_erreur():
+    """La moyenne et l'erreur des agrégats fusionnés sont celles de toutes les valeurs."""
+    disques = [(f'disque_{graine}', historique_disque(graine)) for graine in range(5)]
+
+    agregat = graph.fusionner_agregats(
+        [
+            graph.agreger_disques(disques[:2], SMART_LIST),
+            graph.agreger_disques(disques[2:], SMART_LIST),
+        ]
+    )
+    dico = graph.remplir_dico_moyenne([], SMART_LIST, agregat)
+
+    historique = pd.concat([disque for _, disque in disques], ignore_index=True)
+    for smart in SMART_LIST:
+        for trace, groupe in historique.groupby('trace'):
+            # Les valeurs nulles ou manquantes sont ignorées
+            valeurs = groupe[smart].where(groupe[smart] != 0).to_numpy(dtype=float)
+            moyenne, erreur = dico[smart][trace]
+            assert moyenne == pytest.approx(np.nanmean(valeurs))
+            assert erreur == pytest.approx(
+                np.nanstd(valeurs) / np.sqrt(np.count_nonzero(~np.isnan(valeurs)))
+            )
+
+
+@pytest.mark.parametrize('methode', ['lineaire', 'log', 'quantile'])
+def test_regrouper_valeurs_point_le_plus_proche(methode):
+    """Chaque valeur va au point le plus proche, le plus petit à égale distance."""
+    valeurs = np.concatenate(
+        [np.random.default_rng(0).lognormal(3, 2, 500).round(), np.arange(0, 101, 2.5)]
+    )
+    points = graph.subdiviser(valeurs, 21, methode)
+    # Valeurs exactement à mi-chemin entre deux points
+    valeurs = np.concatenate([valeurs, (points[:-1] + points[1:]) / 2])
+
+    regroupement = graph.regrouper_valeurs(valeurs, 21, methode)
+
+    assert np.all(np.diff(points) > 0)
+    attendu = Counter(min(points, key=lambda x, val=val: abs(x - val)) for val in valeurs)
+    assert regroupement == attendu
+
+
+def test_subdiviser_methode_inconnue():
+    """Une méthode de subdivision inconnue est une erreur."""
+    with pytest.raises(ValueError):
+        graph.subdiviser(np.array([1.0, 2.0]), 2, 'inconnue')
@@ -0,0 +1,67 @@
+"""
+Created on 17 Oct. 2026.
+
+Tests des ajustements de lois de Weibull de graph_weibull.py.
+"""
+
+import csv
+
+import numpy as np
+import pytest
+
+import graph
+from graph_weibull import ajuster_courbe, ajuster_weibull, taux_panne_modele
+
+
+def courbe_weibull(forme, echelle, nb_disques=20000, graine=0):
+    """Retourne une courbe en baignoire {mois: nombre de pannes} tirée d'une loi de Weibull."""
+    durees = echelle * np.random.default_rng(graine).weibull(forme, nb_disques)
+    mois, nombres = np.unique(np.ceil(durees), return_counts=True)
+    return dict(zip(mois.tolist(), nombres.tolist()))
+
+
+def test_ajuster_weibull_retrouve_les_parametres():
+    """Les paramètres d'une loi de Weibull sont retrouvés à partir de ses pannes."""
+    courbe = courbe_weibull(1.7, 60)
+    valeurs = np.array(sorted(courbe), dtype=float)
+    nombres = np.array([courbe[valeur] for valeur in sorted(courbe)], dtype=float)
+
+    ajustement = ajuster_weibull(valeurs, nombres)
+
+    assert ajustement['forme'] == pytest.approx(1.7, abs=0.05)
+    assert ajustement['echelle'] == pytest.approx(60, rel=0.05)
+    assert ajustement['nb_pannes'] == 20000
+
+
+def test_ajuster_weibull_sans_panne():
+    """Sans panne dans la phase, il n'y a pas d'ajustement."""
+    assert ajuster_weibull(np.array([1.0, 2.0]), np.array([0.0, 0.0])) is None
+
+
+def test_ajuster_courbe_degeneree():
+    """Un ajustement qui échoue est None, pas [None]."""
+    # Toutes les pannes au même mois : le maximum est au bord de la grille des formes
+    assert ajuster_courbe({1: 10, 2: 0}) == {'weibull': None, 'phases': None}
+
+
+def test_taux_panne_modele_ignore_les_phases_absentes():
+    """Les phases None ne comptent pas dans le taux de panne du modèle."""
+    phase = {'debut': 0.0, 'fin': np.inf, 'forme': 1.0, 'echelle': 10.0}
+    taux = taux_panne_modele([1, 2, 3], [phase, None])
+
+    np.testing.assert_allclose(taux, 1 - np.exp(-0.1))
+
+
+def test_tracer_courbe_baignoire_sans_ajustement(tmp_path, monkeypatch):
+    """La courbe est tracée et sauvegardée sans modèle quand les ajustements échouent."""
+    monkeypatch.chdir(tmp_path)
+    courbe = {1: 10, 2: 0}
+
+    graph.tracer_courbe_baignoire(
+        [2015], 'mois', 20, courbe, 'test', ajustement=ajuster_courbe(courbe, phases=True)
+    )
+
+    with open('baignoire_test.csv', encoding='utf-8') as fichier:
+        assert next(csv.reader(fichier)) == ['x', 'y']
+    with open('weibull_test.csv', encoding='utf-8') as fichier:
+        assert len(list(csv.reader(fichier))) == 1